@@ -4,6 +4,8 @@ from easydcp.base import (
     Plant
 )
 
+from easydcp.segment_store import SegmentStore
+
 from easydcp.pcd_tools import (
     merge_pcd,
     pcd2dxm,
@@ -12,7 +14,8 @@ from easydcp.pcd_tools import (
 
 from easydcp.io.pcd import (
     read_ply,
-    read_plys
+    read_plys,
+    read_ply_mmap
 )
 
 from easydcp.io.shp import (
@@ -21,7 +24,7 @@ from easydcp.io.shp import (
     read_xyz
 )
 
-__all__ = ['Classifier', 'Plot', 'Plant',
+__all__ = ['Classifier', 'Plot', 'Plant', 'SegmentStore',
            'merge_pcd', 'pcd2dxm', 'pcd2binary',
-           'read_ply', 'read_plys',
+           'read_ply', 'read_plys', 'read_ply_mmap',
            'read_shp', 'read_shps', 'read_xyz']
\ No newline at end of file
@@ -0,0 +1,4 @@
+import sys
+from easydcp.cli import main
+
+sys.exit(main())
@@ -1,26 +1,46 @@
 import os
+import pickle
+import hashlib
+import threading
+import time
 import imageio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 import open3d as o3d
 import pandas as pd
 from sklearn.tree import DecisionTreeClassifier
-from sklearn.svm import OneClassSVM, SVC
 from sklearn.cluster import KMeans
-from skimage.measure import regionprops
 
 from scipy.stats import gaussian_kde
 
-from easydcp.pcd_tools import (pcd2binary,
-                               pcd2voxel,
-                               calculate_xyz_volume,
+from easydcp.segment_store import SegmentStore, as_segment_store
+from easydcp.pcd_tools import (pcd2pixels,
+                               pixels2binary,
+                               pixel_region_props,
+                               voxel_stats,
+                               xyz_bounds,
                                get_convex_hull,
-                               build_cut_boundary)
-from easydcp.geometry.min_bounding_rect import min_bounding_rect
+                               build_cut_boundary,
+                               ensure_normals,
+                               select_pcd,
+                               build_pcd)
+from easydcp.classifier_tools import (FlatTree,
+                                      ColorLUT,
+                                      OneClassModel,
+                                      build_svm,
+                                      stratified_sample,
+                                      label_dtype)
+from easydcp.geometry.min_bounding_rect import min_bounding_rect, min_bounding_rects
+from easydcp.geometry.grid_index import GridIndex
+from easydcp.geometry.polygon_set import points_in_polygon, points_in_polygons
+from easydcp.geometry.tile_denoise import tile_index, radius_outlier, statistical_outlier
+from easydcp.geometry.voxel_dbscan import voxel_dbscan
 from easydcp.io.cprint import printYellow
 from easydcp.io.folder import make_dir
-from easydcp.io.pcd import read_ply, read_plys
+from easydcp.io.pcd import read_ply, read_plys, read_ply_mmap, PlyVertexView
 from easydcp.io.shp import read_shp, read_shps
 from easydcp.plotting.figure import draw_3d_results, draw_plot_seg_results
+from easydcp.stats.kmeans import two_means
 
 
 class Classifier(object):
@@ -30,9 +50,17 @@ class Classifier(object):
         list kind_list
         set  kind_set
         skln clf
+        str  core
+        list features -> the columns of train_data and the input of predict()
     """
 
-    def __init__(self, path_list, kind_list, core='dtc', unit='m'):
+    # the feature definition of train_data, predict() needs the same columns
+    features = ['red', 'green', 'blue', 'z', 'tgi']
+    # version of the saved classifier files and training caches, changed when the features are changed
+    file_version = 1
+
+    def __init__(self, path_list, kind_list, core='dtc', unit='m', cache_dir=None, engine='sklearn', lut_bits=8,
+                 max_train=None, kernel_approx=None, n_components=300):
         """
         :param path_list: the list training png path
             e.g. path_list = ['fore.png', 'back.png']
@@ -57,6 +85,29 @@ class Classifier(object):
         :param core:
             svm: Support Vector Machine Classifier
             dtc: Decision Tree Classifier
+            only one kind in kind_list always uses one-class svm, the points not like the training data
+            are labeled as background -1 (or 0 if the training data is background)
+
+        :param max_train: (svm only) max number of training samples, picked in proportion of each kind,
+            None for 20000 with exact kernel, and 100000 with kernel_approx
+        :param kernel_approx: (svm only) None, 'nystroem' or 'rbf_sampler', approximate the rbf kernel by
+            n_components features and fit a linear svm, fitting and predicting stay linear in point number.
+            see classifier_tools.build_svm()
+
+        :param cache_dir: folder to cache the training array, named by the hash of training file contents,
+            kinds and unit. The png and ply files are not read again if the same training data is used.
+            None to disable the cache.
+
+        :param engine: 'sklearn', 'flat' or 'lut', how predict() runs the fitted model
+            sklearn: the predict() of sklearn model
+            flat: (core='dtc' only) classifier_tools.FlatTree, the tree exported to numpy arrays,
+                  gives the same labels as sklearn
+            lut: (core='dtc' only, and the tree does not split on z) classifier_tools.ColorLUT,
+                 labels of all quantized colors are calculated once, then points are classified
+                 by their colors only. Exactly the same labels for 8-bit colors if lut_bits=8.
+        :param lut_bits: bits of each color channel for engine 'lut', 8 (16M colors) or less (e.g. 6)
+
+        Use Classifier.save() and Classifier.load() to reuse the fitted model without training again.
         """
         # Check whether correct input
         print('[Classifier] Start building classifier')
@@ -73,23 +124,53 @@ class Classifier(object):
         self.train_data = np.empty((0, 5))
         self.train_kind = np.empty(0)
         self.unit = unit
-        self.build_training_array()
+        self.core = core
+        if cache_dir is None:
+            self.build_training_array()
+        else:
+            self.load_training_cache(cache_dir)
         print('[Classifier] Training data prepared')
 
         self.kind_set = set(kind_list)
 
         if len(self.kind_set) == 1:   # only one class
-            self.clf = OneClassSVM()
-            # todo: build_svm1class()
+            self.core = 'svm1class'
+            self.clf = self.fit_svm(max_train, kernel_approx, n_components)
         else:  # multi-classes
             if core == 'dtc':
                 self.clf = DecisionTreeClassifier(max_depth=20)
                 self.clf = self.clf.fit(self.train_data, self.train_kind)
             elif core == 'svm':
-                self.clf = SVC()
-                # todo: build SVC() classifier
+                self.clf = self.fit_svm(max_train, kernel_approx, n_components)
+            else:
+                raise KeyError(f'Only "dtc" and "svm" are acceptable for core parameters, not [{core}]')
+        self.set_engine(engine, lut_bits=lut_bits)
         print('[Classifier] Classifying model built')
 
+    def fit_svm(self, max_train=None, kernel_approx=None, n_components=300):
+        if max_train is None:
+            max_train = 20000 if kernel_approx is None else 100000
+        one_class = len(self.kind_set) == 1
+        picked = stratified_sample(self.train_kind, max_train)
+        model = build_svm(one_class=one_class, kernel_approx=kernel_approx, n_components=n_components)
+        if one_class:
+            kind = int(self.train_kind[0])
+            outlier_kind = -1 if kind != -1 else 0
+            model = OneClassModel(model, kind, outlier_kind)
+            self.kind_set = {kind, outlier_kind}
+
+        tic = time.perf_counter()
+        if one_class:
+            model.fit(self.train_data[picked])
+        else:
+            model.fit(self.train_data[picked], self.train_kind[picked])
+        fit_time = time.perf_counter() - tic
+        print(f'[Classifier] {"One-class svm" if one_class else "svm"} '
+              f'({"exact rbf kernel" if kernel_approx is None else kernel_approx}) fitted on '
+              f'{len(picked)} of {len(self.train_kind)} training samples in {round(fit_time, 2)} s')
+
+        return model
+
     @staticmethod
     def read_png(file_path):
         img_ndarray = imageio.imread(file_path)
@@ -106,6 +187,8 @@ class Classifier(object):
         return tgi_np.reshape(tgi_np.shape[0], 1)
 
     def build_training_array(self):
+        img_np_list = []
+        kind_np_list = []
         for img_path, kind in zip(self.path_list, self.kind_list):
             img_np = None
             if isinstance(img_path, o3d.geometry.PointCloud):
@@ -120,7 +203,8 @@ class Classifier(object):
                     img_np_tgi = self.get_tgi(img_np_rgb)
                     img_np = np.hstack([img_np_rgb, img_np_z, img_np_tgi])
                 elif '.ply' in img_path:
-                    pcd = read_ply(img_path, unit=self.unit)
+                    # normals are not training features
+                    pcd = read_ply(img_path, unit=self.unit, normals=False)
                     img_np_rgb = np.asarray(pcd.colors)
                     img_np_z = np.asarray(pcd.points)[:, 2].reshape(img_np_rgb.shape[0], 1)
                     img_np_tgi = self.get_tgi(img_np_rgb)
@@ -128,12 +212,147 @@ class Classifier(object):
             else:
                 raise TypeError(f"{img_path} is not supported, please only using png and ply files")
 
-            kind_np = np.array([kind] * img_np.shape[0])
-            self.train_data = np.vstack([self.train_data, img_np])
-            self.train_kind = np.hstack([self.train_kind, kind_np])
+            img_np_list.append(img_np)
+            kind_np_list.append(np.full(img_np.shape[0], kind, dtype=np.float64))
+
+        # concatenate once instead of growing the array in the loop
+        self.train_data = np.vstack([self.train_data] + img_np_list)
+        self.train_kind = np.hstack([self.train_kind] + kind_np_list)
+
+    def training_hash(self):
+        """
+        :return: sha1 hex string of training file contents, kinds, unit and feature definition
+        """
+        sha = hashlib.sha1()
+        sha.update(repr((self.file_version, self.features, self.unit, list(self.kind_list))).encode())
+        for img_path in self.path_list:
+            if isinstance(img_path, o3d.geometry.PointCloud):
+                sha.update(np.ascontiguousarray(np.asarray(img_path.points)).tobytes())
+                sha.update(np.ascontiguousarray(np.asarray(img_path.colors)).tobytes())
+            elif isinstance(img_path, str):
+                # the file name is also hashed, '.png' and '.ply' are read differently
+                sha.update(os.path.basename(img_path).encode())
+                with open(img_path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        sha.update(block)
+            else:
+                raise TypeError(f"{img_path} is not supported, please only using png and ply files")
+        return sha.hexdigest()
+
+    def load_training_cache(self, cache_dir):
+        cache_path = os.path.join(cache_dir, f'train-{self.training_hash()}.npz')
+        if os.path.isfile(cache_path):
+            with np.load(cache_path) as cache:
+                self.train_data = cache['train_data']
+                self.train_kind = cache['train_kind']
+            print(f'[Classifier] Training data loaded from cache "{cache_path}"')
+        else:
+            self.build_training_array()
+            make_dir(cache_dir)
+            np.savez(cache_path, train_data=self.train_data, train_kind=self.train_kind)
+            print(f'[Classifier] Training data cached to "{cache_path}"')
+
+    def save(self, file_path):
+        """
+        save the fitted model, kinds, unit and feature definition (the training array is not saved)
+        :param file_path: e.g. 'model.pkl'
+        """
+        model = {'file_version': self.file_version,
+                 'features': self.features,
+                 'clf': self.clf,
+                 'core': self.core,
+                 'engine': self.engine,
+                 'color_lut': self.color_lut,
+                 'unit': self.unit,
+                 'kind_set': self.kind_set,
+                 'kind_list': list(self.kind_list),
+                 'path_list': [p if isinstance(p, str) else repr(p) for p in self.path_list]}
+        with open(file_path, 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f'[Classifier] Classifying model saved to "{file_path}"')
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        load the model saved by Classifier.save(), without reading the training data again
+        :param file_path: e.g. 'model.pkl'
+        :return: Classifier
+        """
+        with open(file_path, 'rb') as f:
+            model = pickle.load(f)
+        if not isinstance(model, dict) or 'clf' not in model:
+            raise TypeError(f'[{file_path}] is not a classifier file saved by Classifier.save()')
+        if model['file_version'] != cls.file_version or model['features'] != cls.features:
+            raise ValueError(f'[{file_path}] is saved with features {model["features"]} '
+                             f'(version {model["file_version"]}), not compatible with current features '
+                             f'{cls.features} (version {cls.file_version}), please train it again')
+
+        clf = cls.__new__(cls)
+        clf.path_list = model['path_list']
+        clf.kind_list = model['kind_list']
+        clf.kind_set = model['kind_set']
+        clf.unit = model['unit']
+        clf.core = model['core']
+        clf.clf = model['clf']
+        # the training array is not saved
+        clf.train_data = None
+        clf.train_kind = None
+        clf.set_engine(model['engine'], color_lut=model['color_lut'])
+        print(f'[Classifier] Classifying model loaded from "{file_path}"')
+        return clf
+
+    def get_features(self, rgb, z, out=None):
+        """
+        :param rgb: np.array nx3 of float colors in [0, 1], or integer colors (8 or 16 bit)
+        :param z: np.array (n,)
+        :param out: np.array nx5 to write the features in (e.g. a reused float32 buffer),
+            None to create a new float64 array
+        :return: np.array nx5 of the columns in Classifier.features
+        """
+        if np.issubdtype(rgb.dtype, np.integer):
+            rgb = np.divide(rgb, 255 if rgb.dtype.itemsize == 1 else np.iinfo(rgb.dtype).max)
+        if out is None:
+            out = np.empty((len(rgb), 5))
+        out[:, 0:3] = rgb
+        out[:, 3] = z
+        out[:, 4] = self.get_tgi(rgb)[:, 0]
+        return out
+
+    def set_engine(self, engine, lut_bits=8, color_lut=None):
+        """
+        :param engine: 'sklearn', 'flat' or 'lut', see __init__()
+        :param lut_bits: bits of each color channel for engine 'lut'
+        :param color_lut: prebuilt ColorLUT for engine 'lut' (e.g. from the saved model), None to build it
+        """
+        if engine not in ['sklearn', 'flat', 'lut']:
+            raise KeyError(f'Only "sklearn", "flat" and "lut" are acceptable for engine parameters, not [{engine}]')
+        if engine != 'sklearn' and not isinstance(self.clf, DecisionTreeClassifier):
+            raise TypeError(f'Engine "{engine}" only supports the decision tree (core="dtc"), '
+                            f'not {type(self.clf).__name__}')
+        self.engine = engine
+        self.flat_tree = None
+        self.color_lut = None
+        if engine == 'flat':
+            self.flat_tree = FlatTree(self.clf)
+        elif engine == 'lut':
+            if self.features.index('z') in FlatTree(self.clf).split_features():
+                raise ValueError('The decision tree splits on z, labels depend on more than colors, '
+                                 'please use engine "sklearn" or "flat" instead')
+            if color_lut is None:
+                color_lut = ColorLUT.from_classifier(self, bits=lut_bits)
+                print(f'[Classifier] Color lookup table of {len(color_lut.labels)} colors built')
+            self.color_lut = color_lut
 
     def predict(self, data):
-        return self.clf.predict(data)
+        if self.color_lut is not None:
+            return self.color_lut.lookup(data[:, 0:3])
+        if self.flat_tree is not None:
+            return self.flat_tree.predict(data)
+        if self.core == 'dtc' or len(data) == 0:
+            return self.clf.predict(data)
+        # svm pipelines expand each row to many kernel features, predict in small blocks to bound the memory
+        block = 65536
+        return np.concatenate([self.clf.predict(data[start:start + block]) for start in range(0, len(data), block)])
 
 
 class Plot(object):
@@ -163,9 +382,9 @@ class Plot(object):
               '1': o3d.geometry.pointclouds, # (optional) foreground 2 denoised
               ...etc.}
 
-        pcd_segmented -> similar with pcd_dict
-            {'0': [o3d.geometry.pointclouds, o3d.geometry.pointclouds, ...],  # background -1 not included
-             '1': [o3d.geometry.pointclouds, o3d.geometry.pointclouds, ...].  # (optional)
+        pcd_segmented -> similar with pcd_dict, each kind is a SegmentStore, which can be used as a list
+            {'0': SegmentStore[o3d.geometry.pointclouds, o3d.geometry.pointclouds, ...],  # background -1 not included
+             '1': SegmentStore[o3d.geometry.pointclouds, o3d.geometry.pointclouds, ...].  # (optional)
              ... etc. }
 
         pcd_segmented_name
@@ -199,13 +418,26 @@ class Plot(object):
                 self.pcd_segmented
     """
 
-    def __init__(self, ply_path, clf, unit='m', output_path='.', write_ply=False, down_sample=True):
+    def __init__(self, ply_path, clf, unit='m', output_path='.', write_ply=False, down_sample=True, mmap=False,
+                 workers=1):
+        """
+        :param mmap: memory-map the binary ply file instead of loading into RAM (for very large plots),
+            self.pcd will be io.pcd.PlyVertexView, and only the classified points are loaded as
+            o3d.geometry.PointCloud. The down_sample is not applied in this mode. self.pcd_xyz and self.pcd_rgb
+            are not available, self.pcd_xyz_raw and self.pcd_rgb_raw are the views in the unit and color type of file
+        :param workers: number of threads to classify the points, see classifier_apply()
+        """
         self.ply_path = ply_path
         self.write_ply = write_ply
+        self.mmap = mmap
+        self.voxel_cache = {}
 
         # file I/O
         if os.path.isfile(ply_path):
-            self.pcd = read_ply(ply_path, unit=unit)
+            if mmap:
+                self.pcd = read_ply_mmap(ply_path, unit=unit)
+            else:
+                self.pcd = read_ply(ply_path, unit=unit)
             self.folder, tail = os.path.split(os.path.abspath(self.ply_path))
             self.ply_name = tail[:-4]
         elif os.path.isdir(ply_path):
@@ -217,6 +449,10 @@ class Plot(object):
                     ply_list.append(item_full_path)
             if len(ply_list) == 0:
                 raise EOFError(f'[{ply_path}] has no ply file')
+            if mmap:
+                printYellow(f'[Plot][__init__] Memory-mapping only supports one ply file, '
+                            f'loading {len(ply_list)} ply files of folder "{ply_path}" into RAM')
+                self.mmap = False
             self.pcd = read_plys(ply_list, unit=unit)
             self.folder = os.path.abspath(ply_path)
             if ply_path[-1] in ['/', '\\']:
@@ -229,7 +465,9 @@ class Plot(object):
         print(f'[Plot][__init__] Ply file "{self.ply_path}" loaded')
 
         # down sample check
-        if down_sample:
+        if down_sample and self.mmap:
+            print(f'[Plot][__init__] Mode "mmap" == True, down sample ignored')
+        elif down_sample:
             self.pcd = self.down_sample(self.pcd, part=100)
 
         if self.write_ply:
@@ -242,29 +480,100 @@ class Plot(object):
             self.out_folder = output_path
             print(f'[Plot][__init__] Mode "write_ply" == False, output folder creating ignored')
 
-        self.pcd_xyz = np.asarray(self.pcd.points)
-        self.pcd_rgb = np.asarray(self.pcd.colors)
+        if self.mmap:
+            # raw views in the unit and color type of file, never copied as a whole,
+            # self.pcd.xyz() and self.pcd.colors() give the chunks in meters and float [0, 1]
+            self.pcd_xyz_raw = self.pcd.xyz_raw
+            self.pcd_rgb_raw = self.pcd.rgb
+            self._pcd_xyz, self._pcd_rgb = None, None
+        else:
+            self.pcd_xyz_raw, self.pcd_rgb_raw = None, None
+            self._pcd_xyz = np.asarray(self.pcd.points)
+            self._pcd_rgb = np.asarray(self.pcd.colors)
 
-        self.pcd_classified = self.classifier_apply(clf)
+        self.pcd_classified = self.classifier_apply(clf, workers=workers)
 
         self.segmented = False
         self.pcd_segmented = {}
         self.pcd_segmented_name = {}
         self.cov_warning = {}
 
-    def classifier_apply(self, clf):
+    @property
+    def pcd_xyz(self):
+        """
+        np.array nx3 of all the points in meters, not available in "mmap" mode
+        """
+        if self.mmap:
+            raise AttributeError('[Plot][pcd_xyz] The points are not loaded in "mmap" mode, please read them '
+                                 'chunk by chunk by self.pcd.xyz(indices) in meters, or self.pcd_xyz_raw in file unit')
+        return self._pcd_xyz
+
+    @property
+    def pcd_rgb(self):
+        """
+        np.array nx3 of all the colors in float [0, 1], not available in "mmap" mode
+        """
+        if self.mmap:
+            raise AttributeError('[Plot][pcd_rgb] The colors are not loaded in "mmap" mode, please read them '
+                                 'chunk by chunk by self.pcd.colors(indices) in float [0, 1], '
+                                 'or self.pcd_rgb_raw in file type')
+        return self._pcd_rgb
+
+    def classifier_apply(self, clf, chunk_size=1000000, workers=1):
+        """
+        classify the points block by block, only one block of features is in memory for each thread
+        :param clf: the Classifier class
+        :param chunk_size: number of points in each block, the features of a block are written into
+            a reused float32 buffer (sklearn trees predict in float32 as well)
+        :param workers: number of threads to classify the blocks concurrently, None for the cpu number
+        :return: pcd_classified dict
+        """
         print('[Plot][Classifier_apply] Start Classifying')
-        pcd_z = self.pcd_xyz[:, 2].reshape(self.pcd_xyz.shape[0],1)
-        pcd_tgi = clf.get_tgi(self.pcd_rgb)
-        input_np = np.hstack([self.pcd_rgb, pcd_z, pcd_tgi])
-        pred_result = clf.predict(input_np)
+        if workers is None:
+            workers = os.cpu_count()
+        point_num = len(self.pcd_xyz_raw) if self.mmap else len(self.pcd_xyz)
+        pred_result = np.empty(point_num, dtype=label_dtype(clf.kind_set))
+        buffers = threading.local()
+
+        def classify_block(start):
+            buffer = getattr(buffers, 'features', None)
+            if buffer is None:
+                buffer = buffers.features = np.empty((min(chunk_size, point_num), 5), dtype=np.float32)
+            block = slice(start, min(start + chunk_size, point_num))
+            block_rgb = self.pcd.rgb[block] if self.mmap else self.pcd_rgb[block]
+            if clf.color_lut is not None:
+                # labels only depend on colors, z is not needed
+                pred_result[block] = clf.color_lut.lookup(block_rgb)
+                return
+            if self.mmap:
+                # the memory-mapped points are only read block by block
+                block_z = self.pcd.xyz(block)[:, 2]
+            else:
+                block_z = self.pcd_xyz[block, 2]
+            features = clf.get_features(block_rgb, block_z, out=buffer[0:block.stop - block.start])
+            pred_result[block] = clf.predict(features)
+
+        tic = time.perf_counter()
+        starts = range(0, point_num, chunk_size)
+        if workers <= 1 or len(starts) <= 1:
+            for start in starts:
+                classify_block(start)
+        else:
+            # sklearn predicts without GIL, threads share the points and the result array
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(classify_block, starts))
+        predict_time = time.perf_counter() - tic
+        print(f'[Plot][Classifier_apply] {point_num} points classified in {round(predict_time, 2)} s '
+              f'({round(point_num / max(predict_time, 1e-9))} points/s)')
 
         pcd_classified = {}
 
         for k in clf.kind_set:
             print(f'[Plot][Classifier_apply] |-- classify class {k}')
-            indices = np.where(pred_result == k)[0].tolist()
-            pcd_classified[k] = self.pcd.select_by_index(indices=indices)
+            if self.mmap:
+                pcd_classified[k] = self.pcd.select_by_index(pred_result == k)
+            else:
+                pcd_classified[k] = select_pcd(self.pcd, pred_result == k)
             # save ply
             if self.write_ply:
                 o3d.io.write_point_cloud(os.path.join(self.out_folder, f'class[{k}].ply'),
@@ -275,29 +584,37 @@ class Plot(object):
 
         return pcd_classified
 
-    def remove_noise(self, divide=100):
+    def remove_noise(self, divide=100, method='open3d', workers=1, tile_size=None, return_id=False):
+        """
+        :param method: 'open3d' or 'tile'
+            open3d: remove_statistical_outlier() and remove_radius_outlier() of o3d.geometry.PointCloud
+            tile: geometry.tile_denoise, the same filters on overlapping xy tiles (halo = search radius)
+                  in parallel, all the classes share one tile index, for large plots
+        :param workers: number of threads for method 'tile', None for the cpu number
+        :param tile_size: side length of tiles for method 'tile', default is about 200000 points per tile
+        :param return_id: if True, also return the kept point indices of each class (in self.pcd_classified[k])
+        :return: pcd_cleaned, or (pcd_cleaned, pcd_cleaned_id) if return_id
+        """
         # currently not recommend to use for sparse plant pcd, has removed from default __init__ steps.
         # # suitable for sfm -> single plants, which has large point numbers, delete some of them doesn't
         #            effect too much;
         # not suitable for plot level, each plant only have few points, may loss too much information
-        pcd_voxel, voxel_params = pcd2voxel(self.pcd, part=divide)
+        voxel_params = self.get_voxel_params(part=divide)
         voxel_size, voxel_density = voxel_params['voxel_size'], voxel_params['voxel_density']
 
+        if method == 'open3d':
+            kept_id = self._remove_noise_open3d(voxel_size, voxel_density)
+        elif method == 'tile':
+            kept_id = self._remove_noise_tile(voxel_size, voxel_density, workers, tile_size)
+        else:
+            raise KeyError(f'Only "open3d" and "tile" are acceptable for method parameters, not [{method}]')
+
         pcd_cleaned = {}
         pcd_cleaned_id = {}
         print('[Plot][remove_noise] Remove noises')
         for k in self.pcd_classified.keys():
-            if k == -1:   # for background, need to apply statistical outlier removal
-                cleaned, indices = self.pcd_classified[-1].remove_statistical_outlier(
-                    nb_neighbors=round(voxel_density),
-                    std_ratio=0.01)
-                pcd_cleaned[-1], pcd_cleaned_id[-1] = cleaned.remove_radius_outlier(
-                    nb_points=round(voxel_density*2),
-                    radius=voxel_size)
-            else:
-                pcd_cleaned[k], pcd_cleaned_id[k] = self.pcd_classified[k].remove_radius_outlier(
-                    nb_points=round(voxel_density),
-                    radius=voxel_size)
+            pcd_cleaned_id[k] = kept_id[k]
+            pcd_cleaned[k] = select_pcd(self.pcd_classified[k], kept_id[k])
             # save ply
             if self.write_ply:
                 o3d.io.write_point_cloud(os.path.join(self.out_folder, f'class[{k}]-rm_noise.ply'),
@@ -306,32 +623,127 @@ class Plot(object):
             else:
                 print(f'[Plot][remove_noise] Mode "write_ply" == False, ply file not saved.')
             # todo: add kde of ground points, and remove noises very close to ground points
-            print(f'[Plot][remove_noise] Kind {k} noise removed')
+            print(f'[Plot][remove_noise] Kind {k} noise removed, {len(kept_id[k])} of '
+                  f'{len(self.pcd_classified[k].points)} points kept')
 
         self.pcd_classified = pcd_cleaned
-        return pcd_cleaned   # , pcd_cleaned_id
+        if return_id:
+            return pcd_cleaned, pcd_cleaned_id
+        else:
+            return pcd_cleaned
+
+    def _remove_noise_open3d(self, voxel_size, voxel_density):
+        kept_id = {}
+        for k in self.pcd_classified.keys():
+            if k == -1:   # for background, need to apply statistical outlier removal
+                cleaned, indices = self.pcd_classified[-1].remove_statistical_outlier(
+                    nb_neighbors=round(voxel_density),
+                    std_ratio=0.01)
+                _, indices_radius = cleaned.remove_radius_outlier(
+                    nb_points=round(voxel_density*2),
+                    radius=voxel_size)
+                kept_id[k] = np.asarray(indices, dtype=np.int64)[np.asarray(indices_radius, dtype=np.int64)]
+            else:
+                _, indices = self.pcd_classified[k].remove_radius_outlier(
+                    nb_points=round(voxel_density),
+                    radius=voxel_size)
+                kept_id[k] = np.asarray(indices, dtype=np.int64)
+        return kept_id
+
+    def _remove_noise_tile(self, voxel_size, voxel_density, workers=1, tile_size=None):
+        if workers is None:
+            workers = os.cpu_count()
+        kinds = list(self.pcd_classified.keys())
+        xyz_list = [np.asarray(self.pcd_classified[k].points) for k in kinds]
+        offsets = np.cumsum([0] + [len(xyz) for xyz in xyz_list])
+        xyz = np.vstack(xyz_list)
+        kind_id = np.repeat(np.arange(len(kinds)), np.diff(offsets))
+
+        tic = time.time()
+        grid = tile_index(xyz, voxel_size, tile_size=tile_size)
+        print(f'[Plot][remove_noise] {grid.shape[0]}x{grid.shape[1]} tiles of {round(grid.cell_size, 3)} '
+              f'by {workers} workers')
+        kept_id = {}
+        for i, k in enumerate(kinds):
+            keep = kind_id == i
+            if k == -1:   # for background, need to apply statistical outlier removal
+                keep = statistical_outlier(xyz, round(voxel_density), std_ratio=0.01, halo=voxel_size,
+                                           grid=grid, keep=keep, workers=workers)
+                keep = radius_outlier(xyz, round(voxel_density*2), voxel_size, grid=grid, keep=keep,
+                                      workers=workers)
+            else:
+                keep = radius_outlier(xyz, round(voxel_density), voxel_size, grid=grid, keep=keep,
+                                      workers=workers)
+            kept_id[k] = np.flatnonzero(keep[offsets[i]:offsets[i + 1]])
+        print(f'[Plot][remove_noise] tiles filtered in {round(time.time() - tic, 2)} s')
+        return kept_id
 
     def auto_dbscan_args(self, eps_grids=10, divide=100):
         # split the shortest axis into 100 parts
         # the dbscan eps is the length of 10 grids
         # the min_points is the mean points of each grids (voxels)
-        pcd_voxel, voxel_params = pcd2voxel(self.pcd, part=divide)
+        voxel_params = self.get_voxel_params(part=divide)
         voxel_size, voxel_density = voxel_params['voxel_size'], voxel_params['voxel_density']
         eps = voxel_size * eps_grids
         min_points = round(voxel_density)
         print(f'[Plot][DBSCAN_Args] Recommend use eps={eps}, min_points={min_points} based on point density.')
         return eps, min_points
 
+    def get_voxel_params(self, pcd=None, part=100, voxel_size=None):
+        """
+        voxel statistics (pcd_tools.voxel_stats) cached by point cloud identity, point number, part and voxel_size,
+        the same cloud is counted only once by down_sample(), remove_noise() and auto_dbscan_args().
+        Only the clouds still used (self.pcd and the given pcd) are kept in the cache, the replaced ones are freed.
+        The cache can not detect points edited in place (same object and point number),
+        call clear_voxel_cache() after that.
+        :param pcd: o3d.geometry.PointCloud or io.pcd.PlyVertexView, default is self.pcd
+        :return: dict {'voxel_size', 'voxel_density', 'voxel_number'}
+        """
+        if pcd is None:
+            pcd = self.pcd
+        # the memory-mapped points are read chunk by chunk
+        pcd_xyz = pcd if isinstance(pcd, PlyVertexView) else np.asarray(pcd.points)
+        key = (id(pcd), len(pcd_xyz), part, voxel_size)
+        if key not in self.voxel_cache:
+            # drop the clouds no longer used, e.g. self.pcd reassigned
+            current = getattr(self, 'pcd', None)
+            for k in [k for k, (cached, _) in self.voxel_cache.items() if cached is not pcd and cached is not current]:
+                del self.voxel_cache[k]
+            # the pcd is kept with its params, so that its id can not be reused by another object
+            self.voxel_cache[key] = (pcd, voxel_stats(pcd_xyz, part=part, voxel_size=voxel_size))
+        return self.voxel_cache[key][1]
+
+    def clear_voxel_cache(self, pcd=None):
+        """
+        drop the cached voxel statistics of pcd, or of all the clouds if None
+        :param pcd: o3d.geometry.PointCloud or io.pcd.PlyVertexView
+        """
+        if pcd is None:
+            self.voxel_cache.clear()
+        else:
+            for k in [k for k, (cached, _) in self.voxel_cache.items() if cached is pcd]:
+                del self.voxel_cache[k]
+
+    def xyz_bounds(self):
+        """
+        :return: xyz_min, xyz_max of self.pcd in meters, the memory-mapped points are read chunk by chunk
+        """
+        if self.mmap:
+            return xyz_bounds(self.pcd)
+        return self.pcd_xyz.min(axis=0), self.pcd_xyz.max(axis=0)
+
     def down_sample(self, pcd, part):
         # check whether need down-sampling
-        _, voxel_params = pcd2voxel(pcd, part=part)
+        voxel_params = self.get_voxel_params(pcd, part=part)
         voxel_size, voxel_density = voxel_params['voxel_size'], voxel_params['voxel_density']
         min_points = round(voxel_density)
         if min_points > 20:
             print(f'[Plot][Down_Sample] Point cloud {self.ply_name} has average point counts [{min_points}] '
                   f'in the cube whose size={round(voxel_size*1000, 2)}mm.')
             pcd_down = pcd.voxel_down_sample(voxel_size=voxel_size/5)   # 2^3=8, 3^3=27, 2.7^3=19.68
-            _, voxel_params_down = pcd2voxel(pcd_down, voxel_size=voxel_size)
+            # pcd is replaced by pcd_down, the cache should not keep the full resolution cloud alive
+            self.clear_voxel_cache(pcd)
+            voxel_params_down = self.get_voxel_params(pcd_down, voxel_size=voxel_size)
             voxel_size_down, voxel_density_down = voxel_params_down['voxel_size'], voxel_params_down['voxel_density']
             print(f'                        |--- Down sample to average counts [{round(voxel_density_down)}] ')
             return pcd_down
@@ -366,7 +778,7 @@ class Plot(object):
             
             pcd_xyz = np.asarray(seg_in[k].points)
             pcd_rgb = np.asarray(seg_in[k].colors)
-            pcd_nml = np.asarray(seg_in[k].normals)
+            pcd_nml = np.asarray(ensure_normals(seg_in[k]).normals)
             # pcd_xyz and pcd_rgb are nx3 ndarray
 
             # clip_x_min = 0.2
@@ -399,7 +811,7 @@ class Plot(object):
                 pcd_seg_list.append(clip_pcd)
                 print (i, clip_pcd)
                 
-            seg_out[k] = pcd_seg_list
+            seg_out[k] = SegmentStore.from_pcd_list(pcd_seg_list)
         
         #end for loop
         
@@ -407,53 +819,88 @@ class Plot(object):
         self.pcd_segmented = seg_out
         return seg_out 
 
-    def dbscan_segment(self, eps, min_points, pcd_dict=None):
+    def dbscan_segment(self, eps, min_points, pcd_dict=None, drop_noise=False, return_counts=False,
+                       method='open3d', workers=1):
+        """
+        :param method: 'open3d' or 'grid'
+            open3d: o3d.geometry.PointCloud.cluster_dbscan()
+            grid: geometry.voxel_dbscan.voxel_dbscan(), an approximation for large clouds, the eps-sized
+                  voxels with at least min_points points are connected with their 26 neighbors,
+                  much faster and less memory, but the clusters may differ a little near the borders
+        :param workers: number of threads for method 'grid'
+        :param drop_noise: drop the noise points (dbscan label -1), otherwise they are the first segment
+        :param return_counts: also return the point number of each segment
+        :return: seg_out, or (seg_out, {kind: np.array of point numbers}) if return_counts
+        """
         if pcd_dict is None:
             seg_in = self.pcd_classified
         else:
             seg_in = pcd_dict
 
         seg_out = {}
+        seg_count = {}
         for k in seg_in.keys():
             if k == -1:
                 continue   # skip the background
 
             print(f'[Plot][DBSCAN_Segment] Start segmenting class {k} Please wait...')
-            vect = seg_in[k].cluster_dbscan(eps=eps, min_points=min_points, print_progress=True)
-            vect_np = np.asarray(vect)
-            seg_id = np.unique(vect_np)
+            if method == 'open3d':
+                vect = seg_in[k].cluster_dbscan(eps=eps, min_points=min_points, print_progress=True)
+                vect_np = np.asarray(vect)
+            elif method == 'grid':
+                vect_np = voxel_dbscan(np.asarray(seg_in[k].points), eps, min_points, workers=workers)
+            else:
+                raise KeyError(f'Only "open3d" and "grid" are acceptable for method parameters, not [{method}]')
+
+            # group the points by label with one stable sort, the point order inside each segment is kept
+            order = np.argsort(vect_np, kind='stable')
+            seg_id, pcd_seg_num = np.unique(vect_np, return_counts=True)
+            if drop_noise and len(seg_id) > 0 and seg_id[0] == -1:
+                order = order[pcd_seg_num[0]:]
+                seg_id, pcd_seg_num = seg_id[1:], pcd_seg_num[1:]
 
             print(f'\n[Plot][DBSCAN_Segment] Class {k} Segmented to {len(seg_id)} parts')
-            pcd_seg_list = []
-            pcd_seg_num = []
-            for i, seg in enumerate(seg_id):
-                indices = np.where(vect_np == seg)[0].tolist()
-                pcd_seg = seg_in[k].select_by_index(indices)
-                pcd_seg_list.append(pcd_seg)
-                pcd_seg_num.append(len(indices))
-                print (i, pcd_seg)
-            seg_out[k] = pcd_seg_list
+            seg_xyz = np.asarray(seg_in[k].points)[order]
+            seg_rgb = np.asarray(seg_in[k].colors)[order] if seg_in[k].has_colors() else None
+            seg_nml = np.asarray(seg_in[k].normals)[order] if seg_in[k].has_normals() else None
+            # the segments are row ranges of the sorted arrays, the point clouds are built when used
+            seg_out[k] = SegmentStore(seg_xyz, seg_rgb, seg_nml, sizes=pcd_seg_num)
+            # the summary is calculated once here, and read by the following split and sort steps
+            pcd_seg_num = seg_out[k].summary()['count']
+            for i in range(len(seg_id)):
+                if i < 5 or i >= len(seg_id) - 5:
+                    print (i, f'PointCloud with {pcd_seg_num[i]} points.')
+            seg_count[k] = pcd_seg_num
 
             # coefficient of variance check to judge if need KMeans remove noise
             # [10000,13000,15000] -> 0.16222142113076257
             # [10000,13000,15000,12, 100]) -> 0.8369722427881723
-            x = np.asarray(pcd_seg_num)
+            x = pcd_seg_num
             cov = x.std() / x.mean()
             if cov >= 0.3:
                 printYellow(f'[Warning] The coefficient of variance of '
                             f'point numbers too large ({round(cov,3)}), may contain noises!')
                 if len(pcd_seg_num) < 20:
-                    printYellow(f'{pcd_seg_num}')
+                    printYellow(f'{pcd_seg_num.tolist()}')
                 else:
-                    printYellow(f"[{str(pcd_seg_num[:10])[1:-1]}, ..., {str(pcd_seg_num[-10:])[1:-1]}]")
+                    printYellow(f"[{str(pcd_seg_num[:10].tolist())[1:-1]}, ..., {str(pcd_seg_num[-10:].tolist())[1:-1]}]")
                 printYellow(f'Please consider use kmeans_split() to remove outlier noises.')
                 self.cov_warning = True
 
         self.segmented = True
         self.pcd_segmented = seg_out
+        if return_counts:
+            return seg_out, seg_count
         return seg_out
 
-    def kmeans_split(self, pcd_dict=None):
+    def kmeans_split(self, pcd_dict=None, method='two_means'):
+        """
+        cluster the segments into plants and noises by (sqrt of point number, bounding box volume),
+        the cluster with more points is kept
+        :param method: 'two_means' or 'sklearn'
+            two_means: stats.kmeans.two_means(), deterministic, the same segments always give the same result
+            sklearn: sklearn.cluster.KMeans(n_clusters=2)
+        """
         if pcd_dict is None:
             split_in = self.pcd_segmented
             if not self.segmented:
@@ -461,30 +908,36 @@ class Plot(object):
         else:
             split_in = pcd_dict
 
+        if method not in ['two_means', 'sklearn']:
+            raise KeyError(f'Only "two_means" and "sklearn" are acceptable for method parameters, not [{method}]')
+
         split_out = {}
         for k in split_in.keys():
             if k == -1:
                 continue
-            characters = np.empty((0, 2))
-            for pcd_seg in split_in[k]:
-                char = np.asarray([len(pcd_seg.points) ** 0.5, calculate_xyz_volume(pcd_seg)])
-                characters = np.vstack([characters, char])
+            # sizes and volumes from the segment summary
+            seg_store = as_segment_store(split_in[k])
+            characters = np.stack([seg_store.summary()['count'] ** 0.5, seg_store.bbox_volumes()], axis=1)
             print(f'[Plot][KMeans] class {k} Cluster Data Prepared')
 
             # cluster by (points number, and volumn) to remove noise segmenation
-            km = KMeans(n_clusters=2)
-            km.fit(characters)
+            if method == 'two_means':
+                labels = two_means(characters)
+            else:
+                km = KMeans(n_clusters=2)
+                km.fit(characters)
+                labels = km.labels_
 
-            class0 = characters[km.labels_ == 0, :]
-            class1 = characters[km.labels_ == 1, :]
+            class0 = characters[labels == 0, :]
+            class1 = characters[labels == 1, :]
 
             # find the class label with largest point clouds (plants)
-            if class0.mean(axis=0)[0] > class1.mean(axis=0)[0]:
-                plant_id = np.where(km.labels_ == 0)[0].tolist()
+            if len(class1) == 0 or (len(class0) > 0 and class0.mean(axis=0)[0] > class1.mean(axis=0)[0]):
+                plant_id = np.where(labels == 0)[0]
             else:
-                plant_id = np.where(km.labels_ == 1)[0].tolist()
+                plant_id = np.where(labels == 1)[0]
 
-            split_out[k] = [split_in[k][pid] for pid in plant_id]
+            split_out[k] = seg_store[plant_id]
 
         self.pcd_segmented = split_out
         return split_out
@@ -502,20 +955,26 @@ class Plot(object):
             if k == -1:
                 continue
 
-            points_num = np.asarray([len(pcd_seg.points) for pcd_seg in split_in[k]])
-            # sorting by list: https://blog.csdn.net/tszupup/article/details/107943860
+            seg_store = as_segment_store(split_in[k])
+            points_num = seg_store.summary()['count']
             # e.g. points_num = [1, 3, 4, 5, 2, 7, 9]
-            sorted_id = sorted(range(len(points_num)), key=lambda ke: points_num[ke], reverse=True)
+            # stable sort of decreasing numbers, the same order as sorted(..., reverse=True)
+            sorted_id = np.argsort(-points_num, kind='stable')
             # will get return of [6, 5, 3, 2, 1, 4, 0]
-            print(f'[Plot][Rank] rank of index {sorted_id}, will keep '
-                  f'{[points_num[plant_id] for plant_id in sorted_id[0:keep_num]]}')
+            print(f'[Plot][Rank] rank of index {sorted_id.tolist()}, will keep '
+                  f'{points_num[sorted_id[0:keep_num]].tolist()}')
 
-            split_out[k] = [split_in[k][plant_id] for plant_id in sorted_id[0:keep_num]]
+            split_out[k] = seg_store[sorted_id[0:keep_num]]
 
         self.pcd_segmented = split_out
         return split_out
 
-    def sort_order(self, name_by='x', ascending=True, pcd_dict=None):
+    def sort_order(self, name_by='x', ascending=True, pcd_dict=None, row_tol=None):
+        """
+        :param name_by: 'x' or 'y', sort the segments by the x or y of their centers
+        :param row_tol: sort by field rows, e.g. name_by='x' and row_tol=0.2, the segments whose center y
+            differ less than 0.2 (chained) are in the same row, the rows are sorted by y, then each row by x
+        """
         if pcd_dict is None:
             reset_in = self.pcd_segmented
             if not self.segmented:
@@ -527,19 +986,8 @@ class Plot(object):
         for k in reset_in.keys():
             if k == -1:
                 continue
-            seg_id_list = []
-            x_list = []
-            y_list = []
-            for i, pcd in enumerate(reset_in[k]):
-                x = pcd.get_center()[0]
-                y = pcd.get_center()[1]
-                seg_id_list.append(i)
-                x_list.append(x)
-                y_list.append(y)
-            order_df = pd.DataFrame(dict(seg_id=seg_id_list, x=x_list, y=y_list))
-            order_df = order_df.sort_values(by=name_by, ascending=ascending).reset_index()
-
-            reset_out[k] = [reset_in[k][i] for i in order_df['seg_id']]
+            seg_store = as_segment_store(reset_in[k])
+            reset_out[k] = seg_store[seg_store.field_order(name_by, ascending=ascending, row_tol=row_tol)]
 
         self.pcd_segmented = reset_out
         return reset_out
@@ -571,43 +1019,65 @@ class Plot(object):
                 savepath = os.path.join(self.out_folder, f'{self.ply_name}-class[{k}].png')
             else:
                 savepath = os.path.join(img_folder, f'{self.ply_name}-class[{k}].png')
-            len_xyz = self.pcd_xyz.max(axis=0) - self.pcd_xyz.min(axis=0)  # calculate the size of figure
+            xyz_min, xyz_max = self.xyz_bounds()
+            len_xyz = xyz_max - xyz_min  # calculate the size of figure
             draw_plot_seg_results(save_in[k], pcd_id,
                                   title=f'{self.ply_name}-class[{k}] ({len(save_in[k])} segments)',
                                   savepath=savepath, size=(len_xyz[0], len_xyz[1]), show_id=show_id)
             print(f'[Plot][Save_Seg] writing image to "{savepath}"')
 
-    def shp_segment(self, shp_dir, correct_coord=None, rename=True):
+    def shp_segment(self, shp_dir, correct_coord=None, rename=True, method='grid'):
+        """
+        :param method: 'grid' or 'open3d'
+            grid: bin the points into a uniform grid, and only test the points in the cells
+                  touched by each polygon bbox (geometry.polygon_set.points_in_polygons)
+            open3d: crop the whole class cloud by SelectionPolygonVolume for each polygon
+            both methods give the same segments
+        """
         seg_out = {}
         seg_out_name = {}
         if isinstance(shp_dir, str):   # input one shp file
-            shp_seg = read_shp(shp_dir, correct_coord)
+            shp_seg = read_shp(shp_dir, correct_coord, packed=(method == 'grid'))
         else:
-            shp_seg = read_shps(shp_dir, correct_coord=correct_coord, rename=rename)
+            shp_seg = read_shps(shp_dir, correct_coord=correct_coord, rename=rename, packed=(method == 'grid'))
 
-        axis_max = self.pcd_xyz[:, 2].max()
-        axis_min = self.pcd_xyz[:, 2].min()
+        xyz_min, xyz_max = self.xyz_bounds()
+        axis_max = xyz_max[2]
+        axis_min = xyz_min[2]
 
         for k in self.pcd_classified.keys():
             if k == -1:
                 continue
 
-            seg_out[k] = []
             seg_out_name[k] = []
 
             print(f'[Plot][AutoSegment][Clustering] class {k} Cluster Data Prepared')
-            for plot_key in shp_seg.keys():
-                # can use pcd_tools.build_cut_boundary()
-                boundary = o3d.visualization.SelectionPolygonVolume()
-
-                boundary.orthogonal_axis = "Z"
-                boundary.bounding_polygon = o3d.utility.Vector3dVector(shp_seg[plot_key])
-                boundary.axis_max = axis_max
-                boundary.axis_min = axis_min
-
-                roi = boundary.crop_point_cloud(self.pcd_classified[k])
-                seg_out[k].append(roi)
+            if method == 'grid':
+                point_id, polygon_id = points_in_polygons(np.asarray(self.pcd_classified[k].points), shp_seg,
+                                                          z_range=(axis_min, axis_max))
+                # points are grouped by polygon already, gather them once and split by the polygon sizes
+                polygon_size = np.bincount(polygon_id, minlength=len(shp_seg))
+                pcd = self.pcd_classified[k]
+                roi_list = SegmentStore(np.asarray(pcd.points)[point_id],
+                                        np.asarray(pcd.colors)[point_id] if pcd.has_colors() else None,
+                                        np.asarray(pcd.normals)[point_id] if pcd.has_normals() else None,
+                                        sizes=polygon_size)
+            elif method == 'open3d':
+                roi_list = []
+                for plot_key in shp_seg.keys():
+                    # can use pcd_tools.build_cut_boundary()
+                    boundary = o3d.visualization.SelectionPolygonVolume()
+
+                    boundary.orthogonal_axis = "Z"
+                    boundary.bounding_polygon = o3d.utility.Vector3dVector(shp_seg[plot_key])
+                    boundary.axis_max = axis_max
+                    boundary.axis_min = axis_min
+
+                    roi_list.append(boundary.crop_point_cloud(self.pcd_classified[k]))
+            else:
+                raise KeyError(f'Only "grid" and "open3d" are acceptable for method parameters, not [{method}]')
 
+            for plot_key, roi in zip(shp_seg.keys(), roi_list):
                 file_name = f'class[{k}]-{plot_key}'
                 file_path = os.path.join(self.out_folder, f'{file_name}.ply')
                 seg_out_name[k].append(file_name)
@@ -616,12 +1086,30 @@ class Plot(object):
                     print(f'[Plot][AutoSegment][Output] writing file "{file_path}"')
                     o3d.io.write_point_cloud(file_path, roi)
 
+            roi_store = as_segment_store(roi_list) if method == 'open3d' else roi_list
+            roi_store.names = np.asarray(seg_out_name[k], dtype=object)
+            seg_out[k] = roi_store
+
         self.segmented = True
         self.pcd_segmented = seg_out
         self.pcd_segmented_name = seg_out_name
         return seg_out
 
-    def get_traits(self, container_ht=0, ground_ht='auto', savefig=True, pcd_dict=None):
+    def get_traits(self, container_ht=0, ground_ht='auto', savefig=True, pcd_dict=None, workers=1, backend='process',
+                   clip_method='grid'):
+        """
+        :param clip_method: 'grid' or 'open3d', how each Plant crops the ground points around it
+            grid: the ground xy are binned into a GridIndex once, each plant only tests the ground points
+                  in the cells touched by its expanded bbox, see Plant.clip_background()
+            open3d: each plant crops the whole ground cloud by SelectionPolygonVolume
+            both methods give the same ground points
+        :param workers: number of workers to calculate plants in parallel, None for the cpu number
+        :param backend: 'process' or 'thread'
+            process: plants are sent to ProcessPoolExecutor as numpy arrays (open3d objects are not pickled),
+                     the ground points are sent once to each worker
+            thread: plants are calculated by ThreadPoolExecutor in the same process
+            the row order of output is the same as workers=1
+        """
         if pcd_dict is None:
             traits_in = self.pcd_segmented
             if not self.segmented:
@@ -634,35 +1122,81 @@ class Plot(object):
                     'centroid.x(m)': [], 'centroid.y(m)': [], 'long_axis(m)': [], 'short_axis(m)': [],
                     'orient_deg2xaxis': [], 'percentile_height(m)': [], 'voxel_volume(m3)':[], 'hull3d_volume(m3)':[]}
 
+        if workers is None:
+            workers = os.cpu_count()
+        if clip_method not in ['grid', 'open3d']:
+            raise KeyError(f'Only "grid" and "open3d" are acceptable for clip_method parameters, not [{clip_method}]')
+        ground_pcd = self.pcd_classified[-1]
+        plant_kwargs = {'container_ht': container_ht, 'ground_ht': ground_ht}
+
+        # (kind, plant id, segment store, figure args) of all plants, in the output order
+        tasks = []
+        seg_stores = []
         for k in traits_in.keys():
-            number = len(traits_in[k])
+            seg_store = as_segment_store(traits_in[k])
+            seg_stores.append(seg_store)
+            number = len(seg_store)
             print(f'[Plot][get_traits] total number of kind {k} is {number}')
-            for i, seg in enumerate(traits_in[k]):
-                plant = Plant(pcd_input=seg, indices=i, ground_pcd=self.pcd_classified[-1],
-                              container_ht=container_ht, ground_ht=ground_ht)
+            for i in range(number):
+                fig_args = None
                 if savefig and self.write_ply:
-                    if len(self.pcd_segmented_name) > 0:
+                    if seg_store.name(i) is not None:
+                        file_name = seg_store.name(i)
+                    elif len(self.pcd_segmented_name) > 0:
                         file_name = self.pcd_segmented_name[k][i]
                     else:
                         file_name = f"class[{k}]-plant{i}"
-                    plant.draw_3d_results(output_path=self.out_folder, file_name=file_name)
-                out_dict['plot'].append(self.ply_name)
-                out_dict['plant'].append(i)
-                out_dict['kind'].append(k)
-                out_dict['center.x(m)'].append(plant.center[0])
-                out_dict['center.y(m)'].append(plant.center[1])
-                out_dict['min_rect_width(m)'].append(plant.width)
-                out_dict['min_rect_length(m)'].append(plant.length)
-                out_dict['hover_area(m2)'].append(plant.hull_area)
-                out_dict['PLA(cm2)'].append(plant.pla)
-                out_dict['centroid.x(m)'].append(plant.centroid[0])
-                out_dict['centroid.y(m)'].append(plant.centroid[1])
-                out_dict['long_axis(m)'].append(plant.major_axis)
-                out_dict['short_axis(m)'].append(plant.minor_axis)
-                out_dict['orient_deg2xaxis'].append(plant.orient_degree)
-                out_dict['percentile_height(m)'].append(plant.pctl_ht)
-                out_dict['voxel_volume(m3)'].append(plant.voxel_volume)
-                out_dict['hull3d_volume(m3)'].append(plant.hull3d_volume)
+                    fig_args = {'output_path': self.out_folder, 'file_name': file_name}
+                tasks.append((k, i, seg_store, fig_args))
+
+        # the grid cells are about the size of the clipping box of plants
+        ground_cell = None
+        if clip_method == 'grid' and len(tasks) > 0:
+            bbox_len = np.vstack([(seg_store.summary()['max'] - seg_store.summary()['min'])[:, 0:2]
+                                  for seg_store in seg_stores])
+            ground_cell = float(np.median(bbox_len.max(axis=1))) * 1.2
+
+        ground_index = None
+        if ground_cell is not None and (workers <= 1 or len(tasks) <= 1 or backend == 'thread'):
+            ground_index = GridIndex(np.asarray(ground_pcd.points), ground_cell)
+        # the kwargs of plants calculated in this process, the process workers build their own ground index
+        local_kwargs = dict(plant_kwargs, ground_index=ground_index)
+
+        def traits_batch(batch):
+            # the min bounding rectangles of one batch of plants are calculated together, see hull_rects()
+            hull_rect_list = hull_rects([seg_store.segment_xyz(i) for k, i, seg_store, fig_args in batch])
+            return [plant_traits(seg_store[i], i, ground_pcd, local_kwargs, fig_args, hull_rect)
+                    for (k, i, seg_store, fig_args), hull_rect in zip(batch, hull_rect_list)]
+
+        if workers <= 1 or len(tasks) <= 1:
+            traits_list = traits_batch(tasks)
+        else:
+            # each worker gets the plants in batches, about 4 batches per worker
+            batch_size = max(1, len(tasks) // (workers * 4))
+            batches = [tasks[start:start + batch_size] for start in range(0, len(tasks), batch_size)]
+            if backend == 'thread':
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    batch_traits = list(executor.map(traits_batch, batches))
+            elif backend == 'process':
+                print(f'[Plot][get_traits] calculating {len(tasks)} plants by {workers} processes')
+                # the segment arrays are sent directly, the point clouds are not built in this process
+                array_batches = [[(seg_store.segment_xyz(i), seg_store.segment_rgb(i), i, plant_kwargs, fig_args)
+                                  for k, i, seg_store, fig_args in batch] for batch in batches]
+                # the ground GridIndex is built once in each worker
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_plant_worker,
+                                         initargs=(np.asarray(ground_pcd.points), np.asarray(ground_pcd.colors),
+                                                   ground_cell)) as executor:
+                    batch_traits = list(executor.map(_plant_traits_worker, array_batches))
+            else:
+                raise KeyError(f'Only "process" and "thread" are acceptable for backend parameters, not [{backend}]')
+            traits_list = [traits for batch in batch_traits for traits in batch]
+
+        for (k, i, _, _), traits in zip(tasks, traits_list):
+            out_dict['plot'].append(self.ply_name)
+            out_dict['plant'].append(i)
+            out_dict['kind'].append(k)
+            for key, value in traits.items():
+                out_dict[key].append(value)
 
         out_pd = pd.DataFrame(out_dict)
         print(f'[Plot][get_traits] preview of traits of first 5 of {len(out_pd)} records:')
@@ -671,9 +1205,51 @@ class Plot(object):
         return out_pd
 
 
+def plant_traits(pcd_input, indices, ground_pcd, plant_kwargs, fig_args=None, hull_rect=None):
+    plant = Plant(pcd_input=pcd_input, indices=indices, ground_pcd=ground_pcd, hull_rect=hull_rect, **plant_kwargs)
+    if fig_args is not None:
+        plant.draw_3d_results(**fig_args)
+    return plant.traits()
+
+
+def hull_rects(xyz_list):
+    """
+    the 2D convex hulls of plants, and their min bounding rectangles in one min_bounding_rects() batch
+    :param xyz_list: list of np.array nx3, the points of each plant
+    :return: list of (plane_hull, hull_area, rect_res), the hull_rect of Plant
+    """
+    hull_list = [get_convex_hull(xyz, dim='2d') for xyz in xyz_list]
+    rect_list = min_bounding_rects([plane_hull for plane_hull, _ in hull_list])
+    return [(plane_hull, hull_area, rect_res) for (plane_hull, hull_area), rect_res in zip(hull_list, rect_list)]
+
+
+# the ground point cloud of each get_traits() worker process, sent once by the initializer
+_worker_ground_pcd = None
+_worker_ground_index = None
+
+def _init_plant_worker(ground_xyz, ground_rgb, ground_cell=None):
+    global _worker_ground_pcd, _worker_ground_index
+    _worker_ground_pcd = build_pcd(ground_xyz, ground_rgb)
+    _worker_ground_index = None if ground_cell is None else GridIndex(ground_xyz, ground_cell)
+
+def _plant_traits_worker(batch):
+    # one batch of (seg_xyz, seg_rgb, indices, plant_kwargs, fig_args)
+    hull_rect_list = hull_rects([seg_xyz for seg_xyz, _, _, _, _ in batch])
+    return [plant_traits(build_pcd(seg_xyz, seg_rgb), indices, _worker_ground_pcd,
+                         dict(plant_kwargs, ground_index=_worker_ground_index), fig_args, hull_rect)
+            for (seg_xyz, seg_rgb, indices, plant_kwargs, fig_args), hull_rect in zip(batch, hull_rect_list)]
+
+
 class Plant(object):
 
-    def __init__(self, pcd_input, ground_pcd, indices, cut_bg=True, container_ht=0, ground_ht='auto'):
+    def __init__(self, pcd_input, ground_pcd, indices, cut_bg=True, container_ht=0, ground_ht='auto',
+                 ground_index=None, hull_rect=None):
+        """
+        :param ground_index: geometry.grid_index.GridIndex of the ground_pcd xy (built by Plot.get_traits()),
+            if given, clip_background() only tests the ground points near the plant
+        :param hull_rect: (plane_hull, hull_area, rect_res) calculated before for this pcd,
+            Plot.get_traits() calculates the rectangles of each batch of plants by one min_bounding_rects()
+        """
         if isinstance(pcd_input, str):
             self.pcd = read_ply(pcd_input)
         else:
@@ -688,6 +1264,7 @@ class Plant(object):
             self.ground_pcd = read_ply(ground_pcd)
         else:
             self.ground_pcd = ground_pcd
+        self.ground_index = ground_index
 
         # clip the background
         if cut_bg:
@@ -695,33 +1272,62 @@ class Plant(object):
             # print(f'[Plant][clip_background] finished for No. {indices}')
 
         print(f'[Plant][Traits] No. {indices} Calculating')
-        # calculate the convex hull 2d
-        self.plane_hull, self.hull_area = get_convex_hull(self.pcd, dim='2d')  # vertex_set (2D ndarray), m^2
+        if hull_rect is None:
+            # calculate the convex hull 2d
+            self.plane_hull, self.hull_area = get_convex_hull(self.pcd, dim='2d')  # vertex_set (2D ndarray), m^2
 
-        # calculate min_area_bounding_rectangle,
-        # rect_res = (rot_angle, area, width, length, center_point, corner_points)
-        self.rect_res = min_bounding_rect(self.plane_hull)
+            # calculate min_area_bounding_rectangle,
+            # rect_res = (rot_angle, area, width, length, center_point, corner_points)
+            self.rect_res = min_bounding_rect(self.plane_hull)
+        else:
+            self.plane_hull, self.hull_area, self.rect_res = hull_rect
         self.width = self.rect_res[2]   # unit is m
         self.length = self.rect_res[3]   # unit is m
 
-        # calculate the projected 2D image (X-Y)
-        binary, px_num_per_cm, corner = pcd2binary(self.pcd)
+        # calculate the occupied pixels of projected 2D image (X-Y), the image is built only for plotting
+        pixels, self.pla_img_shape, px_num_per_cm, corner = pcd2pixels(self.pcd)
+        self.pla_pixels = pixels
+        self._pla_img = None
         # calculate region props
-        self.centroid, self.major_axis, self.minor_axis, self.orient_degree = self.get_region_props(binary,
+        self.centroid, self.major_axis, self.minor_axis, self.orient_degree = self.get_region_props(pixels,
                                                                                                     px_num_per_cm,
                                                                                                     corner)
         # calculate projected leaf area
-        self.pla_img = binary
-        self.pla = self.get_projected_leaf_area(binary, px_num_per_cm) #unit is cm^2
+        self.pla = self.get_projected_leaf_area(pixels, px_num_per_cm) #unit is cm^2
 
         # calcuate percentile height. add percentile parameter to adjust percentile
         self.pctl_ht, self.pctl_ht_plot = self.get_percentile_height(container_ht, ground_ht)
 
-        # voxel (todo)
-        self.pcd_voxel, self.voxel_params = pcd2voxel(self.pcd)
+        # voxel (todo), the VoxelGrid is built only when self.pcd_voxel is used
+        self.voxel_params = voxel_stats(self.pcd_xyz)
+        self._pcd_voxel = None
         self.voxel_volume = self.voxel_params['voxel_number'] * (self.voxel_params['voxel_size'] ** 3)
         self.convex_hull3d, self.hull3d_volume = get_convex_hull(self.pcd, dim='3d')
 
+    @property
+    def pcd_voxel(self):
+        if self._pcd_voxel is None:
+            self._pcd_voxel = o3d.geometry.VoxelGrid().create_from_point_cloud(
+                self.pcd, voxel_size=self.voxel_params['voxel_size'])
+        return self._pcd_voxel
+
+    @property
+    def pla_img(self):
+        # the binary image of pcd2binary(), built from self.pla_pixels when it is used
+        if self._pla_img is None:
+            self._pla_img = pixels2binary(self.pla_pixels, self.pla_img_shape)
+        return self._pla_img
+
+    def traits(self):
+        # the trait columns of Plot.get_traits()
+        return {'center.x(m)': self.center[0], 'center.y(m)': self.center[1],
+                'min_rect_width(m)': self.width, 'min_rect_length(m)': self.length,
+                'hover_area(m2)': self.hull_area, 'PLA(cm2)': self.pla,
+                'centroid.x(m)': self.centroid[0], 'centroid.y(m)': self.centroid[1],
+                'long_axis(m)': self.major_axis, 'short_axis(m)': self.minor_axis,
+                'orient_deg2xaxis': self.orient_degree, 'percentile_height(m)': self.pctl_ht,
+                'voxel_volume(m3)': self.voxel_volume, 'hull3d_volume(m3)': self.hull3d_volume}
+
     def clip_background(self):
         x_max = self.pcd_xyz[:, 0].max()
         x_min = self.pcd_xyz[:, 0].min()
@@ -737,6 +1343,14 @@ class Plant(object):
                             [x_min - x_len*0.1, y_min - y_len*0.1, 0]])
 
         ground_xyz = np.asarray(self.ground_pcd.points)
+        if self.ground_index is not None:
+            # the same crop as SelectionPolygonVolume (x_min < x <= x_max, y_min < y <= y_max) on the points
+            # of the grid cells touched by the box only, the z range is the whole ground so not tested
+            candidate = self.ground_index.query((polygon[0, 0], polygon[0, 1], polygon[2, 0], polygon[2, 1]))
+            inside = points_in_polygon(ground_xyz[candidate], polygon)
+            self.ground_pcd = select_pcd(self.ground_pcd, np.sort(candidate[inside]))
+            return
+
         z_max = ground_xyz[:, 2].max()
         z_min = ground_xyz[:, 2].min()
 
@@ -749,28 +1363,27 @@ class Plant(object):
     # -=-=-=-=-=-=-=-=-=-=-=-=
 
     @staticmethod
-    def get_region_props(binary, px_num_per_cm, corner):
+    def get_region_props(pixels, px_num_per_cm, corner):
+        """
+        :param pixels: np.array nx2 (row, col) of the unique occupied pixels by pcd2pixels()
+        """
         x_min, y_min = corner
-        regions = regionprops(binary, coordinates='xy')
-        props = regions[0]          # this is all coordinate in converted binary images
+        # this is all coordinate in converted binary images
+        (y0, x0), major_px, minor_px, phi = pixel_region_props(pixels)
 
         # convert coordinate from binary images to real point cloud
-        y0, x0 = props.centroid
         center = (x0 / px_num_per_cm / 100 + x_min, y0 / px_num_per_cm / 100 + y_min)
 
-        major_axis = props.major_axis_length / px_num_per_cm / 100
-        minor_axis = props.minor_axis_length / px_num_per_cm / 100
+        major_axis = major_px / px_num_per_cm / 100
+        minor_axis = minor_px / px_num_per_cm / 100
 
-        phi = props.orientation
-        angle = - phi * 180 / np.pi   # included angle with x axis, clockwise, by regionprops default
+        angle = - phi * 180 / np.pi   # included angle with x axis, clockwise, by regionprops 'xy' coordinates
 
         return center, major_axis, minor_axis, angle
 
     @staticmethod
-    def get_projected_leaf_area(binary, px_num_per_cm):
-        kind, number = np.unique(binary, return_counts=True)
-        # back_num = number[0]
-        fore_num = number[1]
+    def get_projected_leaf_area(pixels, px_num_per_cm):
+        fore_num = len(pixels)
 
         pixel_size = (1 / px_num_per_cm) ** 2   # unit is cm2
 
@@ -0,0 +1,255 @@
+import re
+import numpy as np
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.feature_selection import VarianceThreshold
+from sklearn.svm import SVC, OneClassSVM, LinearSVC
+from sklearn.kernel_approximation import Nystroem
+
+
+def label_dtype(kind_set):
+    # compact label arrays, int8 is enough for the kinds used in practice
+    kinds = np.asarray(list(kind_set))
+    if kinds.min() >= -128 and kinds.max() <= 127:
+        return np.int8
+    return np.int64
+
+
+class FlatTree(object):
+    """
+    Fitted sklearn DecisionTreeClassifier exported to flat numpy node arrays, the points
+    go down the tree together, one numpy comparison for all the points reaching a node.
+    The labels are the same as DecisionTreeClassifier.predict():
+        the input is compared in float32 with float64 thresholds (x <= threshold goes left),
+        and the label of leaf is the class with the largest value (the first one if equal)
+
+    Variables:
+        feature -> np.array (m,) int, split feature of each node, -1 for leaves
+        threshold -> np.array (m,) float64, split threshold of each node
+        threshold32 -> np.array (m,) float32, the largest float32 <= threshold, for a float32 input
+            x <= threshold equals x <= threshold32, so the comparison is exact in float32 and does not
+            depend on the numpy casting rules (value-based casting of numpy < 2 compared in float32)
+        left, right -> np.array (m,) int, child node ids, -1 for leaves
+        leaf_label -> np.array (m,), class label of each node (used for leaves)
+        max_depth -> int, depth of the tree
+    """
+
+    def __init__(self, tree_clf):
+        """
+        :param tree_clf: fitted sklearn.tree.DecisionTreeClassifier with single output
+        """
+        tree = tree_clf.tree_
+        if tree.n_outputs != 1:
+            raise TypeError(f'Only single output decision tree is supported, not {tree.n_outputs} outputs')
+        is_leaf = tree.children_left < 0
+
+        self.feature = np.where(is_leaf, -1, tree.feature).astype(np.int64)
+        self.threshold = tree.threshold.astype(np.float64)
+        self.threshold32 = self.threshold.astype(np.float32)
+        rounded_up = self.threshold32.astype(np.float64) > self.threshold
+        self.threshold32[rounded_up] = np.nextafter(self.threshold32[rounded_up], np.float32(-np.inf))
+        self.left = tree.children_left.astype(np.int64)
+        self.right = tree.children_right.astype(np.int64)
+        self.leaf_label = tree_clf.classes_[np.argmax(tree.value[:, 0, :], axis=1)]
+        self.max_depth = tree.max_depth
+        self.n_features = tree_clf.n_features_in_
+
+    def __len__(self):
+        return len(self.feature)
+
+    def split_features(self):
+        # the features used by at least one split node
+        return np.unique(self.feature[self.feature >= 0])
+
+    def apply(self, data):
+        """
+        :param data: np.array nxk of features
+        :return: np.array (n,) leaf node id of each row
+        """
+        data = np.asarray(data)
+        if data.ndim != 2 or data.shape[1] != self.n_features:
+            raise ValueError(f'The input should be n x {self.n_features}, not {data.shape}')
+        # the same precision as sklearn trees, one continuous column for each feature
+        columns = np.ascontiguousarray(data.T, dtype=np.float32)
+        point_num = len(data)
+        index_dtype = np.int32 if point_num < 2 ** 31 else np.int64
+
+        leaf = np.empty(point_num, dtype=np.int64)
+        # each node splits all of its points by one vectorized comparison, the point indices
+        # stay in ascending order, so the column reading is always forward
+        stack = [(0, np.arange(point_num, dtype=index_dtype))]
+        while len(stack) > 0:
+            node, indices = stack.pop()
+            feature = self.feature[node]
+            if feature < 0:
+                leaf[indices] = node
+                continue
+            go_left = columns[feature][indices] <= self.threshold32[node]
+            stack.append((self.right[node], indices[~go_left]))
+            stack.append((self.left[node], indices[go_left]))
+
+        return leaf
+
+    def predict(self, data):
+        """
+        :param data: np.array nxk of features
+        :return: np.array (n,) labels, the same as the sklearn tree
+        """
+        return self.leaf_label[self.apply(data)]
+
+
+class ColorLUT(object):
+    """
+    Lookup table of classifier labels for all the quantized RGB colors, only valid when
+    the classifier does not depend on z (e.g. the decision tree never splits on z).
+    Classifying points is then one gather of the label table by the point colors.
+
+    Variables:
+        bits -> int, bits kept for each color channel (8 for exact 8-bit colors, 6 for a 64x64x64 cube)
+        labels -> np.array (2^(3*bits),), the label of color index (r << 2*bits) | (g << bits) | b
+    """
+
+    def __init__(self, labels, bits=8):
+        if bits < 1 or bits > 8:
+            raise ValueError(f'The bits of each color channel should be in [1, 8], not {bits}')
+        if len(labels) != 2 ** (3 * bits):
+            raise ValueError(f'{bits} bits lookup table needs {2 ** (3 * bits)} labels, not {len(labels)}')
+        self.bits = bits
+        self.labels = labels
+
+    @classmethod
+    def from_classifier(cls, classifier, bits=8, chunk_size=1 << 20):
+        """
+        :param classifier: easydcp Classifier, its clf.predict() is applied to the color of each cell,
+            with z=0 (z is not used)
+        :param bits: 8 gives exactly the same labels for 8-bit colors,
+            less bits use the color at the center of each cell for all the colors in that cell
+        :param chunk_size: number of colors predicted at the same time
+        :return: ColorLUT
+        """
+        levels = 2 ** bits
+        step = 256 // levels
+        values = (np.arange(levels) * step + step // 2).astype(np.uint8)
+
+        color_num = levels ** 3
+        chunk_size = max(chunk_size // levels ** 2, 1) * levels ** 2   # whole red levels in each chunk
+        labels = None
+        for start in range(0, color_num, chunk_size):
+            index = np.arange(start, min(start + chunk_size, color_num))
+            rgb = np.stack([values[index >> (2 * bits)], values[(index >> bits) & (levels - 1)],
+                            values[index & (levels - 1)]], axis=1)
+            features = classifier.get_features(rgb, np.zeros(len(rgb)),
+                                               out=np.empty((len(rgb), 5), dtype=np.float32))
+            pred = classifier.clf.predict(features)
+            if labels is None:
+                labels = np.empty(color_num, dtype=label_dtype(classifier.kind_set))
+            labels[index] = pred
+
+        return cls(labels, bits=bits)
+
+    def color_index(self, rgb):
+        """
+        :param rgb: np.array nx3 of integer colors (8 or 16 bit), or float colors in [0, 1]
+        :return: np.array (n,) index in labels
+        """
+        if np.issubdtype(rgb.dtype, np.integer):
+            shift = rgb.dtype.itemsize * 8 - self.bits
+            rgb = rgb.astype(np.int32) >> shift
+        else:
+            # float colors are saved from 8-bit colors divided by 255
+            rgb = np.clip(np.rint(rgb * 255), 0, 255).astype(np.int32) >> (8 - self.bits)
+        return (rgb[:, 0] << (2 * self.bits)) | (rgb[:, 1] << self.bits) | rgb[:, 2]
+
+    def lookup(self, rgb):
+        """
+        :param rgb: np.array nx3 of integer colors (8 or 16 bit), or float colors in [0, 1]
+        :return: np.array (n,) labels
+        """
+        return self.labels[self.color_index(rgb)]
+
+
+
+def stratified_sample(kind, max_num, seed=0):
+    """
+    pick about max_num training samples, each kind keeps its proportion (at least one sample)
+    :param kind: np.array (n,) kind of each training sample
+    :param max_num: max number of samples, None to keep all
+    :return: np.array sorted indices of picked samples
+    """
+    kind = np.asarray(kind)
+    if max_num is None or len(kind) <= max_num:
+        return np.arange(len(kind))
+    rng = np.random.default_rng(seed)
+    picked = []
+    for k in np.unique(kind):
+        kind_id = np.flatnonzero(kind == k)
+        num = max(1, int(round(max_num * len(kind_id) / len(kind))))
+        picked.append(rng.choice(kind_id, min(num, len(kind_id)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+class OneClassModel(object):
+    """
+    One-class svm trained by the samples of one kind only, the inliers are labeled as that kind,
+    and the outliers as outlier_kind (the background -1, or 0 if the trained kind is background)
+    """
+
+    def __init__(self, model, kind, outlier_kind):
+        self.model = model
+        self.kind = kind
+        self.outlier_kind = outlier_kind
+
+    def fit(self, data):
+        self.model.fit(data)
+        return self
+
+    def predict(self, data):
+        # sklearn one-class models give +1 for inliers and -1 for outliers
+        return np.where(self.model.predict(data) == 1, self.kind, self.outlier_kind)
+
+
+def _require_sklearn(version, feature):
+    # some build_svm options need newer scikit-learn than the other classifiers
+    import sklearn
+    current = tuple(int(v) for v in re.findall(r'\d+', sklearn.__version__)[0:2])
+    if current < tuple(int(v) for v in version.split('.')):
+        raise ImportError(f'{feature} requires scikit-learn>={version}, not [{sklearn.__version__}], '
+                          f'please upgrade scikit-learn or use other kernel_approx / one_class options')
+
+
+def build_svm(one_class=False, kernel_approx=None, n_components=300, nu=0.05, seed=0):
+    """
+    unfitted svm pipeline on classifier features, the features with zero variance in training data
+    are dropped (e.g. z of png training data), and the others are standardized before the svm
+    :param one_class: OneClassSVM (SGDOneClassSVM if kernel_approx) instead of SVC (LinearSVC if kernel_approx)
+    :param kernel_approx: None, 'nystroem' or 'rbf_sampler'
+        None: exact rbf kernel, the fitting time is quadratic in training size,
+              and the predicting time is linear in the number of support vectors
+        nystroem / rbf_sampler: approximate the rbf kernel by n_components features, and fit a linear model,
+              both fitting and predicting are linear in point number
+        rbf_sampler needs scikit-learn>=1.2, and SGDOneClassSVM (one_class) needs scikit-learn>=1.0
+    :param n_components: number of approximated kernel features
+    :param nu: upper bound of outlier fraction for one-class models
+    :return: sklearn.pipeline.Pipeline
+    """
+    steps = [VarianceThreshold(), StandardScaler()]
+    if kernel_approx is None:
+        steps.append(OneClassSVM(nu=nu, gamma='scale') if one_class else SVC(gamma='scale'))
+    else:
+        if kernel_approx == 'nystroem':
+            steps.append(Nystroem(n_components=n_components, random_state=seed))
+        elif kernel_approx == 'rbf_sampler':
+            _require_sklearn('1.2', 'RBFSampler(gamma="scale")')
+            from sklearn.kernel_approximation import RBFSampler
+            steps.append(RBFSampler(gamma='scale', n_components=n_components, random_state=seed))
+        else:
+            raise KeyError(f'Only None, "nystroem" and "rbf_sampler" are acceptable for kernel_approx parameters, '
+                           f'not [{kernel_approx}]')
+        if one_class:
+            _require_sklearn('1.0', 'SGDOneClassSVM')
+            from sklearn.linear_model import SGDOneClassSVM
+            steps.append(SGDOneClassSVM(nu=nu, random_state=seed))
+        else:
+            steps.append(LinearSVC())
+
+    return make_pipeline(*steps)
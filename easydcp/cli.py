@@ -0,0 +1,229 @@
+"""
+Command line entry of easydcp, batch processing of many plots with one shared classifier:
+
+    python -m easydcp analyze plot1.ply plot2.ply plot_folder/ --classifier model.pkl --workers 4
+    python -m easydcp analyze *.ply --train fore.png back.png --kinds 0 -1 --save-classifier model.pkl
+"""
+import os
+import sys
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from easydcp.base import Classifier, Plot
+from easydcp.io.cprint import printYellow, printRed
+from easydcp.io.folder import make_dir
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='easydcp', description='EasyDCP point cloud analysis')
+    subparsers = parser.add_subparsers(dest='command')
+
+    analyze = subparsers.add_parser('analyze', help='segment plants and calculate traits of many plots')
+    analyze.add_argument('plots', nargs='+',
+                         help='ply files, or folders of ply files (one folder is one plot)')
+
+    clf_group = analyze.add_mutually_exclusive_group(required=True)
+    clf_group.add_argument('--classifier', help='Classifier file saved by Classifier.save() (*.pkl)')
+    clf_group.add_argument('--train', nargs='+', help='training png or ply files to build the Classifier')
+    analyze.add_argument('--kinds', nargs='+', type=int,
+                         help='kind of each training file, -1 is background, 0, 1, ... are foreground')
+    analyze.add_argument('--core', default='dtc', choices=['dtc', 'svm'], help='classifier core')
+    analyze.add_argument('--max-train', type=int, help='(svm only) max number of training samples')
+    analyze.add_argument('--kernel-approx', choices=['nystroem', 'rbf_sampler'],
+                         help='(svm only) approximate the rbf kernel and fit a linear svm')
+    analyze.add_argument('--engine', choices=['sklearn', 'flat', 'lut'],
+                         help='prediction engine of the Classifier, see Classifier.set_engine()')
+    analyze.add_argument('--save-classifier', help='save the trained Classifier to this pkl file')
+    analyze.add_argument('--cache-dir', help='folder to cache the training array, skip reading the same '
+                                             'training files again')
+
+    analyze.add_argument('--workers', type=int, default=1, help='number of plots processed in parallel')
+    analyze.add_argument('--output', default='data_out', help='output folder')
+    analyze.add_argument('--unit', default='m', choices=['m', 'dm', 'cm', 'mm', 'km'])
+    analyze.add_argument('--num-plants', type=int, default=0,
+                         help='apply kmeans_split() if more segments than this number are found')
+    analyze.add_argument('--eps-grids', type=int, default=10)
+    analyze.add_argument('--divide', type=int, default=100)
+    analyze.add_argument('--dbscan-method', default='open3d', choices=['open3d', 'grid'],
+                         help='"grid" is a faster voxel approximation of DBSCAN for large plots')
+    analyze.add_argument('--name-by', default='x', choices=['x', 'y'], help='sort the plants by x or y')
+    analyze.add_argument('--container-ht', type=float, default=0, help='container height in meters')
+    analyze.add_argument('--down-sample', action='store_true')
+    analyze.add_argument('--no-denoise', action='store_true',
+                         help='skip remove_noise(), e.g. for sparse point clouds')
+    analyze.add_argument('--denoise-method', default='open3d', choices=['open3d', 'tile'],
+                         help='"tile" filters overlapping xy tiles of large plots in parallel')
+    analyze.add_argument('--mmap', action='store_true', help='memory-map the binary ply files')
+    analyze.add_argument('--write-ply', action='store_true', help='save the segmented plants as ply files')
+    analyze.add_argument('--no-figure', action='store_true', help='do not draw segment and plant figures')
+
+    return parser
+
+
+def load_classifier(args):
+    if args.classifier is not None:
+        clf = Classifier.load(args.classifier)
+    else:
+        if args.kinds is None or len(args.kinds) != len(args.train):
+            raise ValueError('Please give one --kinds value for each --train file')
+        clf = Classifier(path_list=args.train, kind_list=args.kinds, core=args.core, unit=args.unit,
+                         cache_dir=args.cache_dir, max_train=args.max_train, kernel_approx=args.kernel_approx)
+    if args.engine is not None and args.engine != clf.engine:
+        clf.set_engine(args.engine)
+
+    if args.save_classifier is not None:
+        clf.save(args.save_classifier)
+
+    return clf
+
+
+def analyze_plot(plot_path, clf, options):
+    """
+    the same pipeline as example/analysis.py:
+        remove_noise (optional) -> dbscan_segment -> kmeans_split -> sort_order -> get_traits
+    :param plot_path: ply file or folder of ply files
+    :param clf: Classifier
+    :param options: dict of pipeline options, see build_parser()
+    :return: pandas.DataFrame of plant traits
+    """
+    plot = Plot(plot_path, clf, unit=options['unit'], output_path=options['output'],
+                write_ply=options['write_ply'], down_sample=options['down_sample'], mmap=options['mmap'])
+    if options['denoise']:
+        plot.remove_noise(divide=options['divide'], method=options['denoise_method'])
+    eps, min_points = plot.auto_dbscan_args(eps_grids=options['eps_grids'], divide=options['divide'])
+    seg = plot.dbscan_segment(eps=eps, min_points=min_points, method=options['dbscan_method'])
+    if any(len(seg_list) > options['num_plants'] for seg_list in seg.values()):
+        plot.kmeans_split()
+    plot.sort_order(name_by=options['name_by'], ascending=True)
+    if options['savefig']:
+        plot.save_segment_result(img_folder=options['output'])
+
+    return plot.get_traits(container_ht=options['container_ht'], savefig=options['savefig'])
+
+
+# the classifier of each analyze worker process, sent once by the initializer
+_worker_clf = None
+
+def _init_analyze_worker(clf):
+    global _worker_clf
+    _worker_clf = clf
+
+def _analyze_worker(plot_path, options):
+    # exceptions are returned as text, one failed plot does not stop the others
+    try:
+        return analyze_plot(plot_path, _worker_clf, options), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def _run_pool(plot_paths, clf, workers, options, collect):
+    """
+    process the plots in one process pool
+    :return: list of the plots lost because a worker process died (BrokenProcessPool),
+        their results are unknown, all the other plots are collected
+    """
+    lost = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_analyze_worker,
+                             initargs=(clf,)) as executor:
+        futures = {executor.submit(_analyze_worker, plot_path, options): plot_path for plot_path in plot_paths}
+        for future in as_completed(futures):
+            try:
+                traits, error = future.result()
+            except BrokenProcessPool:
+                # a worker process was killed (e.g. segfault in open3d, out of memory),
+                # all the plots not finished in this pool fail together
+                lost.append(futures[future])
+                continue
+            except Exception:
+                traits, error = None, traceback.format_exc()
+            collect(futures[future], traits, error)
+    return sorted(lost, key=plot_paths.index)
+
+
+# the plots lost in this number of crashed pools are processed one by one in their own pool
+CRASH_ISOLATE = 2
+
+def run_analyze(plot_paths, clf, options, workers=1):
+    """
+    process the plots one by one (workers=1) or in a process pool, the traits of each plot
+    are appended to "traits.csv" of output folder as soon as it finishes,
+    and the failed plots are recorded in "failed.txt".
+    If a worker process dies, the unfinished plots are submitted again to a new pool, the plots lost
+    in CRASH_ISOLATE crashed pools are then processed alone, so only the plot which crashes is failed.
+    :return: list of the successful plot paths, list of failed plot paths
+    """
+    make_dir(options['output'])
+    traits_path = os.path.join(options['output'], 'traits.csv')
+    failed_path = os.path.join(options['output'], 'failed.txt')
+    for path in [traits_path, failed_path]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    done, failed = [], []
+
+    def collect(plot_path, traits, error):
+        if error is None:
+            # rows are in the finished order, the "plot" column tells where they come from
+            traits.to_csv(traits_path, mode='a', header=not os.path.exists(traits_path), index=False)
+            done.append(plot_path)
+            print(f'[CLI][analyze] ({len(done) + len(failed)}/{len(plot_paths)}) '
+                  f'"{plot_path}" finished, {len(traits)} plants')
+        else:
+            with open(failed_path, 'a') as f:
+                f.write(f'{plot_path}\n{error}\n')
+            failed.append(plot_path)
+            printRed(f'[CLI][analyze] ({len(done) + len(failed)}/{len(plot_paths)}) "{plot_path}" failed:\n{error}')
+
+    if workers <= 1:
+        _init_analyze_worker(clf)
+        for plot_path in plot_paths:
+            collect(plot_path, *_analyze_worker(plot_path, options))
+    else:
+        print(f'[CLI][analyze] processing {len(plot_paths)} plots by {workers} processes')
+        crashes = {plot_path: 0 for plot_path in plot_paths}
+        pending = list(plot_paths)
+        while len(pending) > 0:
+            shared = [plot_path for plot_path in pending if crashes[plot_path] < CRASH_ISOLATE]
+            lost = _run_pool(shared, clf, workers, options, collect) if len(shared) > 0 else []
+            for plot_path in pending:
+                if crashes[plot_path] < CRASH_ISOLATE:
+                    continue
+                if len(_run_pool([plot_path], clf, 1, options, collect)) > 0:
+                    collect(plot_path, None, 'The worker process terminated abruptly '
+                                             '(e.g. segmentation fault, or killed for out of memory)')
+            if len(lost) > 0:
+                printYellow(f'[CLI][analyze] a worker process died, submitting {len(lost)} unfinished plots again')
+            for plot_path in lost:
+                crashes[plot_path] += 1
+            pending = lost
+
+    if len(failed) > 0:
+        printYellow(f'[CLI][analyze] {len(failed)} of {len(plot_paths)} plots failed, see "{failed_path}"')
+    print(f'[CLI][analyze] traits of {len(done)} plots saved to "{traits_path}"')
+
+    return done, failed
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == 'analyze':
+        clf = load_classifier(args)
+        options = {'unit': args.unit, 'output': args.output, 'write_ply': args.write_ply,
+                   'down_sample': args.down_sample, 'mmap': args.mmap, 'denoise': not args.no_denoise,
+                   'denoise_method': args.denoise_method, 'divide': args.divide,
+                   'eps_grids': args.eps_grids, 'num_plants': args.num_plants, 'name_by': args.name_by,
+                   'dbscan_method': args.dbscan_method,
+                   'container_ht': args.container_ht, 'savefig': not args.no_figure}
+        done, failed = run_analyze(args.plots, clf, options, workers=args.workers)
+        return 1 if len(failed) > 0 else 0
+    else:
+        parser.print_help()
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def ranges_to_indices(start, end):
+    """
+    concatenate several integer ranges without python loop
+    >>> ranges_to_indices(np.array([0, 5]), np.array([2, 8]))
+    array([0, 1, 5, 6, 7])
+    """
+    start = np.asarray(start, dtype=np.int64)
+    lens = np.asarray(end, dtype=np.int64) - start
+    keep = lens > 0
+    start, lens = start[keep], lens[keep]
+    if len(lens) == 0:
+        return np.empty(0, dtype=np.int64)
+    # the first index of each range minus the position it will be placed
+    shift = start - np.concatenate([[0], np.cumsum(lens)[:-1]])
+    return np.repeat(shift, lens) + np.arange(lens.sum())
+
+
+class GridIndex(object):
+    """
+    Uniform 2D grid over the xy of points, the points are sorted by cell once,
+    then the points inside a bounding box are found by reading the cell ranges only.
+
+    Variables:
+        cell_size -> float, the side length of square cells
+        xy_min -> np.array (2,), the origin of the grid
+        shape -> (nx, ny), number of cells in x and y
+        order -> np.array (n,), point indices sorted by cell id (cell id = y_cell * nx + x_cell)
+        cell_start -> np.array (nx*ny+1,), points of cell c are order[cell_start[c]:cell_start[c+1]]
+    """
+
+    def __init__(self, xy, cell_size, max_cells=None):
+        """
+        :param xy: np.array nx2 (or nx3, only x and y are used)
+        :param cell_size: side length of cells
+        :param max_cells: limit of total cell number, the cell_size is enlarged if exceeded,
+            default is the point number (at least 1024)
+        """
+        xy = np.asarray(xy)[:, 0:2]
+        point_num = len(xy)
+        if max_cells is None:
+            max_cells = max(point_num, 1024)
+
+        if point_num > 0:
+            self.xy_min = xy.min(axis=0).astype(np.float64)
+            xy_len = xy.max(axis=0).astype(np.float64) - self.xy_min
+        else:
+            self.xy_min = np.zeros(2)
+            xy_len = np.zeros(2)
+
+        if cell_size <= 0 or not np.isfinite(cell_size):
+            cell_size = max(xy_len.max(), 1e-6)
+        cells = np.floor(xy_len / cell_size) + 1
+        if cells.prod() > max_cells:
+            cell_size = cell_size * np.sqrt(cells.prod() / max_cells)
+            cells = np.floor(xy_len / cell_size) + 1
+        self.cell_size = cell_size
+        self.shape = (int(cells[0]), int(cells[1]))
+
+        cell_id = self.cell_id(xy)
+        self.order = np.argsort(cell_id, kind='stable')
+        counts = np.bincount(cell_id, minlength=self.shape[0] * self.shape[1])
+        self.cell_start = np.concatenate([[0], np.cumsum(counts)])
+
+    def cell_id(self, xy):
+        cell = np.floor((xy - self.xy_min) / self.cell_size).astype(np.int64)
+        np.clip(cell[:, 0], 0, self.shape[0] - 1, out=cell[:, 0])
+        np.clip(cell[:, 1], 0, self.shape[1] - 1, out=cell[:, 1])
+        return cell[:, 1] * self.shape[0] + cell[:, 0]
+
+    def query(self, bbox):
+        """
+        :param bbox: (x_min, y_min, x_max, y_max)
+        :return: indices of the points in the cells touched by bbox (candidates, not tested exactly)
+        """
+        nx, ny = self.shape
+        cx0, cy0 = np.floor((np.asarray(bbox[0:2], dtype=np.float64) - self.xy_min) / self.cell_size)
+        cx1, cy1 = np.floor((np.asarray(bbox[2:4], dtype=np.float64) - self.xy_min) / self.cell_size)
+        if cx1 < 0 or cy1 < 0 or cx0 >= nx or cy0 >= ny:
+            return np.empty(0, dtype=np.int64)
+        cx0, cy0 = int(max(cx0, 0)), int(max(cy0, 0))
+        cx1, cy1 = int(min(cx1, nx - 1)), int(min(cy1, ny - 1))
+
+        # the cells of one grid row are continuous in order
+        rows = np.arange(cy0, cy1 + 1) * nx
+        return self.order[ranges_to_indices(self.cell_start[rows + cx0], self.cell_start[rows + cx1 + 1])]
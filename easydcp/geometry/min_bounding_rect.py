@@ -9,7 +9,13 @@
 # This program finds the rotation angles of each edge of the convex polygon,
 # then tests the area of a bounding box aligned with the unique angles in
 # 90 degrees of the 1st Quadrant.
-# Returns the
+# Returns the (rot_angle, area, width, height, center_point, corner_points)
+#
+# Vectorized: all the edge angles are calculated at once, and the hull is rotated
+# by all the unique angles in one (angles x 2 x n) tensor operation.
+# min_bounding_rects() does the same for many hulls in one call.
+# Of the rectangles with the same area up to rounding (e.g. triangles, parallelograms),
+# the one of the smallest angle is returned.
 #
 
 # Copyright (c) 2013, David Butterworth, University of Queensland
@@ -39,101 +45,99 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-from numpy import *
 import sys  # maxint
 
-def min_bounding_rect(hull_points_2d):
-    #print "Input convex hull points: "
-    #print hull_points_2d
-
-    # Compute edges (x2-x1,y2-y1)
-    edges = zeros( (len(hull_points_2d)-1,2) ) # empty 2 column array
-    for i in range( len(edges) ):
-        edge_x = hull_points_2d[i+1,0] - hull_points_2d[i,0]
-        edge_y = hull_points_2d[i+1,1] - hull_points_2d[i,1]
-        edges[i] = [edge_x,edge_y]
-    #print "Edges: \n", edges
-
-    # Calculate edge angles   atan2(y/x)
-    edge_angles = zeros( (len(edges)) ) # empty 1 column array
-    for i in range( len(edge_angles) ):
-        edge_angles[i] = math.atan2( edges[i,1], edges[i,0] )
-    #print "Edge angles: \n", edge_angles
-
-    # Check for angles in 1st quadrant
-    for i in range( len(edge_angles) ):
-        edge_angles[i] = abs( edge_angles[i] % (math.pi/2) ) # want strictly positive answers
-    #print "Edge angles in 1st Quadrant: \n", edge_angles
-
-    # Remove duplicate angles
-    edge_angles = unique(edge_angles)
-    #print "Unique edge angles: \n", edge_angles
-
-    # Test each angle to find bounding box with smallest area
-    min_bbox = (0, sys.maxsize, 0, 0, 0, 0, 0, 0) # rot_angle, area, width, height, min_x, max_x, min_y, max_y
-    #print("Testing", len(edge_angles), "possible rotations for bounding box... \n")
-    for i in range( len(edge_angles) ):
-
-        # Create rotation matrix to shift points to baseline
-        # R = [ cos(theta)      , cos(theta-PI/2)
-        #       cos(theta+PI/2) , cos(theta)     ]
-        R = array([ [ math.cos(edge_angles[i]), math.cos(edge_angles[i]-(math.pi/2)) ], [ math.cos(edge_angles[i]+(math.pi/2)), math.cos(edge_angles[i]) ] ])
-        #print "Rotation matrix for ", edge_angles[i], " is \n", R
-
-        # Apply this rotation to convex hull points
-        rot_points = dot(R, transpose(hull_points_2d) ) # 2x2 * 2xn
-        #print "Rotated hull points are \n", rot_points
-
-        # Find min/max x,y points
-        min_x = nanmin(rot_points[0], axis=0)
-        max_x = nanmax(rot_points[0], axis=0)
-        min_y = nanmin(rot_points[1], axis=0)
-        max_y = nanmax(rot_points[1], axis=0)
-        #print "Min x:", min_x, " Max x: ", max_x, "   Min y:", min_y, " Max y: ", max_y
-
-        # Calculate height/width/area of this bounding rectangle
-        width = max_x - min_x
-        height = max_y - min_y
-        area = width*height
-        #print "Potential bounding box ", i, ":  width: ", width, " height: ", height, "  area: ", area
-
-        # Store the smallest rect found first (a simple convex hull might have 2 answers with same area)
-        if (area < min_bbox[1]):
-            min_bbox = ( edge_angles[i], area, width, height, min_x, max_x, min_y, max_y )
-        # Bypass, return the last found rect
-        #min_bbox = ( edge_angles[i], area, width, height, min_x, max_x, min_y, max_y )
-
-    # Re-create rotation matrix for smallest rect
-    angle = min_bbox[0]
-    R = array([ [ math.cos(angle), math.cos(angle-(math.pi/2)) ], [ math.cos(angle+(math.pi/2)), math.cos(angle) ] ])
-    #print "Projection matrix: \n", R
-
-    # Project convex hull points onto rotated frame
-    proj_points = dot(R, transpose(hull_points_2d) ) # 2x2 * 2xn
-    #print "Project hull points are \n", proj_points
-
-    # min/max x,y points are against baseline
-    min_x = min_bbox[4]
-    max_x = min_bbox[5]
-    min_y = min_bbox[6]
-    max_y = min_bbox[7]
-    #print "Min x:", min_x, " Max x: ", max_x, "   Min y:", min_y, " Max y: ", max_y
+import numpy as np
+
+
+def _rotations(angles):
+    """
+    R = [ cos(theta)      , cos(theta-PI/2)
+          cos(theta+PI/2) , cos(theta)     ]
+    :param angles: np.array (...)
+    :return: np.array (..., 2, 2)
+    """
+    return np.stack([np.stack([np.cos(angles), np.cos(angles - np.pi / 2)], axis=-1),
+                     np.stack([np.cos(angles + np.pi / 2), np.cos(angles)], axis=-1)], axis=-2)
+
+
+def _edge_angles(hulls):
+    """
+    :param hulls: np.array (h, n, 2), padded by nan
+    :return: np.array (h, n-1) sorted unique edge angles in the 1st quadrant of each hull, padded by nan
+    """
+    edges = hulls[:, 1:, :] - hulls[:, :-1, :]
+    # want strictly positive answers
+    angles = np.abs(np.arctan2(edges[:, :, 1], edges[:, :, 0]) % (np.pi / 2))
+    if angles.shape[1] == 0:   # single points, no edge
+        angles = np.full((len(hulls), 1), np.nan)
+    angles = np.sort(angles, axis=1)   # nan at the end
+    # remove duplicate angles
+    duplicate = np.zeros(angles.shape, dtype=bool)
+    duplicate[:, 1:] = angles[:, 1:] == angles[:, :-1]
+    angles[duplicate] = np.nan
+    return angles
+
+
+def _rect_results(angle, area, width, height, min_x, max_x, min_y, max_y):
+    R = _rotations(np.asarray(angle))
 
     # Calculate center point and project onto rotated frame
-    center_x = (min_x + max_x)/2
-    center_y = (min_y + max_y)/2
-    center_point = dot( [ center_x, center_y ], R )
-    #print "Bounding box center point: \n", center_point
+    center_point = np.dot([(min_x + max_x) / 2, (min_y + max_y) / 2], R)
 
     # Calculate corner points and project onto rotated frame
-    corner_points = zeros( (4,2) ) # empty 2 column array
-    corner_points[0] = dot( [ max_x, min_y ], R )
-    corner_points[1] = dot( [ min_x, min_y ], R )
-    corner_points[2] = dot( [ min_x, max_y ], R )
-    corner_points[3] = dot( [ max_x, max_y ], R )
-    #print "Bounding box corner points: \n", corner_points
-
-    #print "Angle of rotation: ", angle, "rad  ", angle * (180/math.pi), "deg"
+    corner_points = np.dot(np.array([[max_x, min_y], [min_x, min_y], [min_x, max_y], [max_x, max_y]]), R)
 
     # rot_angle, area, width, height, center_point, corner_points
-    return (angle, min_bbox[1], min_bbox[2], min_bbox[3], center_point, corner_points)
\ No newline at end of file
+    return (angle, area, width, height, center_point, corner_points)
+
+
+def min_bounding_rects(hull_list, chunk_size=256):
+    """
+    minimum-area bounding rectangles of many hulls, the hulls are padded to the same length by nan,
+    and each chunk of hulls is rotated by all their angles in one (hulls x angles x 2 x n) tensor
+    :param hull_list: list of np.array nx2 (convex hulls)
+    :param chunk_size: number of hulls in one tensor, limits the memory
+    :return: list of (rot_angle, area, width, height, center_point, corner_points), the same as min_bounding_rect()
+    """
+    results = []
+    for start in range(0, len(hull_list), chunk_size):
+        chunk = [np.asarray(hull, dtype=np.float64)[:, 0:2] for hull in hull_list[start:start + chunk_size]]
+        max_len = max(len(hull) for hull in chunk)
+        hulls = np.full((len(chunk), max_len, 2), np.nan)
+        for i, hull in enumerate(chunk):
+            hulls[i, :len(hull)] = hull
+
+        angles = _edge_angles(hulls)                                   # (h, a)
+        valid = ~np.isnan(angles)
+        R = _rotations(np.where(valid, angles, 0))                      # (h, a, 2, 2)
+        # Apply the rotations to convex hull points, 2x2 * 2xn for each angle
+        rot_points = np.einsum('haij,hnj->hain', R, hulls)             # (h, a, 2, n)
+
+        # Find min/max x,y points
+        min_xy = np.nanmin(rot_points, axis=3)
+        max_xy = np.nanmax(rot_points, axis=3)
+        width = max_xy[:, :, 0] - min_xy[:, :, 0]
+        height = max_xy[:, :, 1] - min_xy[:, :, 1]
+        area = np.where(valid, width * height, np.inf)
+
+        # Store the smallest rect found first (a simple convex hull might have 2 answers with same area),
+        # the areas equal up to rounding are ties, so the first angle wins whatever the rounding of rotations
+        min_area = area.min(axis=1, keepdims=True)
+        best = np.argmax(np.isclose(area, min_area, rtol=1e-9, atol=0), axis=1)
+        for i, b in enumerate(best):
+            if not valid[i, b]:
+                # no edge, the same as the initial min_bbox of the loop version
+                results.append(_rect_results(0, sys.maxsize, 0, 0, 0, 0, 0, 0))
+                continue
+            results.append(_rect_results(angles[i, b], area[i, b], width[i, b], height[i, b],
+                                         min_xy[i, b, 0], max_xy[i, b, 0], min_xy[i, b, 1], max_xy[i, b, 1]))
+    return results
+
+
+def min_bounding_rect(hull_points_2d):
+    """
+    :param hull_points_2d: np.array nx2, the convex hull
+    :return: (rot_angle, area, width, height, center_point, corner_points)
+    """
+    return min_bounding_rects([hull_points_2d])[0]
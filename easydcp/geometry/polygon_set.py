@@ -0,0 +1,238 @@
+import numpy as np
+
+from easydcp.geometry.grid_index import GridIndex, ranges_to_indices
+
+
+def bbox_intersect(bboxes, bbox):
+    """
+    :param bboxes: np.array nx4 (x_min, y_min, x_max, y_max)
+    :param bbox: (x_min, y_min, x_max, y_max)
+    :return: boolean np.array (n,), touched boxes are also intersected
+    """
+    return (bboxes[:, 0] <= bbox[2]) & (bboxes[:, 2] >= bbox[0]) & \
+           (bboxes[:, 1] <= bbox[3]) & (bboxes[:, 3] >= bbox[1])
+
+
+def points_in_polygon(xy, polygon):
+    """
+    the same crossing number test as open3d SelectionPolygonVolume.crop_point_cloud(orthogonal_axis="Z"):
+    a point is inside if odd number of polygon edges cross its horizontal line at the left side of it
+    :param xy: np.array nx2 (or nx3, only x and y are used)
+    :param polygon: np.array mx2 (or mx3)
+    :return: boolean np.array (n,)
+    """
+    px = xy[:, 0]
+    py = xy[:, 1]
+    crossing = np.zeros(len(xy), dtype=np.int64)
+    vertex_num = len(polygon)
+    for i in range(vertex_num):
+        j = (i + 1) % vertex_num
+        xi, yi = polygon[i, 0], polygon[i, 1]
+        xj, yj = polygon[j, 0], polygon[j, 1]
+        cross = ((yi < py) & (yj >= py)) | ((yj < py) & (yi >= py))
+        if not cross.any():
+            continue
+        node_x = xi + (py[cross] - yi) / (yj - yi) * (xj - xi)
+        crossing[cross] += node_x < px[cross]
+
+    return crossing % 2 == 1
+
+
+def points_in_polygons(points, polygons, z_range=None, cell_size=None):
+    """
+    find which polygons each point falls in, the points are binned into a uniform grid once,
+    and only the points in the cells touched by polygon bbox are tested
+    :param points: np.array nx3
+    :param polygons: PolygonSet
+    :param z_range: (z_min, z_max), points out of the range are ignored, same as SelectionPolygonVolume
+    :param cell_size: grid cell size, default is the median side length of polygon bboxes
+    :return: point_id, polygon_id
+        the pairs of (point index, polygon index) that point inside polygon, sorted by polygon then point.
+        a point can appear more than once if the polygons overlap
+    """
+    points = np.asarray(points)
+    if len(points) == 0 or len(polygons) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    if cell_size is None:
+        bbox_len = polygons.bboxes[:, 2:4] - polygons.bboxes[:, 0:2]
+        cell_size = np.median(bbox_len.max(axis=1))
+    grid = GridIndex(points, cell_size)
+
+    point_id = []
+    polygon_id = []
+    for i in range(len(polygons)):
+        candidate = grid.query(polygons.bboxes[i])
+        if len(candidate) == 0:
+            continue
+        inside = points_in_polygon(points[candidate], polygons[i])
+        if z_range is not None:
+            z = points[candidate, 2]
+            inside &= (z >= z_range[0]) & (z <= z_range[1])
+        point_id.append(candidate[inside])
+        polygon_id.append(np.full(inside.sum(), i, dtype=np.int64))
+
+    if len(point_id) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    point_id = np.concatenate(point_id)
+    polygon_id = np.concatenate(polygon_id)
+    # one sort to group by polygon, keep the point order inside each polygon
+    order = np.lexsort((point_id, polygon_id))
+
+    return point_id[order], polygon_id[order]
+
+
+class STRtree(object):
+    """
+    Static R-tree of 2D bounding boxes, packed by Sort-Tile-Recursive (STR) algorithm.
+    Queries are vectorized level by level, no python loop over boxes.
+
+    Variables:
+        bboxes -> np.array nx4 (x_min, y_min, x_max, y_max) of items
+        item_order -> np.array (n,), the items in leaf order
+        levels -> [leaves, ..., root], each level is a dict
+            {'bboxes': np.array kx4, 'start': np.array (k,), 'end': np.array (k,)}
+            start, end are the child range in the lower level (or in item_order for leaves)
+    """
+
+    def __init__(self, bboxes, node_capacity=10):
+        self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self.node_capacity = node_capacity
+        self.levels = []
+
+        item_num = len(self.bboxes)
+        self.item_order = self._str_order(self.bboxes)
+        if item_num == 0:
+            return
+
+        # leaves
+        start = np.arange(0, item_num, node_capacity)
+        end = np.minimum(start + node_capacity, item_num)
+        level_bboxes = self._reduce_bboxes(self.bboxes[self.item_order], start)
+
+        # pack the nodes level by level until only one root left
+        while True:
+            self.levels.append({'bboxes': level_bboxes, 'start': start, 'end': end})
+            node_num = len(level_bboxes)
+            if node_num == 1:
+                break
+            order = self._str_order(level_bboxes)
+            lower = self.levels[-1]
+            for key in ['bboxes', 'start', 'end']:
+                lower[key] = lower[key][order]
+
+            start = np.arange(0, node_num, node_capacity)
+            end = np.minimum(start + node_capacity, node_num)
+            level_bboxes = self._reduce_bboxes(lower['bboxes'], start)
+
+        self.levels = self.levels[::-1]   # root first
+
+    def _str_order(self, bboxes):
+        # sort by x center into vertical slices, then sort by y center inside each slice
+        num = len(bboxes)
+        if num == 0:
+            return np.empty(0, dtype=np.int64)
+        leaf_num = int(np.ceil(num / self.node_capacity))
+        slice_size = int(np.ceil(np.sqrt(leaf_num))) * self.node_capacity
+
+        x_center = (bboxes[:, 0] + bboxes[:, 2]) / 2
+        y_center = (bboxes[:, 1] + bboxes[:, 3]) / 2
+        x_order = np.argsort(x_center, kind='stable')
+        slice_id = np.empty(num, dtype=np.int64)
+        slice_id[x_order] = np.arange(num) // slice_size
+
+        return np.lexsort((y_center, slice_id))
+
+    @staticmethod
+    def _reduce_bboxes(bboxes, start):
+        return np.hstack([np.minimum.reduceat(bboxes[:, 0:2], start, axis=0),
+                          np.maximum.reduceat(bboxes[:, 2:4], start, axis=0)])
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def query(self, bbox):
+        """
+        :param bbox: (x_min, y_min, x_max, y_max)
+        :return: sorted indices of the items whose bounding box intersects with bbox
+        """
+        if len(self.levels) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        nodes = np.arange(len(self.levels[0]['bboxes']))
+        for level in self.levels:
+            nodes = nodes[bbox_intersect(level['bboxes'][nodes], bbox)]
+            nodes = ranges_to_indices(level['start'][nodes], level['end'][nodes])
+
+        items = self.item_order[nodes]
+        items = items[bbox_intersect(self.bboxes[items], bbox)]
+
+        return np.sort(items)
+
+
+class PolygonSet(object):
+    """
+    Compact storage of many polygons, e.g. the plot boundaries read from shp files
+
+    Variables:
+        vertices -> np.array nx3, vertices of all polygons packed together
+
+        offsets -> np.array (m+1,), vertices of polygon i are vertices[offsets[i]:offsets[i+1]]
+
+        names -> np.array (m,) of polygon names
+
+        bboxes -> np.array mx4 (x_min, y_min, x_max, y_max) of each polygon
+
+        tree -> STRtree of bboxes, to find polygons overlapping a region without linear scan
+    """
+
+    def __init__(self, names, polygons, node_capacity=10):
+        """
+        :param names: list of polygon names
+        :param polygons: list of np.array shape=[n x 3] (or [n x 2])
+        """
+        self.names = np.asarray(names, dtype=str)
+        point_num = [len(polygon) for polygon in polygons]
+        self.offsets = np.cumsum([0] + point_num).astype(np.int64)
+
+        self.vertices = np.zeros((self.offsets[-1], 3))
+        for i, polygon in enumerate(polygons):
+            polygon = np.asarray(polygon, dtype=np.float64)
+            self.vertices[self.offsets[i]:self.offsets[i + 1], 0:polygon.shape[1]] = polygon
+
+        if len(polygons) > 0:
+            starts = self.offsets[:-1]
+            self.bboxes = np.hstack([np.minimum.reduceat(self.vertices[:, 0:2], starts, axis=0),
+                                     np.maximum.reduceat(self.vertices[:, 0:2], starts, axis=0)])
+        else:
+            self.bboxes = np.empty((0, 4))
+        self.tree = STRtree(self.bboxes, node_capacity=node_capacity)
+
+    @classmethod
+    def from_dict(cls, shp_dict, node_capacity=10):
+        # the dict returned by io.shp.read_shp()
+        return cls(list(shp_dict.keys()), list(shp_dict.values()), node_capacity=node_capacity)
+
+    def to_dict(self):
+        return {name: self[i].copy() for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        # view of the vertices of polygon i
+        return self.vertices[self.offsets[i]:self.offsets[i + 1]]
+
+    def __repr__(self):
+        return f'PolygonSet with {len(self)} polygons and {len(self.vertices)} vertices.'
+
+    def keys(self):
+        return list(self.names)
+
+    def query(self, bbox):
+        """
+        :param bbox: (x_min, y_min, x_max, y_max), e.g. the bounding box of point tile
+        :return: sorted indices of polygons whose bounding box overlaps with bbox
+        """
+        return self.tree.query(bbox)
@@ -0,0 +1,169 @@
+import numpy as np
+
+
+def colors_to_uint8(rgb):
+    # float colors in [0, 1] to 0-255, integer colors are kept
+    rgb = np.asarray(rgb)
+    if np.issubdtype(rgb.dtype, np.integer):
+        return rgb.astype(np.uint8)
+    return np.clip(np.rint(rgb * 255), 0, 255).astype(np.uint8)
+
+
+class HeightRaster(object):
+    """
+    The highest point of each cell of a regular xy grid (DSM), and the color of that point (DOM).
+    Points are added chunk by chunk, only the rasters are kept in memory, so the rasters of clouds
+    larger than RAM can be built from memory-mapped or streamed chunks.
+    The cell of a point is (floor(x / res), floor(y / res)) - origin. Of the points with the same highest z
+    in one cell, the last added one gives the color, so the result does not depend on the chunk size.
+
+    Variables:
+        res -> cell size
+        origin -> np.array (2,) int, floor(x_min / res), floor(y_min / res)
+        shape -> (nx, ny), ceil((xy_max - xy_min) / res) + 1
+        dsm -> np.array (nx, ny) float32, the highest z, nan for empty cells
+        dom -> np.array (nx, ny, 4) uint8, RGBA of the highest point, alpha is 255 for occupied cells
+    """
+
+    def __init__(self, xy_min, xy_max, res, dtype=np.float32):
+        """
+        :param xy_min, xy_max: the xy bounds of all the points that will be added
+        :param res: cell size
+        :param dtype: dtype of dsm
+        """
+        xy_min = np.asarray(xy_min, dtype=np.float64)
+        xy_max = np.asarray(xy_max, dtype=np.float64)
+        if not res > 0:
+            raise ValueError(f'The raster resolution should be positive, not [{res}]')
+        self.res = res
+        self.origin = np.floor(xy_min / res).astype(np.int64)
+        self.shape = tuple(int(n) for n in np.ceil((xy_max - xy_min) / res).astype(np.int64) + 1)
+        self.dsm = np.full(self.shape, np.nan, dtype=dtype)
+        self.dom = np.zeros(self.shape + (4,), dtype=np.uint8)
+
+    def cell_index(self, xy):
+        """
+        :param xy: np.array nx2 (or nx3, only x and y are used)
+        :return: np.array nx2 int, the (i, j) cell of each point
+        """
+        cell = np.floor(np.asarray(xy)[:, 0:2] / self.res).astype(np.int64) - self.origin
+        np.clip(cell[:, 0], 0, self.shape[0] - 1, out=cell[:, 0])
+        np.clip(cell[:, 1], 0, self.shape[1] - 1, out=cell[:, 1])
+        return cell
+
+    def add(self, xyz, rgb=None):
+        """
+        reduce one chunk of points into the rasters
+        :param xyz: np.array nx3
+        :param rgb: np.array nx3, float in [0, 1] or uint8, None to leave the colors 0
+        """
+        if len(xyz) == 0:
+            return
+        cell = self.cell_index(xyz)
+        linear = cell[:, 0] * self.shape[1] + cell[:, 1]
+        z = np.asarray(xyz)[:, 2].astype(self.dsm.dtype)
+
+        # sort by cell then z (stable), the last point of each cell is its highest
+        order = np.lexsort((z, linear))
+        linear = linear[order]
+        last = np.append(linear[1:] != linear[:-1], True)
+        top = order[last]
+        cells = linear[last]
+
+        # compare with the previous chunks, nan (empty) cells are always updated
+        dsm_flat = self.dsm.reshape(-1)
+        update = ~(dsm_flat[cells] > z[top])
+        top, cells = top[update], cells[update]
+        dsm_flat[cells] = z[top]
+
+        dom_flat = self.dom.reshape(-1, 4)
+        if rgb is not None:
+            dom_flat[cells, 0:3] = colors_to_uint8(np.asarray(rgb)[top])
+        dom_flat[cells, 3] = 255
+
+    @property
+    def occupied(self):
+        return self.dom[:, :, 3] > 0
+
+
+def disk_half_widths(radius):
+    """
+    :return: row offsets and the half width of each row of the disk kernel,
+        the same pixels as skimage.morphology.disk(radius) (dx^2 + dy^2 <= radius^2)
+    """
+    offsets = np.arange(-radius, radius + 1)
+    return offsets, np.floor(np.sqrt(radius ** 2 - offsets ** 2)).astype(np.int64)
+
+
+def fill_holes(image, valid, mask, radius=7, strip_rows=None, max_bytes=256 * 2 ** 20):
+    """
+    Normalized convolution with a disk kernel, only at the masked pixels:
+        filled value = sum of valid pixels in the disk / number of valid pixels in the disk
+    The disk sums are read from the prefix sums along each row (2 * radius + 1 lookups per masked pixel),
+    all the channels are summed together. The image is processed in strips of rows,
+    so only the prefix sums of one strip are kept in memory.
+    :param image: np.array (nx, ny) or (nx, ny, c), float (e.g. DSM with nan) or integer (e.g. DOM)
+    :param valid: bool np.array (nx, ny), the pixels with values, the others are not used
+    :param mask: bool np.array (nx, ny), the pixels to fill
+    :param radius: radius of disk kernel in pixels
+    :param strip_rows: number of rows processed at once, default is chosen by image width and max_bytes
+    :param max_bytes: approximate memory limit of one strip (prefix sums and sums of masked pixels)
+    :return: out_img, filled
+        out_img -> copy of image, the filled pixels are replaced (rounded for integer images)
+        filled -> bool np.array (nx, ny), the masked pixels that have valid pixels in the disk
+    """
+    image = np.asarray(image)
+    data = image if image.ndim == 3 else image[:, :, None]
+    nx, ny, channel = data.shape
+    out_img = image.copy()
+    out_data = out_img if out_img.ndim == 3 else out_img[:, :, None]
+    filled = np.zeros((nx, ny), dtype=bool)
+    offsets, half_widths = disk_half_widths(radius)
+
+    if strip_rows is None:
+        # float64 prefix sums of values, float32 prefix counts (exact below 2^24 pixels),
+        # and at most one float64 sum and two int64 indices for each masked pixel
+        row_bytes = (ny + 1) * (channel * 8 + 4) + ny * (channel * 8 + 8 + 16)
+        strip_rows = max(int(max_bytes // row_bytes) - 2 * radius, 1)
+
+    for a in range(0, nx, strip_rows):
+        b = min(a + strip_rows, nx)
+        rows, cols = np.nonzero(mask[a:b])
+        if len(rows) == 0:
+            continue
+        rows += a
+
+        # prefix sums along y of the values and the valid count, for the strip rows and radius around,
+        # accumulated in place, the first column is 0
+        lo, hi = max(a - radius, 0), min(b + radius, nx)
+        invalid = ~valid[lo:hi]
+        prefix = np.empty((hi - lo, ny + 1, channel))
+        prefix[:, 0] = 0
+        prefix[:, 1:] = data[lo:hi]
+        prefix[:, 1:][invalid] = 0
+        np.cumsum(prefix[:, 1:], axis=1, out=prefix[:, 1:])
+        prefix_count = np.empty((hi - lo, ny + 1), dtype=np.float32)
+        prefix_count[:, 0] = 0
+        np.cumsum(~invalid, axis=1, dtype=np.float32, out=prefix_count[:, 1:])
+        del invalid
+
+        total = np.zeros((len(rows), channel))
+        count = np.zeros(len(rows))
+        for dx, half in zip(offsets, half_widths):
+            r = rows + dx
+            inside = (r >= 0) & (r < nx)
+            r = r[inside] - lo
+            c0 = np.clip(cols[inside] - half, 0, ny)
+            c1 = np.clip(cols[inside] + half + 1, 0, ny)
+            total[inside] += prefix[r, c1] - prefix[r, c0]
+            count[inside] += prefix_count[r, c1] - prefix_count[r, c0]
+        del prefix, prefix_count
+
+        has_value = count > 0
+        mean = total[has_value] / count[has_value, None]
+        if np.issubdtype(out_data.dtype, np.integer):
+            mean = np.rint(mean)
+        out_data[rows[has_value], cols[has_value]] = mean
+        filled[rows[has_value], cols[has_value]] = True
+
+    return out_img, filled
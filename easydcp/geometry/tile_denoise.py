@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from easydcp.geometry.grid_index import GridIndex
+
+
+def tile_index(xyz, halo, tile_size=None, tile_points=200000):
+    """
+    split the xy plane into square tiles, the tiles are the cells of a GridIndex,
+    one tile index can be shared by several filters on the same points (use the keep mask to select a subset)
+    :param xyz: np.array nx3
+    :param halo: the search radius of the filters, tiles are at least 4 times of it
+    :param tile_size: side length of tiles, default is the size that one tile has about tile_points points
+    :return: GridIndex
+    """
+    xyz = np.asarray(xyz)
+    if tile_size is None:
+        if len(xyz) > 0:
+            xy_len = xyz[:, 0:2].max(axis=0) - xyz[:, 0:2].min(axis=0)
+            area = max(xy_len[0], halo) * max(xy_len[1], halo)
+        else:
+            area = 0
+        tile_size = np.sqrt(area * tile_points / max(len(xyz), 1))
+    tile_size = max(tile_size, 4 * halo)
+    return GridIndex(xyz, tile_size)
+
+
+def _tile_tasks(grid, keep):
+    # the core points of each non-empty tile, and the bbox of the tile
+    counts = np.diff(grid.cell_start)
+    tasks = []
+    for cell in np.flatnonzero(counts):
+        core = grid.order[grid.cell_start[cell]:grid.cell_start[cell + 1]]
+        if keep is not None:
+            core = core[keep[core]]
+        if len(core) == 0:
+            continue
+        cx, cy = cell % grid.shape[0], cell // grid.shape[0]
+        x0, y0 = grid.xy_min + np.array([cx, cy]) * grid.cell_size
+        tasks.append((core, (x0, y0, x0 + grid.cell_size, y0 + grid.cell_size)))
+    return tasks
+
+
+def _tile_neighbors(xyz, grid, keep, bbox, halo):
+    # the kept points inside the tile bbox expanded by halo
+    near = grid.query((bbox[0] - halo, bbox[1] - halo, bbox[2] + halo, bbox[3] + halo))
+    if keep is not None:
+        near = near[keep[near]]
+    near_xy = xyz[near, 0:2]
+    inside = (near_xy[:, 0] >= bbox[0] - halo) & (near_xy[:, 0] <= bbox[2] + halo) & \
+             (near_xy[:, 1] >= bbox[1] - halo) & (near_xy[:, 1] <= bbox[3] + halo)
+    return near[inside]
+
+
+def _run_tiles(func, tasks, workers):
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(*t) for t in tasks]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda t: func(*t), tasks))
+
+
+def radius_outlier(xyz, nb_points, radius, grid=None, keep=None, workers=1):
+    """
+    the same as o3d.geometry.PointCloud.remove_radius_outlier(), but the points are filtered tile by tile,
+    each tile searches its own points with the points within radius around it (halo = radius).
+    :param xyz: np.array nx3
+    :param nb_points: min number of other points within radius to keep the point
+    :param radius: search radius
+    :param grid: GridIndex from tile_index(), built if not given
+    :param keep: boolean np.array (n,), only these points are filtered and counted as neighbors, None for all
+    :param workers: number of threads to filter tiles concurrently
+    :return: boolean np.array (n,), the kept points
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    if grid is None:
+        grid = tile_index(xyz, radius)
+    # open3d (nanoflann) counts the neighbors strictly inside the radius
+    radius_inner = np.nextafter(radius, 0)
+
+    def count_tile(core, bbox):
+        near = _tile_neighbors(xyz, grid, keep, bbox, radius)
+        return cKDTree(xyz[near]).query_ball_point(xyz[core], radius_inner, return_length=True)
+
+    tasks = _tile_tasks(grid, keep)
+    kept = np.zeros(len(xyz), dtype=bool)
+    for (core, _), counts in zip(tasks, _run_tiles(count_tile, tasks, workers)):
+        kept[core] = counts > nb_points   # the counts include the point itself
+    return kept
+
+
+def statistical_outlier(xyz, nb_neighbors, std_ratio, halo, grid=None, keep=None, workers=1):
+    """
+    the same as o3d.geometry.PointCloud.remove_statistical_outlier(), but the mean distance to the
+    nb_neighbors nearest points is calculated tile by tile. A point whose k-th neighbor is farther than the halo
+    may miss the neighbors out of the halo, it is searched again with a larger halo, so the result is exact.
+    The threshold (mean + std_ratio * std of the mean distances) is calculated over all tiles.
+    :param xyz: np.array nx3
+    :param nb_neighbors: number of nearest points (including itself)
+    :param std_ratio:
+    :param halo: the first search margin around tiles, e.g. the radius of the following radius_outlier()
+    :param grid: GridIndex from tile_index(), built if not given
+    :param keep: boolean np.array (n,), only these points are filtered and counted as neighbors, None for all
+    :param workers: number of threads to filter tiles concurrently
+    :return: boolean np.array (n,), the kept points
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    if grid is None:
+        grid = tile_index(xyz, halo)
+    point_num = len(xyz) if keep is None else int(keep.sum())
+    kept = np.zeros(len(xyz), dtype=bool)
+    if point_num == 0:
+        return kept
+
+    def mean_distance_tile(core, bbox):
+        mean_dist = np.empty(len(core))
+        pending = np.arange(len(core))
+        tile_halo = halo
+        while len(pending) > 0:
+            near = _tile_neighbors(xyz, grid, keep, bbox, tile_halo)
+            dist, _ = cKDTree(xyz[near]).query(xyz[core[pending]], k=nb_neighbors)
+            dist = dist.reshape(len(pending), -1)
+            kth = dist[:, -1]
+            # exact if the k-th neighbor is inside the halo, or all the points are searched
+            done = (kth <= tile_halo) if len(near) < point_num else np.ones(len(pending), dtype=bool)
+            finite = np.isfinite(dist[done])
+            mean_dist[pending[done]] = np.where(finite, dist[done], 0).sum(axis=1) / finite.sum(axis=1)
+            pending = pending[~done]
+            far = kth[~done]
+            tile_halo = max(tile_halo * 2, far[np.isfinite(far)].max(initial=0))
+        return mean_dist
+
+    tasks = _tile_tasks(grid, keep)
+    mean_dist = np.zeros(len(xyz))
+    for (core, _), tile_dist in zip(tasks, _run_tiles(mean_distance_tile, tasks, workers)):
+        mean_dist[core] = tile_dist
+
+    valid = np.ones(len(xyz), dtype=bool) if keep is None else keep
+    cloud_mean = mean_dist[valid].mean()
+    cloud_std = mean_dist[valid].std(ddof=1) if point_num > 1 else 0
+    kept[valid] = (mean_dist[valid] > 0) & (mean_dist[valid] < cloud_mean + std_ratio * cloud_std)
+    return kept
@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# the 26 neighbor offsets, the first 13 are the "forward" half used to find each edge once
+NEIGHBOR_OFFSETS = np.array([off for off in product([-1, 0, 1], repeat=3) if off != (0, 0, 0)])
+NEIGHBOR_OFFSETS = np.vstack([NEIGHBOR_OFFSETS[13:], NEIGHBOR_OFFSETS[:13][::-1]])
+
+
+def components(node_num, edge_a, edge_b):
+    # connected component label of each node, by scipy union of the edges
+    if node_num == 0:
+        return 0, np.empty(0, dtype=np.int64)
+    graph = coo_matrix((np.ones(len(edge_a), dtype=np.int8), (edge_a, edge_b)), shape=(node_num, node_num))
+    return connected_components(graph, directed=False)
+
+
+class VoxelGrid3D(object):
+    """
+    Occupied eps-sized voxels of points, the voxels are sorted by key = (i * ny + j) * nz + k,
+    so the voxels with the same x index i are continuous
+
+    Variables:
+        keys -> np.array (v,) sorted keys of occupied voxels
+        ijk -> np.array vx3 voxel index of each occupied voxel
+        counts -> np.array (v,) point number of each voxel
+        point_voxel -> np.array (n,) the voxel of each point
+        dims -> (nx, ny, nz)
+    """
+
+    def __init__(self, xyz, voxel_size):
+        xyz = np.asarray(xyz)
+        xyz_min = xyz.min(axis=0).astype(np.float64)
+        ijk = np.floor((xyz - xyz_min) / voxel_size).astype(np.int64)
+        self.dims = ijk.max(axis=0) + 1
+        self.keys, self.point_voxel, self.counts = np.unique(self.encode(ijk), return_inverse=True,
+                                                             return_counts=True)
+        self.ijk = self.decode(self.keys)
+
+    def encode(self, ijk):
+        return (ijk[:, 0] * self.dims[1] + ijk[:, 1]) * self.dims[2] + ijk[:, 2]
+
+    def decode(self, keys):
+        return np.stack([keys // (self.dims[1] * self.dims[2]), (keys // self.dims[2]) % self.dims[1],
+                         keys % self.dims[2]], axis=1)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def neighbor(self, voxels, offset):
+        """
+        :param voxels: np.array of voxel ids
+        :param offset: (di, dj, dk)
+        :return: np.array of the neighbor voxel id of each voxel, -1 if not occupied
+        """
+        ijk = self.ijk[voxels] + offset
+        inside = np.all((ijk >= 0) & (ijk < self.dims), axis=1)
+        found = np.full(len(voxels), -1, dtype=np.int64)
+        keys = self.encode(ijk[inside])
+        pos = np.searchsorted(self.keys, keys)
+        pos[pos == len(self.keys)] = 0
+        hit = self.keys[pos] == keys
+        found[np.flatnonzero(inside)[hit]] = pos[hit]
+        return found
+
+
+def _tile_components(grid, core, lo, hi):
+    """
+    connect the core voxels of one tile [lo, hi), the edges to the core voxels out of this tile are returned
+    :return: local component number, local component label of each core voxel in tile, cross edges (global ids)
+    """
+    tile_core = np.flatnonzero(core[lo:hi]) + lo
+    local_id = np.full(hi - lo, -1, dtype=np.int64)
+    local_id[tile_core - lo] = np.arange(len(tile_core))
+
+    edge_a, edge_b, cross_a, cross_b = [], [], [], []
+    for offset in NEIGHBOR_OFFSETS[:13]:
+        found = grid.neighbor(tile_core, offset)
+        keep = found >= 0
+        keep[keep] = core[found[keep]]
+        source, target = tile_core[keep], found[keep]
+        inner = (target >= lo) & (target < hi)
+        edge_a.append(local_id[source[inner] - lo])
+        edge_b.append(local_id[target[inner] - lo])
+        cross_a.append(source[~inner])
+        cross_b.append(target[~inner])
+
+    comp_num, comp_label = components(len(tile_core), np.concatenate(edge_a), np.concatenate(edge_b))
+    return comp_num, comp_label, np.concatenate(cross_a), np.concatenate(cross_b)
+
+
+def voxel_dbscan(xyz, eps, min_points, tile_voxels=None, workers=1):
+    """
+    Grid approximation of DBSCAN, for large point clouds:
+        points are binned into eps-sized voxels, the voxels with at least min_points points are core voxels,
+        the core voxels touching each other (26-neighborhood) are one cluster, the other occupied voxels
+        join the cluster of a neighboring core voxel, or are noise if no core voxel around.
+    The voxels are split into tiles along x, each tile is connected by a worker thread, then the clusters
+    touching across tile boundaries are merged.
+    :param xyz: np.array nx3
+    :param eps: voxel size, the same meaning as eps of DBSCAN
+    :param min_points: min points of a core voxel
+    :param tile_voxels: tile width in voxels along x, None to split into about 4 tiles for each worker
+    :param workers: number of threads
+    :return: np.array (n,) labels, -1 for noise, clusters are numbered by their first point
+    """
+    xyz = np.asarray(xyz)
+    if len(xyz) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    grid = VoxelGrid3D(xyz, eps)
+    core = grid.counts >= min_points
+
+    # tiles are continuous voxel ranges, because voxels are sorted by x index first
+    nx = grid.dims[0]
+    if tile_voxels is None:
+        tile_voxels = max(1, int(np.ceil(nx / (4 * max(workers, 1)))))
+    tile_x = np.arange(0, nx + tile_voxels, tile_voxels)
+    bounds = np.searchsorted(grid.ijk[:, 0], tile_x)
+    tiles = [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+    if workers <= 1 or len(tiles) <= 1:
+        tile_results = [_tile_components(grid, core, lo, hi) for lo, hi in tiles]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            tile_results = list(executor.map(lambda t: _tile_components(grid, core, *t), tiles))
+
+    # boundary merge: the tile components are nodes, and the cross-tile edges connect them
+    voxel_comp = np.full(len(grid), -1, dtype=np.int64)
+    comp_base = 0
+    for (lo, hi), (comp_num, comp_label, _, _) in zip(tiles, tile_results):
+        voxel_comp[np.flatnonzero(core[lo:hi]) + lo] = comp_label + comp_base
+        comp_base += comp_num
+    cross_a = np.concatenate([r[2] for r in tile_results])
+    cross_b = np.concatenate([r[3] for r in tile_results])
+    _, merged = components(comp_base, voxel_comp[cross_a], voxel_comp[cross_b])
+    voxel_label = np.full(len(grid), -1, dtype=np.int64)
+    voxel_label[core] = merged[voxel_comp[core]]
+
+    # border voxels take the cluster of the first core neighbor
+    border = np.flatnonzero(~core)
+    for offset in NEIGHBOR_OFFSETS:
+        if len(border) == 0:
+            break
+        found = grid.neighbor(border, offset)
+        hit = found >= 0
+        hit[hit] = core[found[hit]]
+        voxel_label[border[hit]] = voxel_label[found[hit]]
+        border = border[~hit]
+
+    labels = voxel_label[grid.point_voxel]
+
+    # number the clusters by their first point, the labels do not depend on tiles or workers
+    clustered = np.flatnonzero(labels >= 0)
+    if len(clustered) > 0:
+        cluster_ids, first = np.unique(labels[clustered], return_index=True)
+        rank = np.empty(cluster_ids.max() + 1, dtype=np.int64)
+        rank[cluster_ids[np.argsort(first)]] = np.arange(len(cluster_ids))
+        labels[clustered] = rank[labels[clustered]]
+
+    return labels
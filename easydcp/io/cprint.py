@@ -17,10 +17,20 @@ FOREGROUND_YELLOW = 0x0e # yellow.
 # 背景颜色定义 background colors
 BACKGROUND_YELLOW = 0xe0 # yellow.
  
+# ANSI escape code for linux and mac terminals
+ANSI_COLORS = {FOREGROUND_BLUE: '\033[94m', FOREGROUND_GREEN: '\033[92m', FOREGROUND_RED: '\033[91m',
+               FOREGROUND_YELLOW: '\033[93m', BACKGROUND_YELLOW | FOREGROUND_RED: '\033[91;103m'}
+
 # get handle
-std_out_handle = ctypes.windll.kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
+if sys.platform == 'win32':
+    std_out_handle = ctypes.windll.kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
+else:
+    std_out_handle = None
  
 def set_cmd_text_color(color, handle=std_out_handle):
+    if handle is None:
+        sys.stdout.write(ANSI_COLORS.get(color, '\033[0m'))
+        return True
     Bool = ctypes.windll.kernel32.SetConsoleTextAttribute(handle, color)
     return Bool
  
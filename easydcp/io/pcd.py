@@ -1,67 +1,331 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 import open3d as o3d
 import numpy as np
 from warnings import warn
 from plyfile import PlyData
-from easydcp.pcd_tools import merge_pcd
+from easydcp.pcd_tools import merge_pcd, build_pcd
 
-def read_ply(file_path, unit='m'):
+UNIT_DIVIDER = {'m': 1, 'dm': 10, 'cm': 100, 'mm': 1000, 'km': 0.001}
+
+
+def get_unit_divider(unit):
+    if not isinstance(unit, str) or unit not in UNIT_DIVIDER.keys():
+        raise TypeError(f'Cannot use [{unit}] as unit, please only tape m, cm, mm, or km.')
+    return UNIT_DIVIDER[unit]
+
+
+def check_unit(pcd_xyz, unit):
+    len_xyz = pcd_xyz.max(axis=0) - pcd_xyz.min(axis=0)
+    short = len_xyz.min()
+    if short > 100:
+        warn(f'The shortest axis is {round(short)} m, please check if the unit is wrong! (current use [{unit}])')
+
+
+def read_ply_colors(cloud_data):
     """
+    find the color fields of ply vertex data, and convert them to float in [0, 1]
+    :param cloud_data: numpy structured array of ply vertex element
+    :return: numpy.array nx3 object, or None if no color fields
+    """
+    ply_names = cloud_data.dtype.names
+    for prefix in ['', 'diffuse_']:
+        fields = [f'{prefix}red', f'{prefix}green', f'{prefix}blue']
+        if all(f in ply_names for f in fields):
+            colors = np.empty((len(cloud_data), 3))
+            for i, f in enumerate(fields):
+                col = cloud_data[f]
+                if np.issubdtype(col.dtype, np.integer):
+                    # 8 bit colors for most of the sfm software, 16 bit for some of the laser scanners
+                    scale = 255 if col.dtype.itemsize == 1 else np.iinfo(col.dtype).max
+                    np.divide(col, scale, out=colors[:, i])
+                else:
+                    colors[:, i] = col
+            return colors
+
+    print('Can not find color info in ', ply_names)
+    return None
+
+
+def read_ply(file_path, unit='m', normals='lazy'):
+    """
+    read xyz, colors (red or diffuse_red) and normals (if have) in one pass of ply file
     :param file_path:
     :param unit: 'm', 'cm', 'mm', 'km'
-    :return:
+    :param normals: False, 'lazy' or True
+        False: normals are ignored, even they are saved in the ply file
+        'lazy': load the normals saved in ply file, otherwise leave them empty,
+                functions need normals will call pcd_tools.ensure_normals() to estimate them
+        True: load the normals saved in ply file, otherwise estimate them immediately
+    :return: o3d.geometry.PointCloud
     """
-    pcd = o3d.io.read_point_cloud(file_path)
-    if not pcd.has_colors():
+    divider = get_unit_divider(unit)
+    if normals not in [False, 'lazy', True]:
+        raise KeyError(f'Only False, "lazy" and True are acceptable for normals parameters, not [{normals}]')
+
+    if os.path.splitext(file_path)[-1].lower() != '.ply':
+        # other formats supported by open3d, e.g. *.pcd, *.xyzrgb
+        pcd = o3d.io.read_point_cloud(file_path)
+        pcd_xyz = np.asarray(pcd.points)   # shares the memory with open3d
+        if divider != 1:
+            pcd_xyz /= divider
+        if not normals and pcd.has_normals():
+            pcd.normals = o3d.utility.Vector3dVector()
+    else:
         cloud_ply = PlyData.read(file_path)
         cloud_data = cloud_ply.elements[0].data
         ply_names = cloud_data.dtype.names
 
-        if 'red' in ply_names:
-            colors = np.vstack((cloud_data['red'] / 255, cloud_data['green'] / 255, cloud_data['blue'] / 255)).T
-            pcd.colors = o3d.utility.Vector3dVector(colors)
-        elif 'diffuse_red' in ply_names:
-            colors = np.vstack((cloud_data['diffuse_red'] / 255, cloud_data['diffuse_green'] / 255,
-                                cloud_data['diffuse_blue'] / 255)).T
-            pcd.colors = o3d.utility.Vector3dVector(colors)
-        else:
-            print('Can not find color info in ', ply_names)
-
-    if unit == 'm':
-        divider = 1
-    elif unit == 'dm':
-        divider = 10
-    elif unit == 'cm':
-        divider = 100
-    elif unit == 'mm':
-        divider = 1000
-    elif unit == 'km':
-        divider = 0.001
-    else:
-        raise TypeError(f'Cannot use [{unit}] as unit, please only tape m, cm, mm, or km.')
+        pcd_xyz = np.empty((len(cloud_data), 3))
+        for i, f in enumerate(['x', 'y', 'z']):
+            np.divide(cloud_data[f], divider, out=pcd_xyz[:, i])  # cm to m
 
-    pcd.points = o3d.utility.Vector3dVector(np.asarray(pcd.points) / divider)  # cm to m
-    pcd.estimate_normals()
+        pcd_rgb = read_ply_colors(cloud_data)
+
+        pcd_nml = None
+        if normals and all(f in ply_names for f in ['nx', 'ny', 'nz']):
+            pcd_nml = np.empty((len(cloud_data), 3))
+            for i, f in enumerate(['nx', 'ny', 'nz']):
+                pcd_nml[:, i] = cloud_data[f]
+
+        del cloud_ply, cloud_data
+        pcd = build_pcd(pcd_xyz, pcd_rgb, pcd_nml)
+
+    if normals is True and not pcd.has_normals():
+        pcd.estimate_normals()
 
     # check units
-    pcd_xyz = np.asarray(pcd.points)
-    len_xyz = pcd_xyz.max(axis=0) - pcd_xyz.min(axis=0)
-    short = len_xyz.min()
-    if short > 100:
-        warn(f'The shortest axis is {round(short)} m, please check if the unit is wrong! (current use [{unit}])')
+    check_unit(pcd_xyz, unit)
 
     return pcd
 
-def read_plys(file_list, unit='m'):
+PLY_DTYPES = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+              'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+              'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+              'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+
+
+def read_ply_header(file_path):
+    """
+    parse the ply header without reading the data body
+    :param file_path:
+    :return: ply_format (str), elements [(name, count, [(property, dtype or None for list)]), ...], header_size
+    """
+    elements = []
+    ply_format = None
+    with open(file_path, 'rb') as f:
+        if f.readline().strip() != b'ply':
+            raise IOError(f'[{file_path}] is not a ply file')
+        while True:
+            line = f.readline()
+            if len(line) == 0:
+                raise IOError(f'[{file_path}] has no "end_header" line')
+            words = line.decode('ascii', errors='ignore').split()
+            if len(words) == 0 or words[0] in ['comment', 'obj_info']:
+                continue
+            if words[0] == 'format':
+                ply_format = words[1]
+            elif words[0] == 'element':
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == 'property':
+                if words[1] == 'list':
+                    elements[-1][2].append((words[-1], None))
+                else:
+                    elements[-1][2].append((words[2], PLY_DTYPES[words[1]]))
+            elif words[0] == 'end_header':
+                header_size = f.tell()
+                break
+
+    return ply_format, elements, header_size
+
+
+class FieldStack(object):
+    """
+    nx3 stack of three memory-mapped fields which are not saved continuously (or have different dtypes),
+    the rows are only copied into RAM when they are indexed, e.g. stack[chunk]
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.dtype = np.result_type(*columns)
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    @property
+    def shape(self):
+        return len(self), 3
+
+    def __getitem__(self, item):
+        if isinstance(item, tuple):
+            rows, col = item
+            return self[rows][:, col]
+        out = np.empty((len(self.columns[0][item]), 3), dtype=self.dtype)
+        for i, column in enumerate(self.columns):
+            out[:, i] = column[item]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        # the whole stack, only used when explicitly converted by np.asarray()
+        out = self[:]
+        return out if dtype is None else out.astype(dtype)
+
+
+class PlyVertexView(object):
+    """
+    Memory-mapped vertex block of binary ply file, vertices are kept on disk and only
+    the selected subsets are copied into RAM (e.g. by select_by_index)
+
+    Variables:
+        data -> numpy.memmap structured array, one field for each vertex property
+
+        xyz_raw -> numpy.array nx3 view of x, y, z in the unit of file, if they are saved continuously
+                   with the same dtype, otherwise a FieldStack, no copy in both cases
+
+        points -> numpy.array nx3 of x, y, z in meters
+                  zero-copy if unit='m' and x, y, z saved continuously with the same dtype,
+                  otherwise a scaled float64 copy of the whole cloud,
+                  use xyz(indices) or iter_xyz() to read chunks instead
+
+        rgb -> numpy.array nx3 uint8 view (or FieldStack) of red, green, blue (or diffuse_red, ...),
+               None if no colors
+
+        divider -> the unit divider, applied when points are copied out
+    """
+
+    def __init__(self, file_path, unit='m'):
+        self.file_path = file_path
+        self.unit = unit
+        self.divider = get_unit_divider(unit)
+
+        ply_format, elements, offset = read_ply_header(file_path)
+        if ply_format == 'binary_little_endian':
+            byte_order = '<'
+        elif ply_format == 'binary_big_endian':
+            byte_order = '>'
+        else:
+            raise TypeError(f'Only binary ply can be memory-mapped, [{file_path}] is {ply_format}, '
+                            f'please use read_ply() instead')
+
+        for name, count, properties in elements:
+            if any(dtype is None for _, dtype in properties):
+                if name == 'vertex':
+                    raise TypeError(f'List property in vertex element of [{file_path}] is not supported')
+                raise TypeError(f'Element "{name}" with list property is saved before vertex in [{file_path}]')
+            dtype = np.dtype([(p, byte_order + dtype) for p, dtype in properties])
+            if name == 'vertex':
+                self.data = np.memmap(file_path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+                break
+            offset += dtype.itemsize * count
+        else:
+            raise TypeError(f'[{file_path}] has no vertex element')
+
+        self.xyz_raw = self._field_view(['x', 'y', 'z'])
+        if self.xyz_raw is None:
+            raise TypeError(f'[{file_path}] has no x, y, z vertex properties')
+
+        self.rgb = None
+        for prefix in ['', 'diffuse_']:
+            self.rgb = self._field_view([f'{prefix}red', f'{prefix}green', f'{prefix}blue'])
+            if self.rgb is not None:
+                break
+
+    def _field_view(self, fields):
+        names = self.data.dtype.names
+        if not all(f in names for f in fields):
+            return None
+        types = [self.data.dtype.fields[f][0] for f in fields]
+        offsets = [self.data.dtype.fields[f][1] for f in fields]
+        itemsize = types[0].itemsize
+        if all(t == types[0] for t in types) and offsets == [offsets[0] + i * itemsize for i in range(3)]:
+            # saved continuously, view the three fields as one nx3 array without copy
+            first = self.data[fields[0]]
+            return np.lib.stride_tricks.as_strided(first, shape=(len(first), 3),
+                                                   strides=(first.strides[0], itemsize), writeable=False)
+        else:
+            return FieldStack([self.data[f] for f in fields])
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f'PlyVertexView of "{self.file_path}" with {len(self)} points.'
+
+    @property
+    def points(self):
+        if self.divider == 1 and isinstance(self.xyz_raw, np.ndarray):
+            return self.xyz_raw
+        else:
+            return self.xyz(slice(None))
+
+    def xyz(self, indices=slice(None)):
+        # float64 copy of selected points, in meters
+        return np.divide(self.xyz_raw[indices], self.divider, dtype=np.float64)
+
+    def iter_xyz(self, chunk_size=10000000):
+        # float64 copy of each chunk of points, in meters
+        for start in range(0, len(self), chunk_size):
+            yield self.xyz(slice(start, start + chunk_size))
+
+    def colors(self, indices=slice(None)):
+        # float64 copy of selected colors, in [0, 1]
+        if self.rgb is None:
+            return None
+        rgb = self.rgb[indices]
+        if np.issubdtype(rgb.dtype, np.integer):
+            return np.divide(rgb, 255 if rgb.dtype.itemsize == 1 else np.iinfo(rgb.dtype).max)
+        else:
+            return rgb.astype(np.float64)
+
+    def has_colors(self):
+        return self.rgb is not None
+
+    def select_by_index(self, indices):
+        """
+        :param indices: numpy.array of int indices or boolean mask
+        :return: o3d.geometry.PointCloud of the selected vertices
+        """
+        return build_pcd(self.xyz(indices), self.colors(indices))
+
+    def to_pcd(self):
+        return self.select_by_index(slice(None))
+
+
+def read_ply_mmap(file_path, unit='m'):
+    """
+    memory-map the vertices of binary ply file
+    :param file_path:
+    :param unit: 'm', 'cm', 'mm', 'km'
+    :return: PlyVertexView
+    """
+    view = PlyVertexView(file_path, unit=unit)
+    if len(view) > 0:
+        # check units by the first block, avoid reading the whole file
+        check_unit(view.xyz(slice(0, 1000000)), unit)
+    return view
+
+
+def read_plys(file_list, unit='m', normals='lazy', workers=None):
     """
     read a bunch of ply (e.g. two ply), and merge them into one (without registration, just add x,y,z one by one)
     :param file_list: ['file1.ply', 'file2.ply']
+    :param workers: number of threads to read ply files concurrently,
+        None for the cpu number, 1 to read one by one
     :return: o3d.geometry.pointclouds
     """
-    pcd_list = []
-    for file_path in file_list:
-        pcd_list.append(read_ply(file_path, unit=unit))
+    if workers is None:
+        workers = os.cpu_count()
+    workers = max(1, min(workers, len(file_list)))
+
+    if workers == 1:
+        pcd_list = [read_ply(file_path, unit=unit, normals=normals) for file_path in file_list]
+    else:
+        # file reading and numpy copies release the GIL, threads are enough
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pcd_list = list(executor.map(lambda file_path: read_ply(file_path, unit=unit, normals=normals),
+                                         file_list))
 
     return merge_pcd(pcd_list)
 
 def write_ply(file_path):
-    pass
\ No newline at end of file
+    pass
@@ -2,12 +2,15 @@ import shapefile
 import os
 import warnings
 import numpy as np
+from easydcp.geometry.polygon_set import PolygonSet
 
-def read_shp(shp_path, correct_coord=None):
+def read_shp(shp_path, correct_coord=None, packed=False):
     """
     convert shape file to corrected numpy ndarray
     :param shp_path: string
     :param correct_coord: (x, y, z) tuple
+    :param packed: if true, return geometry.polygon_set.PolygonSet (packed vertices, offsets, names, bboxes
+                   and STRtree bbox index) instead of dict
     :return: dict with polygon name as keys
     """
     shp = shapefile.Reader(shp_path)
@@ -16,14 +19,15 @@ def read_shp(shp_path, correct_coord=None):
     if correct_coord is None:
         correct_coord = (0, 0, 0)
 
-    for i, shape in enumerate(shp.shapes()):
-        plot_name = shp.records()[i][-1]
+    # iterate the shapes and records together, instead of reading the whole attribute table for each shape
+    for shape_record in shp.iterShapeRecords():
+        plot_name = shape_record.record[-1]
         if isinstance(plot_name, str):
             plot_name = plot_name.replace(r'/', '_')
             plot_name = plot_name.replace(r'\\', '_')
         else:
             plot_name = str(plot_name)
-        coord_np = np.asarray(shape.points)
+        coord_np = np.asarray(shape_record.shape.points, dtype=np.float64)
         # correct
         if correct_coord is not None:
             coord_np[:, 0] -= correct_coord[0]
@@ -32,9 +36,14 @@ def read_shp(shp_path, correct_coord=None):
 
         shp_dict[plot_name] = coord_np
 
-    return shp_dict
+    shp.close()
 
-def read_shps(shp_list, correct_coord=None, rename=True):
+    if packed:
+        return PolygonSet.from_dict(shp_dict)
+    else:
+        return shp_dict
+
+def read_shps(shp_list, correct_coord=None, rename=True, packed=False):
     """
     read several shp file into one dict with corrected numpy
     :param shp_list:
@@ -43,6 +52,7 @@ def read_shps(shp_list, correct_coord=None, rename=True):
                    the same name, it will be overwrited.
                    e.g. if you ensure all polygon name is totally different, set rename=False
                         if polygon name start from 0 - n in each shp file, set rename=True
+    :param packed: if true, return geometry.polygon_set.PolygonSet instead of dict
     :return: dict with polygon name as keys
     """
     shp_dict = {}
@@ -72,7 +82,10 @@ def read_shps(shp_list, correct_coord=None, rename=True):
     if len(shp_dict) != total_len:
         warnings.warn(f"the total polygon number({len(shp_dict)}) is not same as the sum of all shp files({total_len})")
 
-    return shp_dict
+    if packed:
+        return PolygonSet.from_dict(shp_dict)
+    else:
+        return shp_dict
     
 def read_xyz(file_path):
     with open(file_path, 'r') as f:
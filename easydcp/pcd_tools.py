@@ -1,10 +1,14 @@
 import numpy as np
 import open3d as o3d
-import pandas as pd
+from scipy.sparse import coo_matrix
 from scipy.spatial import ConvexHull
+try:
+    from scipy.spatial import QhullError
+except ImportError:   # scipy < 1.8
+    from scipy.spatial.qhull import QhullError
 from matplotlib.path import Path
-from skimage.morphology import disk
-from skimage import filters
+
+from easydcp.geometry.raster import HeightRaster, fill_holes
 
 def calculate_xyz_volume(pcd):
     pcd_xyz = np.asarray(pcd.points)
@@ -15,22 +19,60 @@ def calculate_xyz_volume(pcd):
 
     return x_len * y_len * z_len
 
-def merge_pcd(pcd_list):
-    final_pcd = o3d.geometry.PointCloud()
-    xyz = np.empty((0, 3))
-    rgb = np.empty((0, 3))
+def build_pcd(xyz, rgb=None, normals=None):
+    """
+    build o3d.geometry.PointCloud from numpy arrays, only one copy into open3d
+    :param xyz: np.array shape=[n x 3]
+    :param rgb: np.array shape=[n x 3] in [0, 1], optional
+    :param normals: np.array shape=[n x 3], optional
+    """
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(np.ascontiguousarray(xyz, dtype=np.float64))
+    if rgb is not None:
+        pcd.colors = o3d.utility.Vector3dVector(np.ascontiguousarray(rgb, dtype=np.float64))
+    if normals is not None:
+        pcd.normals = o3d.utility.Vector3dVector(np.ascontiguousarray(normals, dtype=np.float64))
 
-    for pcd in pcd_list:
-        pcd_xyz = np.asarray(pcd.points)
-        pcd_rgb = np.asarray(pcd.colors)
+    return pcd
 
-        xyz = np.vstack([xyz, pcd_xyz])
-        rgb = np.vstack([rgb, pcd_rgb])
+def select_pcd(pcd, indices):
+    """
+    the same as pcd.select_by_index(indices), but indexing by numpy without converting indices to python list
+    :param indices: np.array of int indices, or boolean mask
+    """
+    pcd_rgb = np.asarray(pcd.colors)[indices] if pcd.has_colors() else None
+    pcd_nml = np.asarray(pcd.normals)[indices] if pcd.has_normals() else None
 
-    final_pcd.points = o3d.utility.Vector3dVector(xyz)
-    final_pcd.colors = o3d.utility.Vector3dVector(rgb)
+    return build_pcd(np.asarray(pcd.points)[indices], pcd_rgb, pcd_nml)
 
-    return final_pcd
+def ensure_normals(pcd):
+    # normals are not estimated when reading ply by default (normals='lazy'), estimate them when required
+    if not pcd.has_normals():
+        pcd.estimate_normals()
+    return pcd
+
+def merge_pcd(pcd_list):
+    """
+    merge point clouds into one, the output arrays are pre-sized by the point number of each pcd,
+    and each pcd is copied only once
+    colors and normals are kept if all the pcd in pcd_list have them
+    """
+    point_num = [len(pcd.points) for pcd in pcd_list]
+    offsets = np.cumsum([0] + point_num)
+
+    xyz = np.empty((offsets[-1], 3))
+    rgb = np.empty((offsets[-1], 3)) if all(pcd.has_colors() for pcd in pcd_list) else None
+    nml = np.empty((offsets[-1], 3)) if all(pcd.has_normals() for pcd in pcd_list) else None
+
+    for i, pcd in enumerate(pcd_list):
+        start, end = offsets[i], offsets[i + 1]
+        xyz[start:end] = np.asarray(pcd.points)
+        if rgb is not None:
+            rgb[start:end] = np.asarray(pcd.colors)
+        if nml is not None:
+            nml[start:end] = np.asarray(pcd.normals)
+
+    return build_pcd(xyz, rgb, nml)
 
 def build_cut_boundary(polygon, z_range):
     """
@@ -72,7 +114,8 @@ def get_convex_hull(pcd, dim='2d'):
     # 24.0
     # >>> hull.volume
     # 8.0
-    pcd_xyz = np.asarray(pcd.points)
+    # pcd can also be the np.array nx3 of points
+    pcd_xyz = pcd if isinstance(pcd, np.ndarray) else np.asarray(pcd.points)
     if dim == '2d' or dim == '2D':
         xy = pcd_xyz[:, 0:2]
         hull = ConvexHull(xy)
@@ -88,100 +131,123 @@ def get_convex_hull(pcd, dim='2d'):
 def round2val(a, round_val):
     return np.floor( np.array(a, dtype=float) / round_val) * round_val
 
-def pcd2dxm(pcd, dens=1, interp=True):
-    # dens = how many points per pixel, default is 1 (highest resolution)
-    rua = pd.DataFrame(np.hstack([np.asarray(pcd.points), np.asarray(pcd.colors)*255]), columns=['x','y','z','r', 'g', 'b'])
-    rua_len = rua.max() - rua.min()
-    
-    grid_num = int(np.ceil(len(rua) / dens))
+def iter_pcd_chunks(pcd, chunk_size=10000000):
+    """
+    :param pcd: o3d.geometry.PointCloud, or io.pcd.PlyVertexView of memory-mapped ply file
+    :param chunk_size: number of points in each chunk
+    :return: generator of (xyz, rgb) of each chunk, rgb is float in [0, 1] or uint8, None if no colors
+        only one chunk is copied into RAM at a time for PlyVertexView
+    """
+    if isinstance(pcd, o3d.geometry.PointCloud):
+        pcd_xyz = np.asarray(pcd.points)
+        pcd_rgb = np.asarray(pcd.colors) if pcd.has_colors() else None
+        for start in range(0, len(pcd_xyz), chunk_size):
+            yield pcd_xyz[start:start + chunk_size], \
+                None if pcd_rgb is None else pcd_rgb[start:start + chunk_size]
+    else:
+        for start in range(0, len(pcd), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            if pcd.rgb is not None and pcd.rgb.dtype == np.uint8:
+                rgb = np.asarray(pcd.rgb[chunk])
+            else:
+                rgb = pcd.colors(chunk)
+            yield pcd.xyz(chunk), rgb
+
+def chunk_hull_vertices(xyz):
+    """
+    :param xyz: np.array nx3 (or nx2) of one chunk
+    :return: np.array mx2, xy points whose convex hull is the hull of the chunk, for a degenerate chunk
+        (less than 3 points, collinear or duplicated xy), the points of min / max x and y
+    """
+    xy = np.asarray(xyz)[:, 0:2]
+    if len(xy) >= 3:
+        try:
+            return get_convex_hull(xy, dim='2d')[0]
+        except QhullError:
+            pass
+    extremes = np.concatenate([xy.argmin(axis=0), xy.argmax(axis=0)])
+    return xy[np.unique(extremes)]
+
+def pcd2dxm(pcd, dens=1, interp=True, chunk_size=10000000, interp_radius=7):
+    """
+    DOM (orthomosaic) and DSM of the point cloud, each pixel takes the highest point in it.
+    The points are rasterized chunk by chunk in two passes (bounds, then rasters), so the whole field
+    larger than RAM can be used by read_ply_mmap().
+    :param pcd: o3d.geometry.PointCloud, or io.pcd.PlyVertexView by read_ply_mmap()
+    :param dens: how many points per pixel, default is 1 (highest resolution)
+    :param interp: fill the empty pixels inside the convex hull of points (both DOM and DSM)
+        by the mean of the occupied pixels around, see geometry.raster.fill_holes()
+    :param chunk_size: number of points rasterized at once
+    :param interp_radius: radius of the disk around the empty pixels, in pixels
+    :return: dom, dsm
+        dom -> np.array (x_num, y_num, 4) uint8 RGBA, alpha is 0 for empty pixels
+        dsm -> np.array (x_num, y_num) float32, the highest z, nan for empty pixels
+    """
+    # the first pass: bounds, and the convex hull vertices of each chunk (the hull of them is the hull of all)
+    xy_min, xy_max = np.full(2, np.inf), np.full(2, -np.inf)
+    point_num = 0
+    hull_vertices = []
+    for xyz, _ in iter_pcd_chunks(pcd, chunk_size):
+        xy_min = np.minimum(xy_min, xyz[:, 0:2].min(axis=0))
+        xy_max = np.maximum(xy_max, xyz[:, 0:2].max(axis=0))
+        point_num += len(xyz)
+        if interp:
+            hull_vertices.append(chunk_hull_vertices(xyz))
+
+    grid_num = int(np.ceil(point_num / dens))
     # x/res * y/res = grid_num
     # x * y / res^2 = grid_num
     # x * y / grid_num = res^2
-    res = np.sqrt(rua_len['x'] * rua_len['y'] / grid_num)
-    
-    x_num = int(np.ceil(rua_len['x'] / res))
-    y_num = int(np.ceil(rua_len['y'] / res))
-    
-    rua['x_round'] = round2val(rua['x'], res)
-    rua['y_round'] = round2val(rua['y'], res)
-    
-    rua['x_pos'] = rua['x_round'] / res
-    rua['y_pos'] = rua['y_round'] / res
-    x_pos_min = rua['x_pos'].min()
-    y_pos_min = rua['y_pos'].min()
-    rua['x_pos'] = rua['x_pos'] - x_pos_min
-    rua['y_pos'] = rua['y_pos'] - y_pos_min
-    
-    group_xy = rua.groupby(['x_round', 'y_round'])
-    group_mean = group_xy['z'].max()
-    idx = group_xy['z'].transform(max) == rua['z']
-    rua_grid = rua[idx]
-    
-    dsm = np.ones((x_num+1, y_num+1)) * np.nan
-    dsm[rua['x_pos'].astype(int), rua['y_pos'].astype(int)] = rua['z']
-    
-    dom = np.zeros((x_num+1, y_num+1, 4))
-    dom[rua['x_pos'].astype(int), rua['y_pos'].astype(int), 0] = rua['r']
-    dom[rua['x_pos'].astype(int), rua['y_pos'].astype(int), 1] = rua['g']
-    dom[rua['x_pos'].astype(int), rua['y_pos'].astype(int), 2] = rua['b']
-    dom[rua['x_pos'].astype(int), rua['y_pos'].astype(int), 3] = 255
-    dom = dom.astype(np.uint8)
-    
-    del rua, rua_grid, group_xy, group_mean
-    
+    xy_len = xy_max - xy_min
+    res = np.sqrt(xy_len[0] * xy_len[1] / grid_num)
+
+    # the second pass: per-pixel highest point
+    raster = HeightRaster(xy_min, xy_max, res)
+    for xyz, rgb in iter_pcd_chunks(pcd, chunk_size):
+        raster.add(xyz, rgb)
+    dom, dsm = raster.dom, raster.dsm
+
     if interp:
         # find the boundary of point clouds
-        plane_hull, _ = get_convex_hull(pcd, dim='2d')
+        plane_hull, _ = get_convex_hull(np.vstack(hull_vertices), dim='2d')
         plane_hull = np.vstack([plane_hull, plane_hull[0, :]])
-        plane_hull = round2val(plane_hull, res) / res
-        plane_hull = np.int_(plane_hull)
-
-        plane_hull[:, 0] = plane_hull[:, 0] - int(x_pos_min)
-        plane_hull[:, 1] = plane_hull[:, 1] - int(y_pos_min)
+        plane_hull = raster.cell_index(plane_hull)
+        x_num, y_num = raster.shape[0] - 1, raster.shape[1] - 1
 
         # find all the empty pixels
-        holes = np.argwhere(dom[:,:,3]==0)
-        
+        holes = np.argwhere(~raster.occupied)
+
         # find all the empty pixels in the boundary to aviod unncessary calculation
         path = Path(plane_hull)
         grid = path.contains_points(holes)
         holes_in = holes[grid]
         # and its mask
-        mask = np.zeros((x_num+1, y_num+1))
-        mask[holes_in[:,0], holes_in[:,1]] = 1
-        mask = mask==1
-        
-        # interp the DOM
-        r = dom[:,:,0]
-        g = dom[:,:,1]
-        b = dom[:,:,2]
-
-        r_filter = filters.rank.mean(r, selem=disk(7))#, mask=mask)
-        g_filter = filters.rank.mean(g, selem=disk(7))#, mask=mask)
-        b_filter = filters.rank.mean(b, selem=disk(7))#, mask=mask)
-
-        r[mask] = r_filter[mask]
-        g[mask] = g_filter[mask]
-        b[mask] = b_filter[mask]
-        
-        del r_filter, g_filter, b_filter
-        a = dom[:,:,3].copy()
-        a[mask] = 255
-        dom_new = np.stack([r,g,b,a], axis=2)
-
-        # interp the DSM
-        #[To be continued, because]
-        # Filter.rank.mean only support 
-        # > ValueError: Images of type float must be between -1 and 1.
-
-        dom_new = dom_new.astype(np.uint8)
-        
-        return dom_new, dsm
+        mask = np.zeros((x_num+1, y_num+1), dtype=bool)
+        mask[holes_in[:,0], holes_in[:,1]] = True
+
+        # interp the DOM colors and DSM together, by the mean of the occupied pixels around
+        layers = np.concatenate([dom[:, :, 0:3], dsm[:, :, None]], axis=2).astype(np.float32)
+        layers, filled = fill_holes(layers, raster.occupied, mask, radius=interp_radius)
+
+        dom_new = dom.copy()
+        dom_new[filled, 0:3] = np.rint(layers[filled, 0:3])
+        dom_new[filled, 3] = 255
+        dsm_new = dsm.copy()
+        dsm_new[filled] = layers[filled, 3]
+
+        return dom_new, dsm_new
     else:
         return dom, dsm
 
-def pcd2binary(pcd, dpi=10):
-    # dpi suggest < 20
+def pcd2pixels(pcd, dpi=10):
+    """
+    the occupied pixels of the X-Y projection, without building the image
+    :param pcd: o3d.geometry.PointCloud
+    :param dpi: suggest < 20
+    :return: pixels, img_shape, px_num_per_cm, left_top_corner
+        pixels -> np.array nx2 int (row, col) of the unique occupied pixels, row is along Y, col is along X
+        img_shape -> (rows, cols) of the binary image by pcd2binary()
+    """
     pcd_xyz = np.asarray(pcd.points)
     # !!!! notice !!!!
     # in numpy image system, Y axis is 0, X axis is 1
@@ -195,47 +261,158 @@ def pcd2binary(pcd, dpi=10):
     height = int(np.ceil(y_length_m * 100 * px_num_per_cm))
     ref_x = (x - x.min()) / x_length_m * width
     ref_y = (y - y.min()) / y_length_m * height
-    ref_pos = np.vstack([ref_x, ref_y]).T.astype(int)
-    ref_pos_rm_dup = np.unique(ref_pos, axis=0)
-
-    out_img = np.zeros((width + 1, height + 1))
-    out_img[ref_pos_rm_dup[:, 0], ref_pos_rm_dup[:, 1]] = 1
-    out_img = out_img.astype(int)
+    ref_x = ref_x.astype(np.int64)
+    ref_y = ref_y.astype(np.int64)
+
+    # unique by the linear pixel index, sorted in the same (row, col) order as np.unique(axis=0)
+    cols = height + 1
+    linear = ref_x * cols + ref_y
+    if (width + 1) * cols <= 8 * len(linear):
+        # a bool mask of all pixels is not larger than the index array, and no sorting is needed
+        occupied = np.zeros((width + 1) * cols, dtype=bool)
+        occupied[linear] = True
+        linear = np.flatnonzero(occupied)
+    else:
+        linear = np.unique(linear)
+    pixels = np.stack([linear // cols, linear % cols], axis=1)
 
     left_top_corner = (y.min(), x.min())
 
+    return pixels, (width + 1, height + 1), px_num_per_cm, left_top_corner
+
+def pixels2binary(pixels, img_shape, dtype=int, sparse=False):
+    """
+    :param dtype: dtype of the image, e.g. np.uint8 or bool to save memory
+    :param sparse: return scipy.sparse.coo_matrix of the occupied pixels instead of the dense image
+    """
+    if sparse:
+        return coo_matrix((np.ones(len(pixels), dtype=dtype), (pixels[:, 0], pixels[:, 1])), shape=img_shape)
+    out_img = np.zeros(img_shape, dtype=dtype)
+    out_img[pixels[:, 0], pixels[:, 1]] = 1
+    return out_img
+
+def pcd2binary(pcd, dpi=10, dtype=int, sparse=False):
+    """
+    the binary image of X-Y projection
+    :param dpi: suggest < 20
+    :param dtype: dtype of the image, the default int is int64, np.uint8 or bool use 1/8 of the memory
+    :param sparse: if True, out_img is a scipy.sparse.coo_matrix, only the occupied pixels (.row, .col) are stored,
+        the dense image is not allocated
+    :return: out_img, px_num_per_cm, left_top_corner
+    """
+    pixels, img_shape, px_num_per_cm, left_top_corner = pcd2pixels(pcd, dpi)
+    out_img = pixels2binary(pixels, img_shape, dtype=dtype, sparse=sparse)
+
     return out_img, px_num_per_cm, left_top_corner
 
-def pcd2voxel(pcd, part=100, voxel_size=None):
-    pcd_xyz = np.asarray(pcd.points)
-    points_num = pcd_xyz.shape[0]  # get the size of this plot
-    if voxel_size is None:
-        x_max = pcd_xyz[:, 0].max()
-        x_min = pcd_xyz[:, 0].min()
-        x_len = x_max - x_min
+def pixel_region_props(pixels):
+    """
+    the region properties of one region from its pixel coordinates, by the image moments,
+    the same as skimage.measure.regionprops(binary_image, coordinates='xy')[0] (scikit-image 0.15)
+    :param pixels: np.array nx2 (row, col) of unique pixels
+    :return: centroid, major_axis_length, minor_axis_length, orientation
+        centroid -> (row, col)
+        major_axis_length, minor_axis_length -> in pixels, the axes of the ellipse with the same second moments
+        orientation -> radians in [-pi/2, pi/2], the angle from the col axis to the major axis,
+            counter-clockwise when the image is shown with rows downward
+    """
+    pixels = np.asarray(pixels, dtype=np.float64)
+    centroid = pixels.mean(axis=0)
+    diff = pixels - centroid
+    var_row = (diff[:, 0] ** 2).mean()
+    var_col = (diff[:, 1] ** 2).mean()
+    cov = (diff[:, 0] * diff[:, 1]).mean()
+
+    # eigenvalues of the inertia tensor [[var_col, -cov], [-cov, var_row]]
+    half_sum = (var_row + var_col) / 2
+    half_diff = np.sqrt(((var_row - var_col) / 2) ** 2 + cov ** 2)
+    major = 4 * np.sqrt(max(half_sum + half_diff, 0))
+    minor = 4 * np.sqrt(max(half_sum - half_diff, 0))
+
+    if var_col == var_row:
+        orientation = -np.pi / 4 if cov > 0 else np.pi / 4
+    else:
+        orientation = -0.5 * np.arctan2(2 * cov, var_col - var_row)
+
+    return (centroid[0], centroid[1]), major, minor, orientation
 
-        y_max = pcd_xyz[:, 1].max()
-        y_min = pcd_xyz[:, 1].min()
-        y_len = y_max - y_min
+def iter_xyz_chunks(pcd_xyz, chunk_size=10000000):
+    """
+    :param pcd_xyz: np.array nx3, or io.pcd.PlyVertexView (each chunk is read and scaled to meters)
+    :return: generator of np.array of each chunk, views for np.array
+    """
+    if isinstance(pcd_xyz, np.ndarray):
+        for start in range(0, len(pcd_xyz), chunk_size):
+            yield pcd_xyz[start:start + chunk_size]
+    else:
+        yield from pcd_xyz.iter_xyz(chunk_size)
 
-        z_max = pcd_xyz[:, 2].max()
-        z_min = pcd_xyz[:, 2].min()
-        z_len = z_max - z_min
+def xyz_bounds(pcd_xyz, chunk_size=10000000):
+    # min and max of x, y, z (float64), chunk by chunk
+    xyz_min, xyz_max = np.full(3, np.inf), np.full(3, -np.inf)
+    for xyz in iter_xyz_chunks(pcd_xyz, chunk_size):
+        xyz_min = np.minimum(xyz_min, xyz.min(axis=0))
+        xyz_max = np.maximum(xyz_max, xyz.max(axis=0))
+    return xyz_min, xyz_max
 
+def count_voxels(pcd_xyz, voxel_size, chunk_size=10000000, bounds=None):
+    """
+    :param pcd_xyz: np.array nx3, or io.pcd.PlyVertexView read chunk by chunk
+    :param bounds: (xyz_min, xyz_max) if already known
+    """
+    # the same voxel index as open3d voxel_down_sample(): floor((p - (min_bound - voxel_size/2)) / voxel_size)
+    xyz_min, xyz_max = xyz_bounds(pcd_xyz, chunk_size) if bounds is None else bounds
+    min_bound = np.asarray(xyz_min, dtype=np.float64) - voxel_size * 0.5
+    max_bound = np.asarray(xyz_max, dtype=np.float64) + voxel_size * 0.5
+    dims = np.floor((max_bound - min_bound) / voxel_size).astype(np.int64) + 1
+
+    keys = []
+    for xyz in iter_xyz_chunks(pcd_xyz, chunk_size):
+        ids = np.floor((xyz - min_bound) / voxel_size).astype(np.int64)
+        keys.append(np.unique((ids[:, 0] * dims[1] + ids[:, 1]) * dims[2] + ids[:, 2]))
+
+    return len(np.unique(np.concatenate(keys)))
+
+def voxel_stats(pcd_xyz, part=100, voxel_size=None, chunk_size=10000000):
+    """
+    voxel size and the point density of occupied voxels, counted by integer voxel keys only
+    (no open3d VoxelGrid or voxel_down_sample)
+    :param pcd_xyz: np.array nx3, or io.pcd.PlyVertexView, which is read chunk by chunk (never copied as a whole)
+    :param part: how many part of the shortest axis will be split, used if voxel_size is None
+    :param voxel_size: use this voxel size directly
+    :return: dict {'voxel_size', 'voxel_density', 'voxel_number'}
+    """
+    points_num = len(pcd_xyz)  # get the size of this plot
+    bounds = xyz_bounds(pcd_xyz, chunk_size)
+    if voxel_size is None:
         # param part: how many part of the shortest axis will be split?
-        vs = min(x_len, y_len, z_len) / part  # Voxel Size (VS)
+        len_xyz = bounds[1] - bounds[0]
+        vs = float(len_xyz.min()) / part  # Voxel Size (VS)
     else:
         vs = voxel_size
+    # the same number of points as pcd.voxel_down_sample(voxel_size=vs)
+    voxel_num = count_voxels(pcd_xyz, vs, chunk_size, bounds=bounds)
+    voxel_density = points_num / voxel_num
+
+    return {'voxel_size':vs, 'voxel_density': voxel_density, 'voxel_number': voxel_num}
+
+def pcd2voxel(pcd, part=100, voxel_size=None, build_grid=True):
+    """
+    :param pcd: o3d.geometry.PointCloud or io.pcd.PlyVertexView
+    :param build_grid: whether build the o3d.geometry.VoxelGrid,
+        use voxel_stats() directly if only the voxel params are needed
+    :return: pcd_voxel (None if not build_grid or pcd is not o3d.geometry.PointCloud), voxel_params
+    """
+    pcd_xyz = np.asarray(pcd.points) if isinstance(pcd, o3d.geometry.PointCloud) else pcd
+    voxel_params = voxel_stats(pcd_xyz, part=part, voxel_size=voxel_size)
     # convert point cloud to voxel
     # !! Doesn't work in Open3D 0.9.0.0 !!
     # > pcd_voxel = o3d.geometry.VoxelGrid().create_from_point_cloud(pcd, voxel_size=vs)
     # > voxel_num = len(pcd_voxel.voxels)
-    pcd_voxel = o3d.geometry.VoxelGrid().create_from_point_cloud(pcd, voxel_size=vs)
-
-    pcd_vx = pcd.voxel_down_sample(voxel_size=vs) # 63012
-    voxel_num = np.asarray(pcd_vx.points).shape[0]
-    voxel_density = points_num / voxel_num
-
-    voxel_params = {'voxel_size':vs, 'voxel_density': voxel_density, 'voxel_number': voxel_num}
+    if build_grid and isinstance(pcd, o3d.geometry.PointCloud):
+        pcd_voxel = o3d.geometry.VoxelGrid().create_from_point_cloud(pcd, voxel_size=voxel_params['voxel_size'])
+    else:
+        # memory-mapped points (io.pcd.PlyVertexView) are not converted to open3d objects
+        pcd_voxel = None
 
-    return pcd_voxel, voxel_params
\ No newline at end of file
+    return pcd_voxel, voxel_params
@@ -1,8 +1,10 @@
 import numpy as np
 from copy import copy
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.patches import Ellipse
-from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d import Axes3D   # registers the '3d' projection
 import mpl_toolkits.mplot3d.art3d as art3d
 from scipy.stats import gaussian_kde
 
@@ -144,8 +146,10 @@ def draw_3d_results(plant, title, savepath, dpi=300):
     # -=-=-=-=-=-=-=
     # | draw plots |
     # -=-=-=-=-=-=-=
-    fig = plt.figure(figsize=(9, 6), dpi=dpi)
-    ax = Axes3D(fig, elev=25, azim=135, rect=(0, 0.07, 1, 0.95), box_aspect=(4,4,3)) #box_aspect long x-axis: 8,4,3 | long y-axis: 4,10,3
+    # the figure is not registered in pyplot, so Plot.get_traits() threads can draw plants at the same time
+    fig = Figure(figsize=(9, 6), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes((0, 0.07, 1, 0.95), projection='3d', elev=25, azim=135, box_aspect=(4,4,3)) #box_aspect long x-axis: 8,4,3 | long y-axis: 4,10,3
 
     # zorder 2,3
     # plot the ground on Y-Z
@@ -185,7 +189,7 @@ def draw_3d_results(plant, title, savepath, dpi=300):
             label='min area rectangle')
 
     # plot the ellipse of region props
-    ell = Ellipse((x0, y0), plant.major_axis, plant.minor_axis, phi,
+    ell = Ellipse((x0, y0), plant.major_axis, plant.minor_axis, angle=phi,
                   alpha=0.2, zorder=0, label='region props')
     ax.add_patch(ell)
     art3d.pathpatch_2d_to_3d(ell, z=z_axis_min, zdir="z")
@@ -245,8 +249,6 @@ def draw_3d_results(plant, title, savepath, dpi=300):
 
     ax.set_title(title, size=20)
 
-    plt.legend(ncol=5, loc='lower center', bbox_to_anchor=(0.5, -0.07))
-    plt.savefig(savepath)
-    plt.clf()
-    plt.close(fig)
+    ax.legend(ncol=5, loc='lower center', bbox_to_anchor=(0.5, -0.07))
+    fig.savefig(savepath)
     del fig, ax
\ No newline at end of file
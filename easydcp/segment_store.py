@@ -0,0 +1,254 @@
+import numpy as np
+import open3d as o3d
+
+from easydcp.geometry.grid_index import ranges_to_indices
+from easydcp.pcd_tools import build_pcd
+
+
+class SegmentStore(object):
+    """
+    Columnar store of the segments of one class, used as Plot.pcd_segmented[kind].
+    The points of all segments are kept in one contiguous array, and segment i is the rows
+    [starts[i], ends[i]) of it. Reordering or filtering segments only permutes the (starts, ends) offsets,
+    the points are not copied. The store behaves like a list of o3d.geometry.PointCloud,
+    each PointCloud is built only when it is read (and then cached).
+
+    Variables:
+        xyz -> np.array nx3, the points of all segments
+        rgb -> np.array nx3 or None
+        normals -> np.array nx3 or None
+        starts -> np.array (s,), the first row of each segment
+        ends -> np.array (s,), the row after the last of each segment
+        names -> np.array (s,) of str, or None if the segments are named by their position
+
+    The per-segment summary (see summary()) is calculated once and follows the segments when they are
+    reordered or filtered.
+    """
+    # z percentiles in the summary
+    summary_percentiles = (5, 50, 95)
+
+    def __init__(self, xyz, rgb=None, normals=None, sizes=None, starts=None, ends=None, names=None, cache=None,
+                 summary=None):
+        """
+        :param sizes: point number of each segment, the segments are continuous rows in order
+        :param starts, ends: the row ranges of segments, used if sizes is None. Repeated or overlapping ranges
+            are allowed, but reduced slower
+        :param names: list of str, optional
+        """
+        self.xyz = np.asarray(xyz)
+        self.rgb = None if rgb is None else np.asarray(rgb)
+        self.normals = None if normals is None else np.asarray(normals)
+        if sizes is not None:
+            self.ends = np.cumsum(np.asarray(sizes, dtype=np.int64))
+            self.starts = self.ends - np.asarray(sizes, dtype=np.int64)
+        elif starts is not None and ends is not None:
+            self.starts = np.asarray(starts, dtype=np.int64)
+            self.ends = np.asarray(ends, dtype=np.int64)
+        else:
+            raise TypeError('Either sizes or (starts, ends) should be given')
+        self.names = None if names is None else np.asarray(names, dtype=object)
+        # PointCloud of each built segment, keyed by its row range, shared by the reordered stores
+        self._cache = {} if cache is None else cache
+        self._summary = summary
+
+    @classmethod
+    def from_pcd_list(cls, pcd_list, names=None):
+        """
+        copy a list of o3d.geometry.PointCloud into one store,
+        colors and normals are kept if all the non-empty point clouds have them
+        """
+        sizes = [len(pcd.points) for pcd in pcd_list]
+        filled = [pcd for pcd in pcd_list if len(pcd.points) > 0]
+        if len(filled) == 0:
+            return cls(np.empty((0, 3)), sizes=sizes, names=names)
+        xyz = np.vstack([np.asarray(pcd.points) for pcd in filled])
+        rgb = np.vstack([np.asarray(pcd.colors) for pcd in filled]) \
+            if all(pcd.has_colors() for pcd in filled) else None
+        normals = np.vstack([np.asarray(pcd.normals) for pcd in filled]) \
+            if all(pcd.has_normals() for pcd in filled) else None
+        return cls(xyz, rgb, normals, sizes=sizes, names=names)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, item):
+        """
+        :param item: int -> o3d.geometry.PointCloud of the segment
+                     slice, list or np.array of int / bool -> SegmentStore of the selected segments (no copy)
+        """
+        if isinstance(item, (int, np.integer)):
+            return self.to_pcd(item)
+        if not isinstance(item, slice):
+            item = np.asarray(item)
+            if item.dtype != bool:
+                item = item.astype(np.int64)
+        return SegmentStore(self.xyz, self.rgb, self.normals, starts=self.starts[item], ends=self.ends[item],
+                            names=None if self.names is None else self.names[item], cache=self._cache,
+                            summary=None if self._summary is None else
+                            {key: value[item] for key, value in self._summary.items()})
+
+    def __repr__(self):
+        return f'SegmentStore with {len(self)} segments of {int(self.sizes.sum())} points'
+
+    @property
+    def sizes(self):
+        return self.ends - self.starts
+
+    def name(self, i):
+        """
+        :return: the name of segment i, or None if the segments are named by their position
+        """
+        return None if self.names is None else self.names[i]
+
+    def segment_xyz(self, i):
+        # view, not copied
+        return self.xyz[self.starts[i]:self.ends[i]]
+
+    def segment_rgb(self, i):
+        return None if self.rgb is None else self.rgb[self.starts[i]:self.ends[i]]
+
+    def segment_normals(self, i):
+        return None if self.normals is None else self.normals[self.starts[i]:self.ends[i]]
+
+    def to_pcd(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(f'segment index {i} out of range of {len(self)} segments')
+        key = (int(self.starts[i]), int(self.ends[i]))
+        if key not in self._cache:
+            self._cache[key] = build_pcd(self.segment_xyz(i), self.segment_rgb(i), self.segment_normals(i))
+        return self._cache[key]
+
+    def to_list(self):
+        return [self[i] for i in range(len(self))]
+
+    def reduce(self, ufunc, values=None):
+        """
+        reduce the rows of each segment by numpy ufunc (e.g. np.add, np.maximum) in one pass
+        :param values: np.array with the same rows as self.xyz, default is self.xyz
+        :return: np.array (s, ...) the reduced values, empty segments are 0
+        """
+        values = self.xyz if values is None else np.asarray(values)
+        out = np.zeros((len(self),) + values.shape[1:], dtype=np.result_type(values, np.float64))
+        filled = np.flatnonzero(self.sizes > 0)
+        if len(filled) == 0:
+            return out
+        # each distinct range is reduced once, repeated segments (e.g. store[[1, 1]]) share the result
+        ranges, inverse = np.unique(np.stack([self.starts[filled], self.ends[filled]], axis=1),
+                                    axis=0, return_inverse=True)
+        if np.all(ranges[1:, 0] >= ranges[:-1, 1]):
+            # reduce the sorted ranges [start0, end0, start1, end1, ...], the even results are the segments
+            bounds = ranges.ravel()
+            if bounds[-1] == len(values):
+                bounds = bounds[:-1]
+            reduced = ufunc.reduceat(values, bounds, axis=0)[0::2]
+        else:
+            # overlapping ranges, reduce the copies of their rows placed one after another
+            sizes = ranges[:, 1] - ranges[:, 0]
+            reduced = ufunc.reduceat(values[ranges_to_indices(ranges[:, 0], ranges[:, 1])],
+                                     np.concatenate([[0], np.cumsum(sizes)[:-1]]), axis=0)
+        out[filled] = reduced[inverse.ravel()]
+        return out
+
+    def z_percentiles(self, percentiles):
+        """
+        the same as np.percentile(z, percentiles) of each segment (linear interpolation),
+        z is sorted inside each segment by one argsort of (segment id * span + z)
+        :return: np.array (s, len(percentiles)), 0 for empty segments
+        """
+        percentiles = np.asarray(percentiles, dtype=np.float64)
+        sizes = self.sizes
+        out = np.zeros((len(self), len(percentiles)))
+        filled = np.flatnonzero(sizes > 0)
+        if len(filled) == 0:
+            return out
+        rows = ranges_to_indices(self.starts[filled], self.ends[filled])
+        seg = np.repeat(np.arange(len(filled)), sizes[filled])
+        z = self.xyz[rows, 2].astype(np.float64)
+        # the span is larger than the z range, so the segments do not mix (much faster than lexsort)
+        z_min = z.min()
+        span = 2 * (z.max() - z_min) + 1
+        z_sorted = z[np.argsort(seg * span + (z - z_min))]
+
+        # the position of each percentile inside the sorted segment, and its two neighbors
+        seg_start = np.concatenate([[0], np.cumsum(sizes[filled])[:-1]])
+        pos = percentiles[None, :] / 100 * (sizes[filled, None] - 1)
+        low = np.floor(pos).astype(np.int64)
+        high = np.minimum(low + 1, sizes[filled, None] - 1)
+        frac = pos - low
+        z_low = z_sorted[seg_start[:, None] + low]
+        z_high = z_sorted[seg_start[:, None] + high]
+        out[filled] = z_low + (z_high - z_low) * frac
+        return out
+
+    def summary(self, z_percentile=False):
+        """
+        per-segment summary calculated once with reduceat, and cached
+        :param z_percentile: also calculate the z percentiles, which needs one sort of all the points
+        :return: dict of np.array
+            'count' -> (s,) point number
+            'center' -> (s, 3) mean of points, the same as PointCloud.get_center()
+            'min', 'max' -> (s, 3) bounding box
+            'z_percentile' -> (s, p) z percentiles of SegmentStore.summary_percentiles, if z_percentile
+        """
+        if self._summary is None:
+            sizes = self.sizes
+            self._summary = {'count': sizes,
+                             'center': self.reduce(np.add) / np.maximum(sizes, 1)[:, None],
+                             'min': self.reduce(np.minimum),
+                             'max': self.reduce(np.maximum)}
+        if z_percentile and 'z_percentile' not in self._summary:
+            self._summary['z_percentile'] = self.z_percentiles(self.summary_percentiles)
+        return self._summary
+
+    def centers(self):
+        """
+        :return: np.array sx3, the mean of points of each segment, the same as PointCloud.get_center()
+        """
+        return self.summary()['center']
+
+    def bbox_volumes(self):
+        """
+        :return: np.array (s,), the xyz bounding box volume of each segment, the same as calculate_xyz_volume()
+        """
+        summary = self.summary()
+        return (summary['max'] - summary['min']).prod(axis=1)
+
+    def field_order(self, name_by='x', ascending=True, row_tol=None):
+        """
+        the order of segments by their centers
+        :param name_by: 'x' or 'y', the axis to sort
+        :param row_tol: if given, the segments are grouped into field rows along the other axis first,
+            a new row starts where the gap between sorted centers is larger than row_tol,
+            then the rows are sorted, and the segments in each row are sorted by name_by
+        :return: np.array of segment ids
+        """
+        if name_by not in ['x', 'y']:
+            raise KeyError(f'Only "x" and "y" are acceptable for name_by parameters, not [{name_by}]')
+        centers = self.centers()
+        axis = 0 if name_by == 'x' else 1
+        sign = 1 if ascending else -1
+        if row_tol is None:
+            return np.argsort(sign * centers[:, axis], kind='stable')
+
+        row_center = centers[:, 1 - axis]
+        row_sorted = np.argsort(row_center, kind='stable')
+        row_id = np.empty(len(self), dtype=np.int64)
+        row_id[row_sorted] = np.cumsum(np.r_[0, np.diff(row_center[row_sorted]) > row_tol])
+        return np.lexsort((sign * centers[:, axis], sign * row_id))
+
+
+def as_segment_store(segments):
+    """
+    :param segments: SegmentStore, or list of o3d.geometry.PointCloud
+    :return: SegmentStore
+    """
+    if isinstance(segments, SegmentStore):
+        return segments
+    elif isinstance(segments, (list, tuple)) and all(isinstance(pcd, o3d.geometry.PointCloud) for pcd in segments):
+        return SegmentStore.from_pcd_list(segments)
+    else:
+        raise TypeError(f'Segments should be SegmentStore or list of o3d.geometry.PointCloud, not {type(segments)}')
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+def best_split_1d(values):
+    """
+    exact 2-means of 1D values: after sorting, the best partition is a cut between two neighbors,
+    the sum of squared errors of all cuts are calculated by prefix sums at once
+    :param values: np.array (n,)
+    :return: threshold, sse
+        values > threshold are the second cluster, threshold is the midpoint of the cut
+    """
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    n = len(values)
+    if n < 2 or values[0] == values[-1]:
+        return values[-1] if n > 0 else 0, 0
+
+    cum = np.cumsum(values)
+    cum_sq = np.cumsum(values ** 2)
+    left_num = np.arange(1, n)
+    right_num = n - left_num
+    left_sse = cum_sq[:-1] - cum[:-1] ** 2 / left_num
+    right_sse = (cum_sq[-1] - cum_sq[:-1]) - (cum[-1] - cum[:-1]) ** 2 / right_num
+    sse = left_sse + right_sse
+    # only cut between different values
+    sse[values[1:] == values[:-1]] = np.inf
+    cut = np.argmin(sse)
+    return (values[cut] + values[cut + 1]) / 2, sse[cut]
+
+
+def lloyd_2means(data, labels, max_iter=100):
+    """
+    Lloyd's iterations of 2 clusters from the initial labels
+    :return: labels, centers, inertia
+    """
+    for _ in range(max_iter):
+        if labels.all() or not labels.any():
+            break
+        centers = np.stack([data[~labels].mean(axis=0), data[labels].mean(axis=0)])
+        dist = ((data[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        # ties go to the first cluster, the same as argmin
+        new_labels = dist[:, 1] < dist[:, 0]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    centers = np.stack([data[~labels].mean(axis=0) if (~labels).any() else np.full(data.shape[1], np.nan),
+                        data[labels].mean(axis=0) if labels.any() else np.full(data.shape[1], np.nan)])
+    inertia = sum(((data[labels == c] - centers[c]) ** 2).sum() for c in [0, 1] if (labels == c).any())
+    return labels, centers, inertia
+
+
+def two_means(data, max_iter=100):
+    """
+    deterministic k-means with 2 clusters, for small number of features (e.g. segment size and volume)
+        1 feature: exact solution by best_split_1d()
+        more features: Lloyd's iterations started from the exact 1D split of each feature,
+                       the result with the smallest inertia is kept
+    the same data always gives the same result, no random initialization
+    :param data: np.array (n,) or (n, d)
+    :return: labels, np.array (n,) of 0 and 1, the cluster 1 has the larger mean of the first feature
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 1:
+        data = data[:, None]
+    if len(data) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    best = None
+    for f in range(data.shape[1]):
+        threshold, _ = best_split_1d(data[:, f])
+        labels = data[:, f] > threshold
+        if data.shape[1] > 1:
+            labels, _, inertia = lloyd_2means(data, labels, max_iter=max_iter)
+        else:
+            inertia = 0
+        if best is None or inertia < best[1]:
+            best = (labels, inertia)
+
+    labels = best[0]
+    if labels.any() and (~labels).any() and data[labels, 0].mean() < data[~labels, 0].mean():
+        labels = ~labels
+    return labels.astype(np.int64)
@@ -0,0 +1,61 @@
+import __init__
+import sys
+import time
+
+import numpy as np
+import imageio
+
+import easydcp as dcp
+
+"""
+Benchmark of Classifier.predict engines on synthetic RGB + z points
+    colors are sampled from the training png files, z is uniform in [0, 1]
+    the lut engine reads uint8 colors directly, its build time is reported separately
+
+Usage:
+    python bench_classifier.py [point_number]
+"""
+
+def make_bench_points(num, rng):
+    pixels = []
+    for png_path in ['data/weed_fore.png', 'data/weed_back.png']:
+        img = np.asarray(imageio.v2.imread(png_path))
+        pixels.append(img[img[:, :, 3] == 255, 0:3])
+    pixels = np.vstack(pixels)
+    rgb = pixels[rng.integers(0, len(pixels), num)]
+    z = rng.uniform(0, 1, num)
+    return rgb, z
+
+def timeit(func):
+    tic = time.perf_counter()
+    result = func()
+    return time.perf_counter() - tic, result
+
+if __name__ == '__main__':
+    point_num = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    rng = np.random.default_rng(0)
+    rgb, z = make_bench_points(point_num, rng)
+
+    clf = dcp.Classifier(path_list=['data/weed_fore.png', 'data/weed_back.png'], kind_list=[0, -1], core='dtc')
+    features64 = clf.get_features(rgb, z)
+    features32 = clf.get_features(rgb, z, out=np.empty((point_num, 5), dtype=np.float32))
+    print(f'[Bench][Classifier] {point_num} points, tree with {clf.clf.tree_.node_count} nodes, '
+          f'depth {clf.clf.get_depth()}')
+
+    print(f"{'engine':>16} | {'input':>7} | {'wall time (s)':>13} | {'same labels':>11}")
+    same = lambda pred: f'{np.mean(pred == reference) * 100:.3f}%'
+    reference = None
+    for engine in ['sklearn', 'flat']:
+        clf.set_engine(engine)
+        for name, features in [('float64', features64), ('float32', features32)]:
+            wall, pred = timeit(lambda: clf.predict(features))
+            if reference is None:
+                reference = pred
+            print(f'{engine:>16} | {name:>7} | {wall:>13.2f} | {same(pred):>11}')
+
+    # the lookup table is built once, then only the uint8 colors are needed
+    for bits in [8, 6]:
+        wall_build, _ = timeit(lambda: clf.set_engine('lut', lut_bits=bits))
+        wall, pred = timeit(lambda: clf.color_lut.lookup(rgb))
+        print(f'{f"lut {bits} bits":>16} | {"uint8":>7} | {wall:>13.2f} | {same(pred):>11}'
+              f'   (build {wall_build:.2f} s)')
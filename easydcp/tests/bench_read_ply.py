@@ -0,0 +1,84 @@
+import __init__
+import os
+import sys
+import time
+import resource
+import tempfile
+import multiprocessing as mp
+
+import numpy as np
+import open3d as o3d
+from plyfile import PlyData, PlyElement
+
+import easydcp as dcp
+
+"""
+Benchmark of easydcp.read_ply, compared with the previous loading path
+    (open3d read + PlyData re-parse for diffuse colors + estimate_normals + scale copy)
+
+Usage:
+    python bench_read_ply.py [point_number]
+
+Each reader runs in a fresh process, peak RSS is the ru_maxrss of that process.
+"""
+
+def read_ply_previous(file_path, unit='m'):
+    pcd = o3d.io.read_point_cloud(file_path)
+    if not pcd.has_colors():
+        cloud_ply = PlyData.read(file_path)
+        cloud_data = cloud_ply.elements[0].data
+        ply_names = cloud_data.dtype.names
+
+        if 'red' in ply_names:
+            colors = np.vstack((cloud_data['red'] / 255, cloud_data['green'] / 255, cloud_data['blue'] / 255)).T
+            pcd.colors = o3d.utility.Vector3dVector(colors)
+        elif 'diffuse_red' in ply_names:
+            colors = np.vstack((cloud_data['diffuse_red'] / 255, cloud_data['diffuse_green'] / 255,
+                                cloud_data['diffuse_blue'] / 255)).T
+            pcd.colors = o3d.utility.Vector3dVector(colors)
+
+    divider = {'m': 1, 'dm': 10, 'cm': 100, 'mm': 1000, 'km': 0.001}[unit]
+    pcd.points = o3d.utility.Vector3dVector(np.asarray(pcd.points) / divider)
+    pcd.estimate_normals()
+
+    return pcd
+
+READERS = {'previous': lambda p: read_ply_previous(p),
+           'normals=False': lambda p: dcp.read_ply(p, normals=False),
+           'normals=lazy': lambda p: dcp.read_ply(p, normals='lazy'),
+           'normals=True': lambda p: dcp.read_ply(p, normals=True)}
+
+def write_bench_ply(file_path, num):
+    vertex = np.empty(num, dtype=[('x', 'f4'), ('y', 'f4'), ('z', 'f4'),
+                                  ('diffuse_red', 'u1'), ('diffuse_green', 'u1'), ('diffuse_blue', 'u1')])
+    rng = np.random.default_rng(0)
+    vertex['x'] = rng.uniform(0, 10, num)
+    vertex['y'] = rng.uniform(0, 10, num)
+    vertex['z'] = rng.uniform(0, 1, num)
+    for c in ['diffuse_red', 'diffuse_green', 'diffuse_blue']:
+        vertex[c] = rng.integers(0, 256, num)
+    PlyData([PlyElement.describe(vertex, 'vertex')]).write(file_path)
+
+def run_reader(name, file_path, queue):
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tic = time.perf_counter()
+    pcd = READERS[name](file_path)
+    toc = time.perf_counter()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((toc - tic, (peak_rss - base_rss) / 1024, len(pcd.points)))
+
+if __name__ == '__main__':
+    point_num = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    ctx = mp.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        ply_path = os.path.join(tmp, 'bench.ply')
+        write_bench_ply(ply_path, point_num)
+        print(f'[Bench][read_ply] {point_num} points, file size {os.path.getsize(ply_path) / 1024 ** 2:.1f} MB')
+        print(f"{'reader':>15} | {'wall time (s)':>13} | {'peak RSS (MB)':>13}")
+        for name in READERS.keys():
+            queue = ctx.Queue()
+            proc = ctx.Process(target=run_reader, args=(name, ply_path, queue))
+            proc.start()
+            wall, rss, num = queue.get()
+            proc.join()
+            print(f'{name:>15} | {wall:>13.2f} | {rss:>13.1f}')
@@ -0,0 +1,98 @@
+import __init__
+import pytest
+import pickle
+import numpy as np
+import sklearn
+import easydcp as dcp
+from easydcp.classifier_tools import stratified_sample, build_svm
+
+path_list = ['data/weed_fore.png', 'data/weed_back.png']
+kind_list = [0, -1]
+
+
+def test_classifier_save_load(tmp_path):
+    clf = dcp.Classifier(path_list=path_list, kind_list=kind_list, core='dtc')
+    clf.save(str(tmp_path / 'model.pkl'))
+    clf_load = dcp.Classifier.load(str(tmp_path / 'model.pkl'))
+
+    assert clf_load.kind_set == clf.kind_set
+    assert clf_load.unit == clf.unit
+    assert clf_load.features == clf.features
+    np.testing.assert_array_equal(clf_load.predict(clf.train_data), clf.predict(clf.train_data))
+
+
+def test_classifier_load_incompatible(tmp_path):
+    clf = dcp.Classifier(path_list=path_list, kind_list=kind_list, core='dtc')
+    clf.save(str(tmp_path / 'model.pkl'))
+    with open(tmp_path / 'model.pkl', 'rb') as f:
+        model = pickle.load(f)
+    model['features'] = ['red', 'green', 'blue']
+    with open(tmp_path / 'model.pkl', 'wb') as f:
+        pickle.dump(model, f)
+
+    with pytest.raises(ValueError):
+        dcp.Classifier.load(str(tmp_path / 'model.pkl'))
+
+
+def test_classifier_training_cache(tmp_path, monkeypatch):
+    clf = dcp.Classifier(path_list=path_list, kind_list=kind_list, core='dtc', cache_dir=str(tmp_path))
+    assert len(list(tmp_path.glob('train-*.npz'))) == 1
+
+    # the second time the png files are not read
+    def read_png_fail(file_path):
+        raise AssertionError(f'{file_path} should not be read')
+    monkeypatch.setattr(dcp.Classifier, 'read_png', staticmethod(read_png_fail))
+    clf_cache = dcp.Classifier(path_list=path_list, kind_list=kind_list, core='dtc', cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(clf_cache.train_data, clf.train_data)
+    np.testing.assert_array_equal(clf_cache.train_kind, clf.train_kind)
+
+    # different kinds are cached separately
+    monkeypatch.undo()
+    dcp.Classifier(path_list=path_list, kind_list=[1, -1], core='dtc', cache_dir=str(tmp_path))
+    assert len(list(tmp_path.glob('train-*.npz'))) == 2
+
+
+def test_stratified_sample():
+    kind = np.r_[np.full(9000, -1), np.full(1000, 0), np.full(3, 1)]
+    picked = stratified_sample(kind, 1000)
+    assert np.all(np.diff(picked) > 0)
+    counts = {k: (kind[picked] == k).sum() for k in [-1, 0, 1]}
+    assert counts == {-1: 900, 0: 100, 1: 1}
+    assert len(stratified_sample(kind, None)) == len(kind)
+
+
+@pytest.mark.parametrize('kernel_approx', [None, 'nystroem', 'rbf_sampler'])
+def test_classifier_svm(tmp_path, kernel_approx):
+    clf = dcp.Classifier(path_list=path_list, kind_list=kind_list, core='svm', max_train=3000,
+                         kernel_approx=kernel_approx, n_components=100)
+    picked = stratified_sample(clf.train_kind, 5000, seed=1)
+    pred = clf.predict(clf.train_data[picked])
+    assert set(np.unique(pred)) == {0, -1}
+    assert (pred == clf.train_kind[picked]).mean() > 0.9
+
+    clf.save(str(tmp_path / 'model.pkl'))
+    np.testing.assert_array_equal(dcp.Classifier.load(str(tmp_path / 'model.pkl')).predict(clf.train_data[picked]),
+                                  pred)
+
+
+def test_build_svm_old_sklearn(monkeypatch):
+    monkeypatch.setattr(sklearn, '__version__', '0.24.2')
+    # the exact and nystroem svm still work, the newer classes give a clear error
+    build_svm(kernel_approx=None, one_class=True)
+    build_svm(kernel_approx='nystroem')
+    with pytest.raises(ImportError, match='SGDOneClassSVM requires scikit-learn>=1.0'):
+        build_svm(kernel_approx='nystroem', one_class=True)
+    with pytest.raises(ImportError, match='requires scikit-learn>=1.2'):
+        build_svm(kernel_approx='rbf_sampler')
+
+
+@pytest.mark.parametrize('kind', [0, -1])
+def test_classifier_one_class(kind):
+    png_path = path_list[0] if kind == 0 else path_list[1]
+    clf = dcp.Classifier(path_list=[png_path], kind_list=[kind], max_train=3000, kernel_approx='nystroem')
+    outlier_kind = -1 if kind == 0 else 0
+    assert clf.kind_set == {kind, outlier_kind}
+    # mostly inliers on its own training data
+    pred = clf.predict(clf.train_data[::10])
+    assert set(np.unique(pred)) <= clf.kind_set
+    assert (pred == kind).mean() > 0.8
@@ -0,0 +1,408 @@
+import __init__
+import os
+import pytest
+import imageio
+import numpy as np
+import pandas as pd
+import open3d as o3d
+from plyfile import PlyData, PlyElement
+import easydcp as dcp
+from easydcp.geometry.grid_index import GridIndex
+from skimage.measure import regionprops
+
+"""
+Plot tests on a small synthetic field (no large ply file needed):
+    ground: 2m x 1m plane with colors sampled from data/weed_back.png
+    plants: 6 half-ellipsoids in 2 rows x 3 columns with colors sampled from data/weed_fore.png
+"""
+
+def sample_png_colors(png_path, num, rng):
+    img = np.asarray(imageio.imread(png_path))
+    pixels = img[img[:, :, 3] == 255, 0:3]
+    return pixels[rng.integers(0, len(pixels), num)]
+
+def make_synthetic_field(plant_num=6, ground_num=60000, plant_points=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    ground_xyz = np.vstack([rng.uniform(0, 2, ground_num),
+                            rng.uniform(0, 1, ground_num),
+                            rng.normal(0, 0.002, ground_num)]).T
+    ground_rgb = sample_png_colors('data/weed_back.png', ground_num, rng)
+
+    plant_xyz = []
+    centers = [(0.375 + 0.6 * (i // 2), 0.275 + 0.4 * (i % 2)) for i in range(plant_num)]
+    for cx, cy in centers:
+        direction = rng.normal(size=(plant_points, 3))
+        direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+        direction[:, 2] = np.abs(direction[:, 2])
+        radius = rng.uniform(0.5, 1, (plant_points, 1))
+        plant_xyz.append(direction * radius * [0.08, 0.06, 0.1] + [cx, cy, 0.01])
+    plant_xyz = np.vstack(plant_xyz)
+    plant_rgb = sample_png_colors('data/weed_fore.png', len(plant_xyz), rng)
+
+    return np.vstack([ground_xyz, plant_xyz]), np.vstack([ground_rgb, plant_rgb])
+
+def write_field_ply(file_path, xyz, rgb):
+    vertex = np.empty(len(xyz), dtype=[('x', 'f4'), ('y', 'f4'), ('z', 'f4'),
+                                       ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+    vertex['x'], vertex['y'], vertex['z'] = xyz.T
+    vertex['red'], vertex['green'], vertex['blue'] = rgb.T
+    PlyData([PlyElement.describe(vertex, 'vertex')]).write(str(file_path))
+
+@pytest.fixture(scope="module")
+def classifier():
+    return dcp.Classifier(path_list=['data/weed_fore.png', 'data/weed_back.png'], kind_list=[0, -1], core='dtc')
+
+@pytest.fixture(scope="module")
+def field_ply(tmp_path_factory):
+    file_path = tmp_path_factory.mktemp('field') / 'field.ply'
+    xyz, rgb = make_synthetic_field()
+    write_field_ply(file_path, xyz, rgb)
+    return str(file_path)
+
+def pcd_equal(pcd1, pcd2):
+    np.testing.assert_array_equal(np.asarray(pcd1.points), np.asarray(pcd2.points))
+    np.testing.assert_array_equal(np.asarray(pcd1.colors), np.asarray(pcd2.colors))
+
+def test_plot_mmap_classify(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    plot_mmap = dcp.Plot(field_ply, classifier, down_sample=False, mmap=True)
+    assert isinstance(plot_mmap.pcd, dcp.io.pcd.PlyVertexView)
+    for k in plot.pcd_classified.keys():
+        assert isinstance(plot_mmap.pcd_classified[k], o3d.geometry.PointCloud)
+        pcd_equal(plot.pcd_classified[k], plot_mmap.pcd_classified[k])
+
+def test_plot_mmap_auto_args(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    plot_mmap = dcp.Plot(field_ply, classifier, down_sample=False, mmap=True)
+    assert plot.auto_dbscan_args() == plot_mmap.auto_dbscan_args()
+
+def test_plot_mmap_cm_out_of_core(tmp_path, classifier, monkeypatch):
+    xyz, rgb = make_synthetic_field()
+    # saved in cm, and x, y, z are not continuous (interleaved with colors)
+    vertex = np.empty(len(xyz), dtype=[('x', 'f4'), ('red', 'u1'), ('y', 'f4'), ('green', 'u1'),
+                                       ('z', 'f4'), ('blue', 'u1')])
+    vertex['x'], vertex['y'], vertex['z'] = (xyz * 100).T
+    vertex['red'], vertex['green'], vertex['blue'] = rgb.T
+    file_path = str(tmp_path / 'field_cm.ply')
+    PlyData([PlyElement.describe(vertex, 'vertex')]).write(file_path)
+    plot = dcp.Plot(file_path, classifier, unit='cm', down_sample=False)
+
+    # the whole memory-mapped cloud is never copied into RAM
+    def whole_copy(*args, **kwargs):
+        raise AssertionError('the whole memory-mapped cloud is copied')
+    monkeypatch.setattr(dcp.io.pcd.FieldStack, '__array__', whole_copy)
+    monkeypatch.setattr(dcp.io.pcd.PlyVertexView, 'points', property(whole_copy))
+    plot_mmap = dcp.Plot(file_path, classifier, unit='cm', down_sample=False, mmap=True)
+    assert isinstance(plot_mmap.pcd_xyz_raw, dcp.io.pcd.FieldStack)
+    # the public arrays are in meters and float colors in both modes, the raw views are explicit
+    with pytest.raises(AttributeError, match='self.pcd.xyz'):
+        plot_mmap.pcd_xyz
+    with pytest.raises(AttributeError, match='self.pcd.colors'):
+        plot_mmap.pcd_rgb
+    np.testing.assert_allclose(plot_mmap.pcd.xyz(slice(0, 100)), plot.pcd_xyz[0:100], rtol=1e-6)
+    np.testing.assert_allclose(plot_mmap.pcd.colors(slice(0, 100)), plot.pcd_rgb[0:100])
+    for k in plot.pcd_classified.keys():
+        np.testing.assert_allclose(plot_mmap.pcd_classified[k].points, plot.pcd_classified[k].points, rtol=1e-6)
+    np.testing.assert_allclose(plot_mmap.auto_dbscan_args(), plot.auto_dbscan_args(), rtol=1e-4)
+    np.testing.assert_allclose(np.vstack(plot_mmap.xyz_bounds()), np.vstack(plot.xyz_bounds()), rtol=1e-6)
+
+def write_plot_shp(file_path):
+    import shapefile
+    with shapefile.Writer(str(file_path), shapeType=shapefile.POLYGON) as shp:
+        shp.field('Id', 'N')
+        shp.field('Plot', 'C')
+        plot_id = 0
+        for row in range(2):
+            for col in range(3):
+                x0, y0 = 0.1 + 0.6 * col, 0.1 + 0.4 * row
+                shp.poly([[[x0, y0], [x0, y0 + 0.35], [x0 + 0.55, y0 + 0.35], [x0 + 0.55, y0], [x0, y0]]])
+                shp.record(plot_id, f'row{row}/col{col}')
+                plot_id += 1
+        # a rotated polygon overlapping with row plots, and a thin strip
+        shp.poly([[[1.0, 0.2], [1.3, 0.5], [1.0, 0.8], [0.7, 0.5], [1.0, 0.2]]])
+        shp.record(plot_id, 'diamond')
+        shp.poly([[[1.85, 0.05], [1.85, 0.95], [1.95, 0.95], [1.95, 0.05], [1.85, 0.05]]])
+        shp.record(plot_id + 1, 'outside')
+
+def test_plot_shp_segment_grid(tmp_path, field_ply, classifier):
+    write_plot_shp(tmp_path / 'plots.shp')
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    seg_o3d = plot.shp_segment(str(tmp_path / 'plots.shp'), method='open3d')
+    name_o3d = plot.pcd_segmented_name
+    seg_grid = plot.shp_segment(str(tmp_path / 'plots.shp'), method='grid')
+    assert plot.pcd_segmented_name == name_o3d
+    for k in seg_o3d.keys():
+        assert len(seg_grid[k]) == len(seg_o3d[k]) == 8
+        for pcd_grid, pcd_o3d in zip(seg_grid[k], seg_o3d[k]):
+            pcd_equal(pcd_grid, pcd_o3d)
+
+def test_plot_get_traits_workers(tmp_path, field_ply, classifier):
+    write_plot_shp(tmp_path / 'plots.shp')
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    seg = plot.shp_segment(str(tmp_path / 'plots.shp'))
+    seg = {0: seg[0][0:6]}   # the row plots which have plants inside
+    df = plot.get_traits(pcd_dict=seg, savefig=False)
+    df_process = plot.get_traits(pcd_dict=seg, savefig=False, workers=2, backend='process')
+    df_thread = plot.get_traits(pcd_dict=seg, savefig=False, workers=2, backend='thread')
+    assert len(df) == 6
+    pd.testing.assert_frame_equal(df, df_process)
+    pd.testing.assert_frame_equal(df, df_thread)
+
+def test_plot_get_traits_thread_savefig(tmp_path, field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False, write_ply=True, output_path=str(tmp_path))
+    eps, min_points = plot.auto_dbscan_args()
+    plot.dbscan_segment(eps, min_points, drop_noise=True)
+    seg = {0: plot.rank_split(6)[0][0:4]}
+    fig_paths = [os.path.join(plot.out_folder, f'class[0]-plant{i}.png') for i in range(4)]
+
+    df = plot.get_traits(pcd_dict=seg, savefig=True)
+    figures = [imageio.imread(path) for path in fig_paths]
+    for path in fig_paths:
+        os.remove(path)
+    # each thread draws its own figure, not the pyplot current one
+    df_thread = plot.get_traits(pcd_dict=seg, savefig=True, workers=4, backend='thread')
+    pd.testing.assert_frame_equal(df, df_thread)
+    for path, figure in zip(fig_paths, figures):
+        np.testing.assert_array_equal(imageio.imread(path), figure)
+
+def test_plot_classifier_apply_chunked(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    # one shot prediction of the whole float64 feature matrix
+    pred = classifier.predict(np.hstack([plot.pcd_rgb, plot.pcd_xyz[:, 2:3], classifier.get_tgi(plot.pcd_rgb)]))
+    xyz = plot.pcd_xyz
+    for mmap in [False, True]:
+        plot = dcp.Plot(field_ply, classifier, down_sample=False, mmap=mmap)
+        pcd_classified = plot.classifier_apply(classifier, chunk_size=7000, workers=3)
+        for k in classifier.kind_set:
+            np.testing.assert_array_equal(pcd_classified[k].points, xyz[pred == k])
+
+def test_plot_voxel_params_cached(field_ply, classifier, monkeypatch):
+    plot = dcp.Plot(field_ply, classifier, down_sample=True)
+    _, voxel_params = dcp.pcd_tools.pcd2voxel(plot.pcd, part=100)
+    # down_sample() has counted the same cloud in __init__
+    calls = []
+    voxel_stats = dcp.base.voxel_stats
+    monkeypatch.setattr(dcp.base, 'voxel_stats', lambda *args, **kwargs: calls.append(1) or voxel_stats(*args, **kwargs))
+    assert plot.get_voxel_params(part=100) == voxel_params
+    eps, min_points = plot.auto_dbscan_args(divide=100)
+    assert (eps, min_points) == (voxel_params['voxel_size'] * 10, round(voxel_params['voxel_density']))
+    assert len(calls) == 0
+    plot.auto_dbscan_args(divide=50)
+    assert len(calls) == 1
+
+def test_plot_voxel_cache_released(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    dense = dcp.pcd_tools.build_pcd(np.repeat(plot.pcd_xyz, 30, axis=0), np.repeat(plot.pcd_rgb, 30, axis=0))
+    pcd_down = plot.down_sample(dense, part=100)
+    # the replaced full resolution cloud is not kept alive by the cache
+    assert pcd_down is not dense
+    assert all(cached is not dense for cached, _ in plot.voxel_cache.values())
+
+    # the clouds other than self.pcd are dropped by the next counting
+    plot.get_voxel_params(part=100)
+    assert all(cached is plot.pcd for cached, _ in plot.voxel_cache.values())
+
+    # points edited in place keep the same key, until the cache is cleared
+    voxel_params = plot.get_voxel_params(part=100)
+    np.asarray(plot.pcd.points)[:, 2] *= 2
+    assert plot.get_voxel_params(part=100) == voxel_params
+    plot.clear_voxel_cache(plot.pcd)
+    assert plot.get_voxel_params(part=100) == dcp.pcd_tools.pcd2voxel(plot.pcd, part=100)[1]
+    assert plot.get_voxel_params(part=100) != voxel_params
+
+def test_plant_voxel_grid_lazy(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    seg = plot.pcd_classified[0].select_by_index(np.arange(100).tolist())
+    plant = dcp.Plant(seg, plot.pcd_classified[-1], indices=0, cut_bg=False)
+    assert plant._pcd_voxel is None
+    assert len(plant.pcd_voxel.get_voxels()) == plant.voxel_params['voxel_number']
+
+def dbscan_segment_previous(pcd, eps, min_points):
+    vect_np = np.asarray(pcd.cluster_dbscan(eps=eps, min_points=min_points))
+    return [pcd.select_by_index(np.where(vect_np == seg)[0].tolist()) for seg in np.unique(vect_np)]
+
+def test_plot_dbscan_segment_split(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    pcd = plot.pcd_classified[0]
+    pcd.estimate_normals()
+    eps, min_points = 0.01, 3
+    seg_previous = dbscan_segment_previous(pcd, eps, min_points)
+
+    seg, counts = plot.dbscan_segment(eps, min_points, return_counts=True)
+    assert isinstance(counts[0], np.ndarray)
+    assert len(seg[0]) == len(seg_previous) == len(counts[0])
+    for pcd_seg, pcd_prev, count in zip(seg[0], seg_previous, counts[0]):
+        pcd_equal(pcd_seg, pcd_prev)
+        np.testing.assert_array_equal(np.asarray(pcd_seg.normals), np.asarray(pcd_prev.normals))
+        assert len(pcd_seg.points) == count
+
+    # the noise segment is the first one
+    labels = np.asarray(pcd.cluster_dbscan(eps=eps, min_points=min_points))
+    assert (labels == -1).sum() == counts[0][0]
+    seg_drop, counts_drop = plot.dbscan_segment(eps, min_points, drop_noise=True, return_counts=True)
+    assert len(seg_drop[0]) == len(seg[0]) - 1
+    np.testing.assert_array_equal(counts_drop[0], counts[0][1:])
+
+def test_plot_dbscan_segment_grid(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    eps, min_points = plot.auto_dbscan_args()
+    seg = plot.dbscan_segment(eps, min_points, drop_noise=True)
+    seg_grid = plot.dbscan_segment(eps, min_points, drop_noise=True, method='grid', workers=2)
+    # the same 6 plants, with about the same points
+    big = [sorted(len(p.points) for p in s[0] if len(p.points) > 1000) for s in [seg, seg_grid]]
+    assert len(big[0]) == len(big[1]) == 6
+    np.testing.assert_allclose(big[1], big[0], rtol=0.05)
+
+    with pytest.raises(KeyError):
+        plot.dbscan_segment(eps, min_points, method='hdbscan')
+
+def test_plot_remove_noise_tile(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    classified = plot.pcd_classified
+    pcd_cleaned, cleaned_id = plot.remove_noise(return_id=True)
+
+    plot.pcd_classified = classified
+    pcd_tile, tile_id = plot.remove_noise(method='tile', workers=2, tile_size=0.3, return_id=True)
+    for k in classified.keys():
+        np.testing.assert_array_equal(tile_id[k], cleaned_id[k])
+        pcd_equal(pcd_tile[k], pcd_cleaned[k])
+        pcd_equal(pcd_tile[k], classified[k].select_by_index(tile_id[k].tolist()))
+
+    with pytest.raises(KeyError):
+        plot.remove_noise(method='pcl')
+
+def test_plot_kmeans_split_two_means(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    eps, min_points = plot.auto_dbscan_args()
+    seg = plot.dbscan_segment(eps, min_points)
+    split = plot.kmeans_split(pcd_dict=seg)
+    assert len(split[0]) == 6
+    split_sklearn = plot.kmeans_split(pcd_dict=seg, method='sklearn')
+    assert [len(p.points) for p in split[0]] == [len(p.points) for p in split_sklearn[0]]
+    with pytest.raises(KeyError):
+        plot.kmeans_split(pcd_dict=seg, method='gmm')
+
+def test_plot_segment_store(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    eps, min_points = plot.auto_dbscan_args()
+    seg = plot.dbscan_segment(eps, min_points, drop_noise=True)
+    assert isinstance(seg[0], dcp.SegmentStore)
+    # the plants are kept, reordered by x and cut to 6, the points are not copied
+    plot.rank_split(6)
+    plot.sort_order(name_by='x')
+    assert plot.pcd_segmented[0].xyz is seg[0].xyz
+    centers = np.asarray([pcd.get_center() for pcd in plot.pcd_segmented[0]])
+    assert np.all(np.diff(centers[:, 0]) >= 0)
+
+    # a list of point clouds is still accepted
+    pcd_list = list(plot.pcd_segmented[0])
+    traits = plot.get_traits(pcd_dict={0: pcd_list}, savefig=False)
+    traits_store = plot.get_traits(savefig=False, workers=2, backend='process')
+    pd.testing.assert_frame_equal(traits, traits_store)
+
+def test_plot_sort_order_rows(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    eps, min_points = plot.auto_dbscan_args()
+    seg = plot.dbscan_segment(eps, min_points, drop_noise=True)
+    sizes = seg[0].summary()['count']
+    rank = plot.rank_split(6)
+    assert rank[0].summary()['count'].tolist() == sorted(sizes.tolist(), reverse=True)[:6]
+
+    # the plants are in 2 rows along x, y = 0.275 and 0.675
+    plot.sort_order(name_by='x', row_tol=0.2)
+    centers = plot.pcd_segmented[0].centers()
+    np.testing.assert_array_equal(np.round(centers[:, 1], 1), [0.3, 0.3, 0.3, 0.7, 0.7, 0.7])
+    assert np.all(np.diff(centers[[0, 1, 2, 3, 4, 5], 0].reshape(2, 3), axis=1) > 0)
+
+def test_plant_clip_background_grid(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    eps, min_points = plot.auto_dbscan_args()
+    plot.dbscan_segment(eps, min_points, drop_noise=True)
+    seg = plot.rank_split(6)
+    ground_pcd = plot.pcd_classified[-1]
+    plant_pcd = seg[0][0]
+    # ground points exactly on the clipping box edges
+    plant_xyz = np.asarray(plant_pcd.points)
+    x_min, y_min = plant_xyz[:, 0:2].min(axis=0)
+    x_max, y_max = plant_xyz[:, 0:2].max(axis=0)
+    x_len, y_len = x_max - x_min, y_max - y_min
+    edges = np.array([[x_min - x_len * 0.1, y_min], [x_max + x_len * 0.1, y_min],
+                      [x_min, y_min - y_len * 0.1], [x_min, y_max + y_len * 0.1]])
+    ground_pcd = dcp.pcd_tools.build_pcd(np.vstack([np.asarray(ground_pcd.points), np.c_[edges, np.zeros(4)]]),
+                                         np.vstack([np.asarray(ground_pcd.colors), np.zeros((4, 3))]))
+
+    plant = dcp.Plant(plant_pcd, ground_pcd, indices=0)
+    grid = GridIndex(np.asarray(ground_pcd.points), 0.05)
+    plant_grid = dcp.Plant(plant_pcd, ground_pcd, indices=0, ground_index=grid)
+    pcd_equal(plant_grid.ground_pcd, plant.ground_pcd)
+    assert plant_grid.traits() == plant.traits()
+
+    traits = plot.get_traits(savefig=False, clip_method='open3d')
+    for workers, backend in [(1, 'thread'), (2, 'thread'), (2, 'process')]:
+        pd.testing.assert_frame_equal(plot.get_traits(savefig=False, workers=workers, backend=backend), traits)
+
+
+def test_plant_region_props_pixels(field_ply, classifier):
+    plot = dcp.Plot(field_ply, classifier, down_sample=False)
+    eps, min_points = plot.auto_dbscan_args()
+    plot.dbscan_segment(eps, min_points, drop_noise=True)
+    seg = plot.rank_split(6)
+    ground_pcd = plot.pcd_classified[-1]
+    for i in range(len(seg[0])):
+        plant = dcp.Plant(seg[0][i], ground_pcd, indices=i)
+        binary, px_num_per_cm, corner = dcp.pcd2binary(plant.pcd)
+        np.testing.assert_array_equal(plant.pla_img, binary)
+        assert plant.pla == np.count_nonzero(binary) * (1 / px_num_per_cm) ** 2
+
+        # skimage >= 0.16 measures the orientation from the row axis
+        props = regionprops(binary)[0]
+        to_m = px_num_per_cm * 100
+        np.testing.assert_allclose(plant.centroid, (props.centroid[1] / to_m + corner[0],
+                                                    props.centroid[0] / to_m + corner[1]))
+        np.testing.assert_allclose([plant.major_axis, plant.minor_axis],
+                                   [props.axis_major_length / to_m, props.axis_minor_length / to_m])
+        diff = np.deg2rad(plant.orient_degree) + props.orientation - np.pi / 2
+        assert np.isclose(np.sin(diff), 0, atol=1e-9)
+
+    # the angle to x axis is counter-clockwise in the X-Y plane, as drawn by draw_3d_results()
+    t = np.linspace(0, 1, 500)
+    diagonal = dcp.pcd_tools.build_pcd(np.c_[t, t + 0.02 * np.sin(50 * t), 0.01 * np.cos(70 * t)])
+    ground = dcp.pcd_tools.build_pcd(np.c_[np.random.default_rng(0).random((500, 2)), np.full(500, -0.1)])
+    plant = dcp.Plant(diagonal, ground, indices=0, cut_bg=False)
+    assert plant.orient_degree == pytest.approx(45, abs=2)
+
+
+def binary_previous(pcd, dpi=10):
+    # the image of pcd2binary() by the dense float image and np.unique(axis=0)
+    xyz = np.asarray(pcd.points)
+    y, x = xyz[:, 0], xyz[:, 1]
+    px_num_per_cm = int(dpi / 2.54)
+    width = int(np.ceil((x.max() - x.min()) * 100 * px_num_per_cm))
+    height = int(np.ceil((y.max() - y.min()) * 100 * px_num_per_cm))
+    ref_pos = np.vstack([(x - x.min()) / (x.max() - x.min()) * width,
+                         (y - y.min()) / (y.max() - y.min()) * height]).T.astype(int)
+    ref_pos = np.unique(ref_pos, axis=0)
+    out_img = np.zeros((width + 1, height + 1))
+    out_img[ref_pos[:, 0], ref_pos[:, 1]] = 1
+    return out_img.astype(int)
+
+
+@pytest.mark.parametrize('point_num, size', [(3000, 0.3), (100, 2.0)])
+def test_pcd2binary_dtype_sparse(point_num, size):
+    # dense points use the pixel mask, sparse points use np.unique
+    xyz = np.random.default_rng(1).random((point_num, 3)) * [size, size * 0.7, 0.3]
+    pcd = dcp.pcd_tools.build_pcd(xyz)
+    expected = binary_previous(pcd)
+
+    binary, px_num_per_cm, corner = dcp.pcd2binary(pcd)
+    assert binary.dtype == int
+    np.testing.assert_array_equal(binary, expected)
+    assert corner == (xyz[:, 0].min(), xyz[:, 1].min())
+
+    binary_u8, _, _ = dcp.pcd2binary(pcd, dtype=np.uint8)
+    assert binary_u8.dtype == np.uint8
+    np.testing.assert_array_equal(binary_u8, expected)
+
+    binary_sparse, _, _ = dcp.pcd2binary(pcd, dtype=bool, sparse=True)
+    assert binary_sparse.shape == expected.shape and binary_sparse.nnz == expected.sum()
+    np.testing.assert_array_equal(binary_sparse.toarray(), expected.astype(bool))
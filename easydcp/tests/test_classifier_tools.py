@@ -0,0 +1,111 @@
+import __init__
+import pytest
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+import easydcp as dcp
+from easydcp.classifier_tools import FlatTree, ColorLUT
+from easydcp.pcd_tools import build_pcd
+
+from test_base_plot_synthetic import write_field_ply
+
+
+def fit_random_tree(seed=0):
+    rng = np.random.default_rng(seed)
+    data = rng.random((5000, 5))
+    kind = np.where(data[:, 0] + data[:, 1] * data[:, 4] > 0.7, 0, -1) + (data[:, 2] > 0.9)
+    kind[rng.random(5000) < 0.05] = 2   # label noise makes a deep tree
+    return DecisionTreeClassifier(max_depth=20).fit(data, kind), rng
+
+def test_flat_tree_same_as_sklearn():
+    tree_clf, rng = fit_random_tree()
+    flat_tree = FlatTree(tree_clf)
+    assert len(flat_tree) == tree_clf.tree_.node_count
+
+    data = rng.random((20000, 5))
+    np.testing.assert_array_equal(flat_tree.predict(data), tree_clf.predict(data))
+    np.testing.assert_array_equal(flat_tree.apply(data), tree_clf.apply(data.astype(np.float32)))
+
+def test_flat_tree_threshold_ties():
+    tree_clf, rng = fit_random_tree(seed=1)
+    flat_tree = FlatTree(tree_clf)
+    # points lying exactly on (or rounding to) the split thresholds
+    split = flat_tree.feature >= 0
+    data = rng.random((int(split.sum()), 5))
+    data[np.arange(len(data)), flat_tree.feature[split]] = flat_tree.threshold[split]
+    for dtype in [np.float64, np.float32]:
+        np.testing.assert_array_equal(flat_tree.predict(data.astype(dtype)), tree_clf.predict(data.astype(dtype)))
+
+def test_flat_tree_threshold32():
+    tree_clf, _ = fit_random_tree(seed=2)
+    flat_tree = FlatTree(tree_clf)
+    split = flat_tree.feature >= 0
+    assert flat_tree.threshold32.dtype == np.float32
+    # the float32 values around each threshold go the same way as the float64 comparison
+    near = flat_tree.threshold[split].astype(np.float32)
+    for x in [np.nextafter(near, np.float32(-1)), near, np.nextafter(near, np.float32(2))]:
+        np.testing.assert_array_equal(x <= flat_tree.threshold32[split],
+                                      x.astype(np.float64) <= flat_tree.threshold[split])
+
+def test_flat_tree_empty_and_wrong_shape():
+    tree_clf, _ = fit_random_tree()
+    flat_tree = FlatTree(tree_clf)
+    assert len(flat_tree.predict(np.empty((0, 5)))) == 0
+    with pytest.raises(ValueError):
+        flat_tree.predict(np.zeros((10, 4)))
+
+def test_classifier_engine_flat(tmp_path):
+    clf = dcp.Classifier(path_list=['data/weed_fore.png', 'data/weed_back.png'], kind_list=[0, -1],
+                         core='dtc', engine='flat')
+    assert isinstance(clf.flat_tree, FlatTree)
+    np.testing.assert_array_equal(clf.predict(clf.train_data), clf.clf.predict(clf.train_data))
+
+    clf.save(str(tmp_path / 'model.pkl'))
+    assert dcp.Classifier.load(str(tmp_path / 'model.pkl')).engine == 'flat'
+
+    with pytest.raises(KeyError):
+        clf.set_engine('numba')
+
+def test_color_lut_same_as_sklearn():
+    clf = dcp.Classifier(path_list=['data/weed_fore.png', 'data/weed_back.png'], kind_list=[0, -1],
+                         core='dtc', engine='lut')
+    assert isinstance(clf.color_lut, ColorLUT)
+    rgb = np.random.default_rng(0).integers(0, 256, (50000, 3)).astype(np.uint8)
+    pred = clf.clf.predict(clf.get_features(rgb, np.zeros(len(rgb))))
+    np.testing.assert_array_equal(clf.color_lut.lookup(rgb), pred)
+    np.testing.assert_array_equal(clf.color_lut.lookup(rgb / 255), pred)
+    np.testing.assert_array_equal(clf.predict(clf.get_features(rgb, np.zeros(len(rgb)))), pred)
+
+    # coarse table, the same labels at the cell centers
+    lut6 = ColorLUT.from_classifier(clf, bits=6)
+    assert len(lut6.labels) == 64 ** 3
+    center = (rgb // 4) * 4 + 2
+    np.testing.assert_array_equal(lut6.lookup(rgb), clf.clf.predict(clf.get_features(center, np.zeros(len(rgb)))))
+
+def test_color_lut_z_split():
+    rng = np.random.default_rng(0)
+    pcd_list = []
+    for z in [0, 1]:
+        # the same colors at different heights, only z can split them
+        pcd_list.append(build_pcd(np.c_[rng.random((500, 2)), np.full(500, z)], np.full((500, 3), 0.5)))
+    clf = dcp.Classifier(path_list=pcd_list, kind_list=[0, -1], core='dtc')
+    with pytest.raises(ValueError):
+        clf.set_engine('lut')
+
+def test_classifier_apply_lut(tmp_path):
+    clf = dcp.Classifier(path_list=['data/weed_fore.png', 'data/weed_back.png'], kind_list=[0, -1], core='dtc')
+    rng = np.random.default_rng(0)
+    xyz = rng.random((30000, 3))
+    rgb = rng.integers(0, 256, (30000, 3)).astype(np.uint8)
+    write_field_ply(tmp_path / 'field.ply', xyz, rgb)
+    plot = dcp.Plot(str(tmp_path / 'field.ply'), clf, down_sample=False)
+
+    clf.save(str(tmp_path / 'model.pkl'))
+    clf_lut = dcp.Classifier.load(str(tmp_path / 'model.pkl'))
+    clf_lut.set_engine('lut')
+    clf_lut.save(str(tmp_path / 'model_lut.pkl'))
+    clf_lut = dcp.Classifier.load(str(tmp_path / 'model_lut.pkl'))
+    assert clf_lut.engine == 'lut'
+    for mmap in [False, True]:
+        plot_lut = dcp.Plot(str(tmp_path / 'field.ply'), clf_lut, down_sample=False, mmap=mmap)
+        for k in clf.kind_set:
+            np.testing.assert_array_equal(plot_lut.pcd_classified[k].points, plot.pcd_classified[k].points)
@@ -0,0 +1,53 @@
+import __init__
+import os
+import multiprocessing
+import pytest
+import pandas as pd
+import easydcp as dcp
+from easydcp import cli
+from easydcp.cli import main
+
+from test_base_plot_synthetic import make_synthetic_field, write_field_ply
+
+
+def test_cli_analyze(tmp_path):
+    for seed in range(2):
+        xyz, rgb = make_synthetic_field(seed=seed)
+        write_field_ply(tmp_path / f'field{seed}.ply', xyz, rgb)
+    (tmp_path / 'broken.ply').write_bytes(b'ply\nformat ascii 1.0\n')
+
+    clf = dcp.Classifier(path_list=['data/weed_fore.png', 'data/weed_back.png'], kind_list=[0, -1], core='dtc')
+    clf.save(str(tmp_path / 'model.pkl'))
+
+    out = tmp_path / 'out'
+    plots = [str(tmp_path / 'field0.ply'), str(tmp_path / 'broken.ply'), str(tmp_path / 'field1.ply')]
+    ret = main(['analyze', *plots, '--classifier', str(tmp_path / 'model.pkl'),
+                '--output', str(out), '--no-figure', '--no-denoise', '--workers', '2'])
+
+    # the broken plot is recorded, and the others are still saved
+    assert ret == 1
+    assert 'broken.ply' in (out / 'failed.txt').read_text()
+    traits = pd.read_csv(out / 'traits.csv')
+    assert sorted(traits['plot'].unique()) == ['field0', 'field1']
+    assert len(traits) == 12
+
+
+def fake_analyze_plot(plot_path, clf, options):
+    # the worker process dies on "crash" plots, like a segfault in open3d
+    if 'crash' in plot_path:
+        os._exit(1)
+    return pd.DataFrame({'plot': [os.path.basename(plot_path)], 'plant': [0]})
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='the patched function needs fork')
+def test_run_analyze_worker_crash(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, 'analyze_plot', fake_analyze_plot)
+    plots = [f'plot{i}.ply' for i in range(3)] + ['crash.ply'] + [f'plot{i}.ply' for i in range(3, 6)]
+    done, failed = cli.run_analyze(plots, None, {'output': str(tmp_path)}, workers=2)
+
+    # only the crashed plot is lost, the pending plots are submitted again
+    assert failed == ['crash.ply']
+    assert sorted(done) == sorted(p for p in plots if p != 'crash.ply')
+    assert 'crash.ply' in (tmp_path / 'failed.txt').read_text()
+    traits = pd.read_csv(tmp_path / 'traits.csv')
+    assert sorted(traits['plot']) == sorted(done)
@@ -63,4 +63,99 @@ def test_shp_read_shps_correct_coord_wrong4all(shp_config):
     with pytest.raises(ValueError) as excinfo:
         shp_merge = dcp.read_shps([shp_config['p1'], shp_config['p2']], [shp_config['cc'], ])
         print('\n', excinfo.value)
-    assert "The number of shp files" in str(excinfo.value)
\ No newline at end of file
+    assert "The number of shp files" in str(excinfo.value)
+
+def write_test_ply(file_path, num=1000, color_prefix='', with_normals=False):
+    from plyfile import PlyData, PlyElement
+    dtype = [('x', 'f4'), ('y', 'f4'), ('z', 'f4')]
+    if with_normals:
+        dtype += [('nx', 'f4'), ('ny', 'f4'), ('nz', 'f4')]
+    dtype += [(f'{color_prefix}red', 'u1'), (f'{color_prefix}green', 'u1'), (f'{color_prefix}blue', 'u1')]
+    vertex = np.zeros(num, dtype=dtype)
+    rng = np.random.default_rng(0)
+    for f in ['x', 'y', 'z']:
+        vertex[f] = rng.uniform(0, 100, num)
+    if with_normals:
+        vertex['nz'] = 1
+    for f in ['red', 'green', 'blue']:
+        vertex[f'{color_prefix}{f}'] = rng.integers(0, 256, num)
+    PlyData([PlyElement.describe(vertex, 'vertex')]).write(str(file_path))
+    return vertex
+
+def test_pcd_read_ply_diffuse_colors(tmp_path):
+    vertex = write_test_ply(tmp_path / 'diffuse.ply', color_prefix='diffuse_')
+    ply = dcp.read_ply(str(tmp_path / 'diffuse.ply'), unit='cm')
+    assert ply.has_colors()
+    assert not ply.has_normals()
+    np.testing.assert_allclose(np.asarray(ply.colors)[:, 0], vertex['diffuse_red'] / 255)
+    np.testing.assert_allclose(np.asarray(ply.points)[:, 2], vertex['z'].astype(float) / 100)
+
+def test_pcd_read_ply_normals(tmp_path):
+    write_test_ply(tmp_path / 'normals.ply', with_normals=True)
+    write_test_ply(tmp_path / 'no_normals.ply')
+
+    assert not dcp.read_ply(str(tmp_path / 'normals.ply'), normals=False).has_normals()
+    assert dcp.read_ply(str(tmp_path / 'normals.ply'), normals='lazy').has_normals()
+    assert not dcp.read_ply(str(tmp_path / 'no_normals.ply'), normals='lazy').has_normals()
+    assert dcp.read_ply(str(tmp_path / 'no_normals.ply'), normals=True).has_normals()
+
+    with pytest.raises(KeyError) as excinfo:
+        dcp.read_ply(str(tmp_path / 'normals.ply'), normals='yes')
+    assert "are acceptable for normals parameters" in str(excinfo.value)
+
+def test_pcd_read_ply_mmap(tmp_path):
+    vertex = write_test_ply(tmp_path / 'mmap.ply', with_normals=True)
+    view = dcp.read_ply_mmap(str(tmp_path / 'mmap.ply'))
+    assert len(view) == len(vertex)
+    assert np.shares_memory(view.points, view.data)
+    np.testing.assert_array_equal(view.rgb[:, 1], vertex['green'])
+
+    ply = dcp.read_ply(str(tmp_path / 'mmap.ply'))
+    mask = np.asarray(ply.points)[:, 0] > 50
+    subset = view.select_by_index(mask)
+    np.testing.assert_allclose(np.asarray(subset.points), np.asarray(ply.points)[mask])
+    np.testing.assert_allclose(np.asarray(subset.colors), np.asarray(ply.colors)[mask])
+
+    view_cm = dcp.read_ply_mmap(str(tmp_path / 'mmap.ply'), unit='cm')
+    np.testing.assert_allclose(view_cm.points, np.asarray(ply.points) / 100)
+
+def test_pcd_read_ply_mmap_ascii(tmp_path):
+    from plyfile import PlyData, PlyElement
+    vertex = np.zeros(10, dtype=[('x', 'f4'), ('y', 'f4'), ('z', 'f4')])
+    PlyData([PlyElement.describe(vertex, 'vertex')], text=True).write(str(tmp_path / 'ascii.ply'))
+    with pytest.raises(TypeError) as excinfo:
+        dcp.read_ply_mmap(str(tmp_path / 'ascii.ply'))
+    assert "Only binary ply can be memory-mapped" in str(excinfo.value)
+
+def test_pcd_read_plys_workers(tmp_path):
+    file_list = []
+    for i in range(4):
+        write_test_ply(tmp_path / f'tile{i}.ply', num=100 * (i + 1), with_normals=True)
+        file_list.append(str(tmp_path / f'tile{i}.ply'))
+    ply_serial = dcp.read_plys(file_list, workers=1)
+    ply_thread = dcp.read_plys(file_list, workers=4)
+    assert len(ply_serial.points) == 1000
+    assert ply_thread.has_normals()
+    np.testing.assert_array_equal(np.asarray(ply_serial.points), np.asarray(ply_thread.points))
+    np.testing.assert_array_equal(np.asarray(ply_serial.colors), np.asarray(ply_thread.colors))
+
+def test_shp_read_shp_packed(shp_config):
+    shp = dcp.read_shp(shp_config['p1'], shp_config['cc'])
+    shp_packed = dcp.read_shp(shp_config['p1'], shp_config['cc'], packed=True)
+    assert len(shp_packed) == len(shp)
+    assert shp_packed.keys() == list(shp.keys())
+    for i, name in enumerate(shp_packed.names):
+        np.testing.assert_array_equal(shp_packed[i], shp[name])
+
+def test_shp_read_shps_packed_query(shp_config):
+    shp_packed = dcp.read_shps([shp_config['p1'], shp_config['p2']], shp_config['cc'], packed=True)
+    bboxes = shp_packed.bboxes
+    x_min, y_min = bboxes[:, 0:2].min(axis=0)
+    x_max, y_max = bboxes[:, 2:4].max(axis=0)
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        x0, x1 = np.sort(rng.uniform(x_min, x_max, 2))
+        y0, y1 = np.sort(rng.uniform(y_min, y_max, 2))
+        brute = np.where((bboxes[:, 0] <= x1) & (bboxes[:, 2] >= x0) &
+                         (bboxes[:, 1] <= y1) & (bboxes[:, 3] >= y0))[0]
+        np.testing.assert_array_equal(shp_packed.query((x0, y0, x1, y1)), brute)
@@ -0,0 +1,36 @@
+import __init__
+import numpy as np
+from sklearn.cluster import KMeans
+from easydcp.stats.kmeans import best_split_1d, two_means
+
+
+def brute_force_split_1d(values):
+    values = np.sort(values)
+    sse = [values[:i].var() * i + values[i:].var() * (len(values) - i) for i in range(1, len(values))]
+    return np.min(sse)
+
+def test_best_split_1d_exact():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        values = rng.exponential(size=int(rng.integers(2, 60)))
+        threshold, sse = best_split_1d(values)
+        assert np.isclose(sse, brute_force_split_1d(values))
+        assert values.min() <= threshold < values.max()
+    assert best_split_1d(np.ones(5))[1] == 0
+
+def test_two_means_same_as_sklearn():
+    rng = np.random.default_rng(0)
+    # many small noise segments and few large plant segments
+    data = np.vstack([np.c_[rng.uniform(1, 5, 900), rng.uniform(0, 1e-5, 900)],
+                      np.c_[rng.uniform(30, 60, 100), rng.uniform(1e-3, 5e-3, 100)]])
+    labels = two_means(data)
+    np.testing.assert_array_equal(labels, np.r_[np.zeros(900), np.ones(100)])
+    np.testing.assert_array_equal(two_means(data[::-1]), labels[::-1])
+    km = KMeans(n_clusters=2, n_init=10, random_state=0).fit(data)
+    assert np.array_equal(km.labels_, labels) or np.array_equal(km.labels_, 1 - labels)
+
+def test_two_means_small_inputs():
+    assert len(two_means(np.empty((0, 2)))) == 0
+    np.testing.assert_array_equal(two_means(np.array([[3., 1.]])), [0])
+    np.testing.assert_array_equal(two_means(np.array([[3., 1.], [3., 1.]])), [0, 0])
+    np.testing.assert_array_equal(two_means(np.array([5., 1., 6.])), [1, 0, 1])
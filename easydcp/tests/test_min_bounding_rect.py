@@ -0,0 +1,66 @@
+import __init__
+import numpy as np
+from scipy.spatial import ConvexHull
+from easydcp.geometry.min_bounding_rect import min_bounding_rect, min_bounding_rects
+
+
+def loop_min_bounding_rect(hull):
+    # the edge by edge version, for reference
+    best = None
+    for i in range(len(hull) - 1):
+        angle = abs(np.arctan2(hull[i + 1, 1] - hull[i, 1], hull[i + 1, 0] - hull[i, 0]) % (np.pi / 2))
+        R = np.array([[np.cos(angle), np.sin(angle)], [-np.sin(angle), np.cos(angle)]])
+        rot = R @ hull.T
+        area = np.ptp(rot[0]) * np.ptp(rot[1])
+        if best is None or area < best[1] - 1e-12:
+            best = (angle, area, np.ptp(rot[0]), np.ptp(rot[1]))
+    return best
+
+def random_hulls(num, seed=0):
+    rng = np.random.default_rng(seed)
+    hulls = []
+    for _ in range(num):
+        xy = rng.normal(size=(int(rng.integers(5, 500)), 2)) * rng.uniform(0.1, 1, 2) + rng.uniform(-5, 5, 2)
+        hulls.append(xy[ConvexHull(xy).vertices])
+    return hulls
+
+def test_min_bounding_rect_square():
+    angle, area, width, height, center, corners = min_bounding_rect(np.array([[0, 0], [2, 0], [2, 1], [0, 1.]]))
+    assert angle == 0
+    assert np.isclose(area, 2)
+    np.testing.assert_allclose(center, [1, 0.5])
+    np.testing.assert_allclose(corners, [[2, 0], [0, 0], [0, 1], [2, 1]], atol=1e-12)
+
+def test_min_bounding_rect_same_as_loop():
+    for hull in random_hulls(50):
+        rect = min_bounding_rect(hull)
+        angle, area, width, height = loop_min_bounding_rect(hull)
+        assert np.isclose(rect[1], area)
+        assert np.isclose(rect[2] * rect[3], width * height)
+        # the corners contain all the hull points
+        R = np.array([[np.cos(rect[0]), np.sin(rect[0])], [-np.sin(rect[0]), np.cos(rect[0])]])
+        rot_hull, rot_corner = hull @ R.T, rect[5] @ R.T
+        assert np.all(rot_hull >= rot_corner.min(axis=0) - 1e-9)
+        assert np.all(rot_hull <= rot_corner.max(axis=0) + 1e-9)
+
+def test_min_bounding_rects_batch():
+    hulls = random_hulls(300, seed=1) + [np.array([[1., 2.]])]
+    rects = min_bounding_rects(hulls, chunk_size=64)
+    assert len(rects) == len(hulls)
+    for hull, rect in zip(hulls, rects):
+        single = min_bounding_rect(hull)
+        assert rect[0] == single[0] and rect[1] == single[1]
+        np.testing.assert_array_equal(rect[5], single[5])
+    assert min_bounding_rects([]) == []
+
+def test_min_bounding_rect_triangle_tie():
+    # the right triangle has 2 rectangles of area 12 (4 x 3, and 5 x 2.4 along the hypotenuse),
+    # the first (smallest) angle wins whatever the rounding of the translated points
+    triangle = np.array([[0, 0], [4, 0], [0, 3.]])
+    for rot, size in [(0.3, (4, 3)), (1.1, (5, 2.4))]:
+        R = np.array([[np.cos(rot), -np.sin(rot)], [np.sin(rot), np.cos(rot)]])
+        first_angle = min(rot % (np.pi / 2), (rot + np.arctan2(4, 3)) % (np.pi / 2))
+        for offset in [(0, 0), (1000.1, 2000.3), (0.37, -5.11), (12.5, 3.3)]:
+            rect = min_bounding_rect(triangle @ R.T + offset)
+            assert np.isclose(rect[0], first_angle)
+            np.testing.assert_allclose(rect[2:4], size)
@@ -0,0 +1,163 @@
+import __init__
+import pytest
+import numpy as np
+from plyfile import PlyData, PlyElement
+from scipy.ndimage import convolve
+from skimage.morphology import disk
+import easydcp as dcp
+from easydcp.geometry.raster import HeightRaster, fill_holes
+
+
+def raster_loop(xyz, rgb, raster):
+    # highest point of each cell by python loop, the last one wins the ties
+    dsm = np.full(raster.shape, np.nan, dtype=np.float32)
+    color = np.zeros(raster.shape + (3,), dtype=np.uint8)
+    for (i, j), z, c in zip(raster.cell_index(xyz), xyz[:, 2].astype(np.float32), rgb):
+        if not dsm[i, j] > z:
+            dsm[i, j] = z
+            color[i, j] = c
+    return dsm, color
+
+
+def random_points(num, seed=0):
+    rng = np.random.default_rng(seed)
+    xyz = rng.random((num, 3)) * [2.0, 1.5, 0.5] + [10, -3, 0]
+    # repeated heights for ties
+    xyz[:, 2] = np.round(xyz[:, 2], 2)
+    rgb = rng.integers(0, 256, (num, 3)).astype(np.uint8)
+    return xyz, rgb
+
+
+@pytest.mark.parametrize('chunk_size', [20000, 777, 1])
+def test_height_raster_chunks(chunk_size):
+    xyz, rgb = random_points(5000)
+    raster = HeightRaster(xyz[:, 0:2].min(axis=0), xyz[:, 0:2].max(axis=0), 0.05)
+    for start in range(0, len(xyz), chunk_size):
+        raster.add(xyz[start:start + chunk_size], rgb[start:start + chunk_size])
+
+    dsm, color = raster_loop(xyz, rgb, raster)
+    assert raster.dsm.dtype == np.float32 and raster.shape == (41, 31)
+    np.testing.assert_array_equal(raster.dsm, dsm)
+    np.testing.assert_array_equal(raster.dom[:, :, 0:3], color)
+    np.testing.assert_array_equal(raster.occupied, ~np.isnan(dsm))
+    assert (raster.dom[:, :, 3][raster.occupied] == 255).all()
+
+
+def test_height_raster_float_colors():
+    xyz = np.array([[0, 0, 1.0], [0.01, 0.01, 2.0], [0.5, 0.5, 0.0]])
+    rgb = np.array([[1.0, 0, 0], [0, 1.0, 0], [0.2, 0.4, 0.6]])
+    raster = HeightRaster([0, 0], [0.5, 0.5], 0.1)
+    raster.add(xyz, rgb)
+    assert raster.dsm[0, 0] == 2.0
+    np.testing.assert_array_equal(raster.dom[0, 0], [0, 255, 0, 255])
+    np.testing.assert_array_equal(raster.dom[5, 5], [51, 102, 153, 255])
+    assert np.isnan(raster.dsm[1, 1]) and raster.dom[1, 1, 3] == 0
+
+    with pytest.raises(ValueError):
+        HeightRaster([0, 0], [1, 1], 0)
+
+
+def test_pcd2dxm_mmap_chunks(tmp_path):
+    xyz, rgb = random_points(20000, seed=1)
+    vertex = np.empty(len(xyz), dtype=[('x', 'f8'), ('y', 'f8'), ('z', 'f8'),
+                                       ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+    for i, f in enumerate(['x', 'y', 'z']):
+        vertex[f] = xyz[:, i]
+    for i, f in enumerate(['red', 'green', 'blue']):
+        vertex[f] = rgb[:, i]
+    ply_path = str(tmp_path / 'field.ply')
+    PlyData([PlyElement.describe(vertex, 'vertex')]).write(ply_path)
+
+    pcd = dcp.pcd_tools.build_pcd(xyz, rgb / 255)
+    dom, dsm = dcp.pcd2dxm(pcd, dens=2, interp=False)
+    dom_mmap, dsm_mmap = dcp.pcd2dxm(dcp.read_ply_mmap(ply_path), dens=2, interp=False, chunk_size=3000)
+    np.testing.assert_array_equal(dsm_mmap, dsm)
+    np.testing.assert_array_equal(dom_mmap, dom)
+
+    # each pixel is the highest point in it
+    raster = HeightRaster(xyz[:, 0:2].min(axis=0), xyz[:, 0:2].max(axis=0),
+                          np.sqrt(np.prod(np.ptp(xyz[:, 0:2], axis=0)) / 10000))
+    dsm_loop, color_loop = raster_loop(xyz, rgb, raster)
+    np.testing.assert_array_equal(dsm, dsm_loop)
+    np.testing.assert_array_equal(dom[:, :, 0:3], color_loop)
+
+
+def fill_holes_convolve(image, valid, mask, radius):
+    # normalized convolution of the whole image by scipy
+    kernel = disk(radius).astype(float)
+    data = image if image.ndim == 3 else image[:, :, None]
+    count = convolve(valid.astype(float), kernel, mode='constant')
+    total = np.stack([convolve(np.where(valid, data[:, :, c], 0).astype(float), kernel, mode='constant')
+                      for c in range(data.shape[2])], axis=2)
+    filled = mask & (count > 0)
+    return total[filled] / count[filled, None], filled
+
+
+@pytest.mark.parametrize('strip_rows', [None, 1024, 7])
+def test_fill_holes(strip_rows):
+    rng = np.random.default_rng(2)
+    valid = rng.random((60, 45)) < 0.3
+    valid[40:, :] = False    # far from valid pixels, not filled
+    mask = ~valid & (rng.random((60, 45)) < 0.7)
+
+    # float image with nan holes
+    dsm = np.where(valid, rng.random((60, 45)), np.nan).astype(np.float32)
+    dsm_filled, filled = fill_holes(dsm, valid, mask, radius=3, strip_rows=strip_rows)
+    expected, expected_filled = fill_holes_convolve(dsm, valid, mask, 3)
+    np.testing.assert_array_equal(filled, expected_filled)
+    np.testing.assert_allclose(dsm_filled[filled], expected[:, 0], rtol=1e-6)
+    np.testing.assert_array_equal(dsm_filled[~filled], dsm[~filled])
+    assert dsm_filled.dtype == np.float32 and np.isnan(dsm_filled[45:, :]).all()
+
+    # uint8 image with 3 channels in one pass
+    dom = rng.integers(0, 256, (60, 45, 3)).astype(np.uint8)
+    dom_filled, filled = fill_holes(dom, valid, mask, radius=3, strip_rows=strip_rows)
+    np.testing.assert_array_equal(filled, expected_filled)
+    np.testing.assert_array_equal(dom_filled[filled], np.rint(fill_holes_convolve(dom, valid, mask, 3)[0]))
+    np.testing.assert_array_equal(dom_filled[~filled], dom[~filled])
+
+    # one row per strip by the memory limit
+    dom_small, filled_small = fill_holes(dom, valid, mask, radius=3, max_bytes=1)
+    np.testing.assert_array_equal(filled_small, filled)
+    np.testing.assert_array_equal(dom_small, dom_filled)
+
+
+def test_pcd2dxm_interp():
+    rng = np.random.default_rng(3)
+    xy = rng.random((6000, 2)) * 2
+    # a round field with an empty gap inside
+    xy = xy[(np.linalg.norm(xy - 1, axis=1) < 1) & ~((xy[:, 0] > 0.9) & (xy[:, 0] < 0.95))]
+    xyz = np.c_[xy, 0.1 * xy[:, 0]]
+    pcd = dcp.pcd_tools.build_pcd(xyz, rng.random((len(xyz), 3)))
+
+    dom, dsm = dcp.pcd2dxm(pcd, interp=False)
+    dom_interp, dsm_interp = dcp.pcd2dxm(pcd, interp=True)
+    occupied = dom[:, :, 3] == 255
+    filled = (dom_interp[:, :, 3] == 255) & ~occupied
+    np.testing.assert_array_equal(dom_interp[occupied], dom[occupied])
+    np.testing.assert_array_equal(dsm_interp[occupied], dsm[occupied])
+    np.testing.assert_array_equal(~np.isnan(dsm_interp), occupied | filled)
+
+    # the gap is filled, the corners out of the convex hull are not
+    assert filled.sum() > 0
+    assert dom_interp[0, 0, 3] == 0 and np.isnan(dsm_interp[0, 0])
+    res = np.sqrt((xyz[:, 0:2].max(axis=0) - xyz[:, 0:2].min(axis=0)).prod() / len(xyz))
+    gap = np.floor(np.array([0.925, 1.0]) / res).astype(int) - np.floor(xyz[:, 0:2].min(axis=0) / res).astype(int)
+    assert filled[gap[0], gap[1]]
+    assert 0.09 < dsm_interp[gap[0], gap[1]] < 0.1
+
+
+def test_pcd2dxm_degenerate_chunk():
+    rng = np.random.default_rng(4)
+    xyz = rng.random((1000, 3))
+    # the last chunk is 3 collinear points (chunk_size=1000) or 2 points (chunk_size=1001)
+    xyz = np.vstack([xyz, [[0.2, 0.2, 0.1], [0.5, 0.5, 0.2], [0.9, 0.9, 0.3]]])
+    pcd = dcp.pcd_tools.build_pcd(xyz, rng.random((len(xyz), 3)))
+    dom, dsm = dcp.pcd2dxm(pcd)
+    for chunk_size in [1000, 1001]:
+        dom_chunk, dsm_chunk = dcp.pcd2dxm(pcd, chunk_size=chunk_size)
+        np.testing.assert_array_equal(dom_chunk, dom)
+        np.testing.assert_array_equal(dsm_chunk, dsm)
+
+    np.testing.assert_array_equal(dcp.pcd_tools.chunk_hull_vertices(np.array([[0, 0], [1, 0], [1, 0], [2, 0.]])),
+                                  [[0, 0], [2, 0]])
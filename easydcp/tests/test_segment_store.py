@@ -0,0 +1,92 @@
+import __init__
+import pytest
+import numpy as np
+from easydcp.segment_store import SegmentStore, as_segment_store
+from easydcp.pcd_tools import build_pcd, calculate_xyz_volume
+
+
+def make_pcd_list(seg_num=20, seed=0):
+    rng = np.random.default_rng(seed)
+    pcd_list = []
+    for i in range(seg_num):
+        point_num = int(rng.integers(1, 40))
+        pcd_list.append(build_pcd(rng.random((point_num, 3)) + i, rng.random((point_num, 3))))
+    return pcd_list
+
+def test_segment_store_as_list():
+    pcd_list = make_pcd_list()
+    store = SegmentStore.from_pcd_list(pcd_list)
+    assert len(store) == len(pcd_list)
+    for pcd_store, pcd in zip(store, pcd_list):
+        np.testing.assert_array_equal(np.asarray(pcd_store.points), np.asarray(pcd.points))
+        np.testing.assert_array_equal(np.asarray(pcd_store.colors), np.asarray(pcd.colors))
+    # the point clouds are built once
+    assert store[3] is store[3]
+    assert store[-1] is store[len(store) - 1]
+    with pytest.raises(IndexError):
+        store[len(store)]
+    assert as_segment_store(store) is store
+    assert len(as_segment_store(pcd_list)) == len(pcd_list)
+    with pytest.raises(TypeError):
+        as_segment_store(np.zeros((3, 3)))
+
+def test_segment_store_reorder_no_copy():
+    pcd_list = make_pcd_list()
+    store = SegmentStore.from_pcd_list(pcd_list, names=[f'seg{i}' for i in range(len(pcd_list))])
+    order = np.array([5, 2, 19, 0])
+    sub = store[order]
+    assert sub.xyz is store.xyz
+    assert sub[1] is store[2]
+    assert list(sub.names) == ['seg5', 'seg2', 'seg19', 'seg0']
+    np.testing.assert_array_equal(sub.sizes, [len(pcd_list[i].points) for i in order])
+    assert len(store[store.sizes > 20]) == (store.sizes > 20).sum()
+    assert len(store[2:4]) == 2
+
+def test_segment_store_reduce():
+    pcd_list = make_pcd_list(seed=1)
+    order = np.random.default_rng(0).permutation(len(pcd_list))[:12]
+    store = SegmentStore.from_pcd_list(pcd_list)[order]
+    np.testing.assert_allclose(store.centers(), [pcd_list[i].get_center() for i in order])
+    np.testing.assert_allclose(store.bbox_volumes(), [calculate_xyz_volume(pcd_list[i]) for i in order])
+
+    empty = SegmentStore(np.zeros((4, 3)), sizes=[0, 4, 0])
+    np.testing.assert_array_equal(empty.bbox_volumes(), [0, 0, 0])
+    assert len(SegmentStore.from_pcd_list([])) == 0
+
+def test_segment_store_reduce_repeated():
+    xyz = np.arange(12.).reshape(4, 3)
+    # the same segment twice, ending at the last row
+    store = SegmentStore(xyz, sizes=[2, 2])[[1, 1, 0]]
+    np.testing.assert_array_equal(store.summary()['min'], xyz[[2, 2, 0]])
+    np.testing.assert_array_equal(store.summary()['max'], xyz[[3, 3, 1]])
+    # overlapping ranges
+    store = SegmentStore(xyz, starts=[0, 1, 3, 0], ends=[3, 4, 4, 0])
+    np.testing.assert_array_equal(store.reduce(np.add), [xyz[0:3].sum(axis=0), xyz[1:4].sum(axis=0), xyz[3], [0, 0, 0]])
+
+def test_segment_store_summary():
+    pcd_list = make_pcd_list(seed=2)
+    store = SegmentStore.from_pcd_list(pcd_list)
+    summary = store.summary(z_percentile=True)
+    assert store.summary() is summary
+    for i, pcd in enumerate(pcd_list):
+        xyz = np.asarray(pcd.points)
+        assert summary['count'][i] == len(xyz)
+        np.testing.assert_allclose(summary['center'][i], xyz.mean(axis=0))
+        np.testing.assert_array_equal(summary['min'][i], xyz.min(axis=0))
+        np.testing.assert_array_equal(summary['max'][i], xyz.max(axis=0))
+        np.testing.assert_allclose(summary['z_percentile'][i], np.percentile(xyz[:, 2], store.summary_percentiles))
+
+    # the summary follows the reordered segments
+    order = np.array([3, 1, 7])
+    np.testing.assert_array_equal(store[order].summary()['max'], summary['max'][order])
+
+def test_segment_store_field_order():
+    # 2 rows (y ~ 0 and y ~ 1) with a little jitter, 3 plants in each
+    centers = np.array([[2, 0.05, 0], [0, 1.02, 0], [1, -0.03, 0], [2, 0.98, 0], [0, 0.01, 0], [1, 1.0, 0]])
+    store = SegmentStore(centers, sizes=np.ones(6, dtype=int))
+    np.testing.assert_array_equal(store.field_order('x'), np.argsort(centers[:, 0], kind='stable'))
+    np.testing.assert_array_equal(store.field_order('x', row_tol=0.2), [4, 2, 0, 1, 5, 3])
+    np.testing.assert_array_equal(store.field_order('x', ascending=False, row_tol=0.2), [3, 5, 1, 0, 2, 4])
+    np.testing.assert_array_equal(store.field_order('y', row_tol=0.2), [4, 1, 2, 5, 0, 3])
+    with pytest.raises(KeyError):
+        store.field_order('z')
@@ -0,0 +1,40 @@
+import __init__
+import pytest
+import numpy as np
+import open3d as o3d
+from easydcp.geometry.tile_denoise import tile_index, radius_outlier, statistical_outlier
+
+
+def make_noisy_plane(num=30000, seed=0):
+    rng = np.random.default_rng(seed)
+    xyz = np.c_[rng.uniform(0, 2, num), rng.uniform(0, 1, num), rng.normal(0, 0.005, num)]
+    xyz[:num // 50, 2] += rng.uniform(0, 0.5, num // 50)   # floating noise
+    return xyz
+
+@pytest.mark.parametrize('tile_size, workers', [(None, 1), (0.2, 1), (0.2, 3)])
+def test_radius_outlier_same_as_open3d(tile_size, workers):
+    xyz = make_noisy_plane()
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(xyz))
+    _, indices = pcd.remove_radius_outlier(nb_points=8, radius=0.02)
+    grid = tile_index(xyz, 0.02, tile_size=tile_size)
+    kept = radius_outlier(xyz, 8, 0.02, grid=grid, workers=workers)
+    np.testing.assert_array_equal(np.flatnonzero(kept), np.sort(indices))
+
+@pytest.mark.parametrize('tile_size, workers', [(None, 1), (0.1, 2)])
+def test_statistical_outlier_same_as_open3d(tile_size, workers):
+    xyz = make_noisy_plane(seed=1)
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(xyz))
+    _, indices = pcd.remove_statistical_outlier(nb_neighbors=10, std_ratio=0.5)
+    # the k-th neighbors of floating noise are out of the 0.01 halo, they are searched again
+    grid = tile_index(xyz, 0.01, tile_size=tile_size)
+    kept = statistical_outlier(xyz, 10, 0.5, halo=0.01, grid=grid, workers=workers)
+    np.testing.assert_array_equal(np.flatnonzero(kept), np.sort(indices))
+
+def test_shared_tile_index():
+    xyz = make_noisy_plane(seed=2)
+    part = np.arange(len(xyz)) % 3 == 0
+    grid = tile_index(xyz, 0.02, tile_size=0.3)
+    kept = radius_outlier(xyz, 3, 0.02, grid=grid, keep=part)
+    np.testing.assert_array_equal(kept[part], radius_outlier(xyz[part], 3, 0.02))
+    assert not kept[~part].any()
+    assert not statistical_outlier(xyz, 5, 1, halo=0.02, keep=np.zeros(len(xyz), dtype=bool)).any()
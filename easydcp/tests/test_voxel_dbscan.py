@@ -0,0 +1,47 @@
+import __init__
+import pytest
+import numpy as np
+import open3d as o3d
+from easydcp.geometry.voxel_dbscan import voxel_dbscan, VoxelGrid3D
+
+
+def make_blobs(blob_num=12, blob_points=2000, noise_num=500, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.c_[rng.uniform(0, 3, (blob_num, 2)), np.zeros(blob_num)]
+    centers[:, 0] = np.arange(blob_num) * 0.25   # keep the blobs apart
+    xyz = np.vstack([rng.normal(c, 0.02, (blob_points, 3)) for c in centers])
+    noise = rng.uniform([0, 0, 0.5], [3, 3, 1], (noise_num, 3))
+    return np.vstack([xyz, noise]), np.repeat(np.arange(blob_num), blob_points)
+
+def test_voxel_grid_keys():
+    xyz = np.array([[0, 0, 0], [0.05, 0.05, 0.05], [0.25, 0, 0.35]])
+    grid = VoxelGrid3D(xyz, 0.1)
+    assert len(grid) == 2
+    np.testing.assert_array_equal(grid.counts, [2, 1])
+    np.testing.assert_array_equal(grid.ijk, [[0, 0, 0], [2, 0, 3]])
+    np.testing.assert_array_equal(grid.neighbor(np.array([0, 1]), (1, 0, 0)), [-1, -1])
+
+def test_voxel_dbscan_blobs():
+    xyz, blob_label = make_blobs()
+    labels = voxel_dbscan(xyz, eps=0.02, min_points=5)
+    blob = labels[:len(blob_label)]
+    assert labels.max() + 1 == 12
+    assert np.all(labels[len(blob_label):] == -1)
+    # each blob is mostly one cluster, numbered by the first point
+    major = [np.bincount(blob[blob_label == i][blob[blob_label == i] >= 0]).argmax() for i in range(12)]
+    assert major == list(range(12))
+    assert (blob == blob_label).mean() > 0.99
+
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(xyz))
+    assert np.asarray(pcd.cluster_dbscan(eps=0.02, min_points=5)).max() + 1 == 12
+
+@pytest.mark.parametrize('tile_voxels, workers', [(1, 1), (7, 1), (None, 3), (20, 4)])
+def test_voxel_dbscan_tiles(tile_voxels, workers):
+    xyz, _ = make_blobs(seed=1)
+    labels = voxel_dbscan(xyz, eps=0.02, min_points=5, tile_voxels=10 ** 6)
+    np.testing.assert_array_equal(voxel_dbscan(xyz, eps=0.02, min_points=5, tile_voxels=tile_voxels,
+                                               workers=workers), labels)
+
+def test_voxel_dbscan_empty():
+    assert len(voxel_dbscan(np.empty((0, 3)), eps=0.1, min_points=5)) == 0
+    assert np.all(voxel_dbscan(np.random.default_rng(0).random((50, 3)) * 10, eps=0.1, min_points=5) == -1)